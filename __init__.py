@@ -299,6 +299,9 @@ def register():
     # Load the dictionaries and check if they are found.
     globs.dict_found = tools.translate.load_translations()
 
+    # Keep the mesh index up to date
+    tools.common.register_object_index_handler()
+
     # Set preferred Blender options
     if tools.common.version_2_79_or_older():
         tools.common.get_user_preferences().system.use_international_fonts = True
@@ -350,6 +353,9 @@ def unregister():
             pass
     print('Unregistered', count, 'CATS classes.')
 
+    # Remove the mesh index handler
+    tools.common.unregister_object_index_handler()
+
     # Unregister all dynamic buttons and icons
     tools.supporter.unregister_dynamic_buttons()
     tools.supporter.unload_icons()
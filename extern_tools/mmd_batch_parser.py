@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+""" Parse MMD files (.pmx, .pmd, .vmd) in worker processes
+
+The parsers in mmd_tools_local.core.pmx, core.pmd and core.vmd don't need bpy,
+but the __init__.py of the mmd_tools_local package does. This module lives
+outside of the package, so worker processes (which are plain Python processes,
+not Blender) can import it, and it loads the parsers without running the
+__init__.py files of the package.
+
+The parsed models keep the module names of mmd_tools_local, so the results
+sent back to Blender are the same objects as loaded by the importers there.
+"""
+
+import os
+import sys
+import time
+import pickle
+import types
+import logging
+import traceback
+import multiprocessing
+
+PACKAGE = 'mmd_tools_local'
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), PACKAGE)
+
+TIMEOUT = 60
+
+
+def _parsers():
+    if PACKAGE not in sys.modules:
+        # empty package modules, the parsers are found through their __path__
+        for name, path in ((PACKAGE, PACKAGE_DIR), (PACKAGE+'.core', os.path.join(PACKAGE_DIR, 'core'))):
+            module = types.ModuleType(name)
+            module.__path__ = [path]
+            sys.modules[name] = module
+    from mmd_tools_local.core import pmx, pmd, vmd
+    return pmx, pmd, vmd
+
+def parse_file(filepath):
+    """ Returns (filepath, parsed data, seconds, error message)
+
+    The data is a columnar pmx.Model, a columnar pmd.Model or a vmd.File. On
+    failure, the data is None and the error message is the traceback.
+    """
+    start_time = time.time()
+    try:
+        pmx, pmd, vmd = _parsers()
+        file_type = os.path.splitext(filepath)[1].lower()
+        if file_type == '.pmx':
+            data = pmx.load(filepath, columnar=True)
+        elif file_type == '.pmd':
+            data = pmd.load(filepath, columnar=True)
+        elif file_type == '.vmd':
+            data = vmd.File()
+            data.load(filepath=filepath)
+        else:
+            raise ValueError('Unsupported file type: %s'%filepath)
+    except Exception:
+        return filepath, None, time.time() - start_time, traceback.format_exc()
+    return filepath, data, time.time() - start_time, None
+
+def _parse_file_pickled(filepath):
+    # pickled here, so a result which fails to load is an error of its file
+    # instead of stopping the result handler of the pool
+    filepath, data, seconds, error = parse_file(filepath)
+    if error is None:
+        try:
+            data = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            data, error = None, traceback.format_exc()
+    return filepath, data, seconds, error
+
+def _unpickle_result(result):
+    filepath, data, seconds, error = result
+    if error is None:
+        try:
+            data = pickle.loads(data)
+        except Exception:
+            data, error = None, traceback.format_exc()
+    return filepath, data, seconds, error
+
+def parse_files(filepaths, processes=None, executable=None, timeout=TIMEOUT):
+    """ Parse files in a pool of worker processes, yielding the results of parse_file() as they finish
+
+    @param processes the number of worker processes, None for one per CPU core.
+           With a single process or file, the files are parsed in this process.
+    @param executable the Python interpreter of the workers, if sys.executable isn't one (Blender < 2.91)
+    @param timeout seconds to wait for the next result of the pool
+
+    Files which the pool fails to parse (e.g. the workers can't be started, which
+    the pool only shows by not returning results) are parsed in this process.
+    """
+    filepaths = list(filepaths)
+    pending = list(filepaths)
+    processes = min(len(filepaths), processes or multiprocessing.cpu_count())
+    if processes > 1:
+        ctx = multiprocessing.get_context('spawn') # don't fork the threads of Blender
+        if executable:
+            ctx.set_executable(executable)
+        _parsers() # the results are unpickled with the parsers of this process
+        pool = None
+        try:
+            pool = ctx.Pool(processes)
+            results = pool.imap_unordered(_parse_file_pickled, filepaths)
+            for i in range(len(filepaths)):
+                result = results.next(timeout)
+                pending.remove(result[0])
+                yield _unpickle_result(result)
+        except Exception as e:
+            logging.warning('Failed to parse %d files in worker processes: %r', len(pending), e)
+        finally:
+            if pool:
+                pool.terminate()
+    for filepath in pending:
+        yield parse_file(filepath)
@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
 
 import bpy
+import numpy as np
 
 matmul = (lambda a, b: a*b) if bpy.app.version < (2, 80, 0) else (lambda a, b: a.__matmul__(b))
 
+def foreach_get(collection, attr, dtype, width=1):
+    """ Returns the attribute of all items of a bpy collection as a numpy array of shape (n,) or (n, width) """
+    data = np.empty(len(collection)*width, dtype=dtype)
+    collection.foreach_get(attr, data)
+    return data.reshape(-1, width) if width > 1 else data
+
+def enum_values(bl_type, prop):
+    """ Returns {identifier: value} of an enum property, e.g. for comparing with foreach_get() results """
+    return {i.identifier:i.value for i in bl_type.bl_rna.properties[prop].enum_items}
+
 class __EditMode:
     def __init__(self, obj):
         if not isinstance(obj, bpy.types.Object):
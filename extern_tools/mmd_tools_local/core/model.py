@@ -2,6 +2,7 @@
 
 import bpy
 import mathutils
+import numpy as np
 
 from mmd_tools_local import bpyutils
 from mmd_tools_local.core import rigid_body
@@ -533,7 +534,7 @@ class Model:
             if old_bone_name in mesh.vertex_groups:
                 mesh.vertex_groups[old_bone_name].name = new_bone_name
 
-    def build(self):
+    def build(self, use_collision_layers=False):
         rigidbody_world_enabled = rigid_body.setRigidBodyWorldEnabled(False)
         if self.__root.mmd_root.is_built:
             self.clean()
@@ -543,7 +544,7 @@ class Model:
         logging.info('****************************************')
         start_time = time.time()
         self.__preBuild()
-        self.buildRigids()
+        self.buildRigids(use_collision_layers=use_collision_layers)
         self.buildJoints()
         self.__postBuild()
         logging.info(' Finished building in %f seconds.', time.time() - start_time)
@@ -582,7 +583,10 @@ class Model:
                     bpy.data.objects.remove(i, do_unlink=True)
 
         rigid_track_counts = 0
+        default_layers = (True,) + (False,)*(rigid_body.COLLISION_LAYER_COUNT - 1)
         for i in self.rigidBodies():
+            if i.rigid_body: # collision layers may be assigned by build
+                rigid_body.setCollisionLayers(i.rigid_body, default_layers)
             rigid_type = int(i.mmd_rigid.type)
             if 'mmd_tools_rigid_parent' not in i.constraints:
                 rigid_track_counts += 1
@@ -818,6 +822,93 @@ class Model:
     def __getRigidRange(self, obj):
         return (mathutils.Vector(obj.bound_box[0]) - mathutils.Vector(obj.bound_box[6])).length
 
+    @staticmethod
+    def __findNonCollisionPairs(locations, ranges, groups, masks, distance_of_ignore_collisions):
+        """ Find the pairs of rigid bodies which ignore each other's collision group and are close enough.
+
+        A sweep along the x axis only tests the pairs which may be within the distance
+        distance_of_ignore_collisions * (range_a + range_b) / 2.
+        Returns the list of (index_a, index_b) in the order of collision groups of each rigid body,
+        and the count of tested pairs.
+        """
+        count = len(locations)
+        if count < 2 or distance_of_ignore_collisions <= 0:
+            return [], 0
+
+        scale = distance_of_ignore_collisions * 0.5
+        order = np.argsort(locations[:, 0], kind='mergesort')
+        x = locations[order, 0]
+        starts = np.arange(1, count + 1)
+        ends = np.searchsorted(x, x + scale * (ranges[order] + ranges.max()), side='left')
+        lengths = np.maximum(ends - starts, 0)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        i = order[np.repeat(np.arange(count), lengths)]
+        j = order[np.repeat(starts, lengths) + offsets]
+
+        lo, hi = np.minimum(i, j), np.maximum(i, j)
+        lo_ignores_hi = masks[lo, groups[hi]]
+        valid = lo_ignores_hi | masks[hi, groups[lo]]
+        valid &= np.linalg.norm(locations[lo] - locations[hi], axis=1) < scale * (ranges[lo] + ranges[hi])
+        a = np.where(lo_ignores_hi, lo, hi)[valid]
+        b = np.where(lo_ignores_hi, hi, lo)[valid]
+        sorted_idx = np.lexsort((b, groups[b], a))
+        return list(zip(a[sorted_idx].tolist(), b[sorted_idx].tolist())), len(i)
+
+    @staticmethod
+    def __assignCollisionLayers(groups, masks, layer_count):
+        """ Assign collision layers to rigid bodies, so that two rigid bodies share a layer if they collide.
+
+        Rigid bodies with the same collision group and mask are in the same class, and each layer is
+        a set of classes colliding with each other. If the layers run out, the classes left share the
+        last layer. Classes colliding with no class of the model still get a layer of their own (or the
+        last one), every rigid body needs a layer to collide with objects outside of the model.
+        The pairs sharing a layer but ignoring each other still need non collision constraints.
+        Returns a bool array of shape (rigid body count, layer_count).
+        """
+        keys = (groups << 16) | masks.dot(1 << np.arange(16))
+        classes, inverse = np.unique(keys, return_inverse=True)
+        class_groups = classes >> 16
+        class_masks = ((classes[:, None] >> np.arange(16)) & 1).astype(bool)
+        ignore = class_masks[:, class_groups]
+        collide = ~(ignore | ignore.T)
+        uncovered = collide.copy()
+        layers = np.zeros((len(classes), layer_count), dtype=bool)
+        for layer in range(layer_count):
+            if not uncovered.any():
+                break
+            if layer == layer_count - 1:
+                layers[uncovered.any(axis=1), layer] = True
+                break
+            c, d = np.argwhere(uncovered)[0]
+            members = sorted(set((c, d)))
+            candidates = collide[members[0]] & collide[members[-1]]
+            candidates[members] = False
+            while candidates.any():
+                e = np.argmax(np.where(candidates, uncovered[:, members].sum(axis=1), -1))
+                members.append(e)
+                candidates &= collide[e]
+                candidates[e] = False
+            layers[members, layer] = True
+            uncovered[np.ix_(members, members)] = False
+        no_layer = ~layers.any(axis=1)
+        if no_layer.any():
+            free_layers = np.flatnonzero(~layers.any(axis=0))
+            layers[no_layer, free_layers[0] if len(free_layers) else layer_count - 1] = True
+        return layers[inverse]
+
+    @staticmethod
+    def __addSceneCollidersToLayers(rigid_objects, layers):
+        """ Add the collision layers of a model to the rigid bodies of other objects on the first layer,
+        so they keep colliding with the rigid bodies of the model, e.g. floors.
+        """
+        model_objects = set(rigid_objects)
+        for obj in SceneOp(bpy.context).id_objects:
+            if obj in model_objects or obj.rigid_body is None:
+                continue
+            obj_layers = rigid_body.getCollisionLayers(obj.rigid_body)
+            if obj_layers[0]:
+                rigid_body.setCollisionLayers(obj.rigid_body, [a or b for a, b in zip(obj_layers, layers)])
+
     def __createNonCollisionConstraint(self, nonCollisionJointTable):
         total_len = len(nonCollisionJointTable)
         if total_len < 1:
@@ -849,14 +940,11 @@ class Model:
         logging.debug(' finish in %f seconds.', time.time() - start_time)
         logging.debug('-'*60)
 
-    def buildRigids(self, distance_of_ignore_collisions=1.5):
+    def buildRigids(self, distance_of_ignore_collisions=1.5, use_collision_layers=False):
         logging.debug('--------------------------------')
         logging.debug(' Build riggings of rigid bodies')
         logging.debug('--------------------------------')
         rigid_objects = list(self.rigidBodies())
-        rigid_object_groups = [[] for i in range(16)]
-        for i in rigid_objects:
-            rigid_object_groups[i.mmd_rigid.collision_group_number].append(i)
 
         jointMap = {}
         for joint in self.joints():
@@ -868,27 +956,39 @@ class Model:
 
         logging.info('Creating non collision constraints')
         # create non collision constraints
-        nonCollisionJointTable = []
-        non_collision_pairs = set()
         rigid_object_cnt = len(rigid_objects)
-        for obj_a in rigid_objects:
-            for n, ignore in enumerate(obj_a.mmd_rigid.collision_group_mask):
-                if not ignore:
-                    continue
-                for obj_b in rigid_object_groups[n]:
-                    if obj_a == obj_b:
-                        continue
-                    pair = frozenset((obj_a, obj_b))
-                    if pair in non_collision_pairs:
-                        continue
-                    if pair in jointMap:
-                        joint = jointMap[pair]
-                        joint.rigid_body_constraint.disable_collisions = True
-                    else:
-                        distance = (obj_a.location - obj_b.location).length
-                        if distance < distance_of_ignore_collisions * (self.__getRigidRange(obj_a) + self.__getRigidRange(obj_b)) * 0.5:
-                            nonCollisionJointTable.append((obj_a, obj_b))
-                    non_collision_pairs.add(pair)
+        index_map = {obj:i for i, obj in enumerate(rigid_objects)}
+        groups = np.array([i.mmd_rigid.collision_group_number for i in rigid_objects], dtype=np.int64)
+        masks = np.array([tuple(i.mmd_rigid.collision_group_mask) for i in rigid_objects], dtype=bool).reshape(-1, 16)
+        joint_pairs = set()
+        for pair, joint in jointMap.items():
+            indices = [index_map.get(i) for i in pair]
+            if len(indices) != 2 or None in indices:
+                continue
+            a, b = indices
+            joint_pairs.add((min(a, b), max(a, b)))
+            if masks[a, groups[b]] or masks[b, groups[a]]:
+                joint.rigid_body_constraint.disable_collisions = True
+
+        locations = np.array([tuple(i.location) for i in rigid_objects], dtype=np.float64).reshape(-1, 3)
+        ranges = np.array([self.__getRigidRange(i) for i in rigid_objects], dtype=np.float64)
+        pairs, tested_cnt = self.__findNonCollisionPairs(locations, ranges, groups, masks, distance_of_ignore_collisions)
+        nonCollisionJointTable = [(rigid_objects[a], rigid_objects[b]) for a, b in pairs if (min(a, b), max(a, b)) not in joint_pairs]
+        pair_cnt = rigid_object_cnt * (rigid_object_cnt - 1) // 2
+        logging.info(' Tested %d of %d rigid body pairs (%d culled), %d non collision pairs',
+            tested_cnt, pair_cnt, pair_cnt - tested_cnt, len(nonCollisionJointTable))
+        if use_collision_layers and rigid_object_cnt:
+            # the first layer is left to the other objects of the scene, the last one is used by spring goals
+            layers = self.__assignCollisionLayers(groups, masks, rigid_body.COLLISION_LAYER_COUNT - 2)
+            for i, obj in zip(layers.tolist(), rigid_objects):
+                if obj.rigid_body:
+                    rigid_body.setCollisionLayers(obj.rigid_body, [False] + i + [False])
+            self.__addSceneCollidersToLayers(rigid_objects, [False] + layers.any(axis=0).tolist() + [False])
+            ncc_cnt = len(nonCollisionJointTable)
+            nonCollisionJointTable = [(a, b) for a, b in nonCollisionJointTable
+                if (layers[index_map[a]] & layers[index_map[b]]).any()]
+            logging.info(' Collision layers: %d non collision constraints saved, %d left',
+                ncc_cnt - len(nonCollisionJointTable), len(nonCollisionJointTable))
         for cnt, i in enumerate(rigid_objects):
             logging.info('%3d/%3d: Updating rigid body %s', cnt+1, rigid_object_cnt, i.name)
             self.updateRigid(i)
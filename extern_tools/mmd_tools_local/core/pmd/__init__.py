@@ -5,6 +5,8 @@ import re
 import logging
 import collections
 
+import numpy as np
+
 class InvalidFileError(Exception):
     pass
 class UnsupportedVersionError(Exception):
@@ -90,6 +92,13 @@ class  FileReadStream(FileStream):
         v, = struct.unpack('<b', self.__fin.read(1))
         return v
 
+    def readArray(self, dtype, count):
+        dtype = np.dtype(dtype)
+        buf = self.__fin.read(dtype.itemsize*count)
+        if len(buf) < dtype.itemsize*count:
+            raise struct.error('unpack requires more bytes, the data is truncated')
+        return np.frombuffer(buf, dtype=dtype)
+
 
 class Header:
     PMD_SIGN = b'Pmd'
@@ -113,6 +122,9 @@ class Header:
         self.comment = fs.readStr(256)
 
 class Vertex:
+    # the record of a vertex, used to load all vertices at once
+    DTYPE = np.dtype([('position', '<f4', (3,)), ('normal', '<f4', (3,)), ('uv', '<f4', (2,)), ('bones', '<u2', (2,)), ('weight', 'u1'), ('enable_edge', 'u1')])
+
     def __init__(self):
         self.position = [0.0, 0.0, 0.0]
         self.normal = [1.0, 0.0, 0.0]
@@ -313,6 +325,10 @@ class Model:
         self.header = None
         self.vertices = []
         self.faces = []
+        # In columnar mode the vertices and faces are loaded into these arrays instead of the lists.
+        self.vertex_array = np.zeros(0, dtype=Vertex.DTYPE)
+        self.face_array = np.zeros((0, 3), dtype=np.int32)
+        self.columnar = False
         self.materials = []
         self.iks = []
         self.morphs = []
@@ -328,7 +344,7 @@ class Model:
         self.joints = []
 
 
-    def load(self, fs):
+    def load(self, fs, columnar=False):
         logging.info('importing pmd model from %s...', fs.path())
 
         header = Header()
@@ -345,12 +361,16 @@ class Model:
         logging.info('Load Vertices')
         logging.info('------------------------------')
         self.vertices = []
+        self.columnar = columnar
         vert_count = fs.readUnsignedInt()
-        for i in range(vert_count):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
-        logging.info('the number of vetices: %d', len(self.vertices))
+        if columnar:
+            self.vertex_array = fs.readArray(Vertex.DTYPE, vert_count)
+        else:
+            for i in range(vert_count):
+                v = Vertex()
+                v.load(fs)
+                self.vertices.append(v)
+        logging.info('the number of vetices: %d', vert_count)
         logging.info('finished importing vertices.')
 
         logging.info('')
@@ -359,12 +379,16 @@ class Model:
         logging.info('------------------------------')
         self.faces = []
         face_vert_count = fs.readUnsignedInt()
-        for i in range(int(face_vert_count/3)):
-            f1 = fs.readUnsignedShort()
-            f2 = fs.readUnsignedShort()
-            f3 = fs.readUnsignedShort()
-            self.faces.append((f3, f2, f1))
-        logging.info('the number of faces: %d', len(self.faces))
+        if columnar:
+            faces = fs.readArray('<u2', int(face_vert_count/3)*3).reshape(-1, 3)
+            self.face_array = faces[:, ::-1].astype(np.int32)
+        else:
+            for i in range(int(face_vert_count/3)):
+                f1 = fs.readUnsignedShort()
+                f2 = fs.readUnsignedShort()
+                f3 = fs.readUnsignedShort()
+                self.faces.append((f3, f2, f1))
+        logging.info('the number of faces: %d', int(face_vert_count/3))
         logging.info('finished importing faces.')
 
         logging.info('')
@@ -583,7 +607,7 @@ class Model:
 
         logging.info('finished importing the model.')
 
-def load(path):
+def load(path, columnar=False):
     with FileReadStream(path) as fs:
         logging.info('****************************************')
         logging.info(' mmd_tools.pmd module')
@@ -594,7 +618,7 @@ def load(path):
 
         model = Model()
         try:
-            model.load(fs)
+            model.load(fs, columnar)
         except struct.error as e:
             logging.error(' * Corrupted file: %s', e)
             #raise
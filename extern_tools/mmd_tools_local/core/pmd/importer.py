@@ -7,6 +7,7 @@ import copy
 import logging
 
 import mathutils
+import numpy as np
 
 import mmd_tools_local.core.pmx.importer as import_pmx
 import mmd_tools_local.core.pmd as pmd
@@ -16,15 +17,18 @@ from math import radians
 
 class PMDImporter:
     def execute(self, **args):
-        args['pmx'] = import_pmd_to_pmx(args['filepath'])
+        args['pmx'] = import_pmd_to_pmx(args['filepath'], args.pop('pmd', None))
         importer = import_pmx.PMXImporter()
         importer.execute(**args)
 
-def import_pmd_to_pmx(filepath):
+def import_pmd_to_pmx(filepath, pmd_model=None):
     """ Import pmd file
+
+    pmd_model is a model already loaded from filepath in columnar mode, or None to load it here.
     """
     target_path = filepath
-    pmd_model = pmd.load(target_path)
+    if pmd_model is None:
+        pmd_model = pmd.load(target_path, columnar=True)
 
 
     logging.info('')
@@ -43,43 +47,37 @@ def import_pmd_to_pmx(filepath):
     pmx_model.comment = pmd_model.comment
     pmx_model.comment_e = pmd_model.comment_e
 
-    pmx_model.vertices = []
-
     # convert vertices
     logging.info('')
     logging.info('------------------------------')
     logging.info(' Convert Vertices')
     logging.info('------------------------------')
-    for v in pmd_model.vertices:
-        pmx_v = pmx.Vertex()
-        pmx_v.co = v.position
-        pmx_v.normal = v.normal
-        pmx_v.uv = v.uv
-        pmx_v.additional_uvs= []
-        pmx_v.edge_scale = 1 if v.enable_edge == 0 else 0
-
-        weight = pmx.BoneWeight()
-        if v.bones[0] != v.bones[1]:
-            weight.type = pmx.BoneWeight.BDEF2
-            weight.bones = v.bones
-            weight.weights = [float(v.weight)/100.0]
-        else:
-            weight.type = pmx.BoneWeight.BDEF1
-            weight.bones = [v.bones[0]]
-            weight.weights = [float(v.weight)/100.0]
-
-        pmx_v.weight = weight
-
-        pmx_model.vertices.append(pmx_v)
-    logging.info('----- Converted %d vertices', len(pmx_model.vertices))
+    vertices = pmd_model.vertex_array
+    vertex_arrays = pmx.VertexArrays(len(vertices))
+    vertex_arrays.co[:] = vertices['position']
+    vertex_arrays.normal[:] = vertices['normal']
+    vertex_arrays.uv[:] = vertices['uv']
+    vertex_arrays.edge_scale[:] = vertices['enable_edge'] == 0
+
+    bones = vertices['bones'].astype(np.int32)
+    bdef2 = bones[:, 0] != bones[:, 1]
+    weights = vertices['weight'] / 100.0
+    vertex_arrays.weight_type[:] = np.where(bdef2, pmx.BoneWeight.BDEF2, pmx.BoneWeight.BDEF1)
+    vertex_arrays.bones[:, 0] = bones[:, 0]
+    vertex_arrays.bones[bdef2, 1] = bones[bdef2, 1]
+    vertex_arrays.weights[:, 0] = np.where(bdef2, weights, 1.0)
+    vertex_arrays.weights[:, 1] = np.where(bdef2, 1.0 - weights, 0.0)
+
+    pmx_model.vertex_arrays = vertex_arrays
+    pmx_model.columnar = True
+    logging.info('----- Converted %d vertices', len(vertex_arrays))
 
     logging.info('')
     logging.info('------------------------------')
     logging.info(' Convert Faces')
     logging.info('------------------------------')
-    for f in pmd_model.faces:
-        pmx_model.faces.append(f)
-    logging.info('----- Converted %d faces', len(pmx_model.faces))
+    pmx_model.face_array = pmd_model.face_array
+    logging.info('----- Converted %d faces', len(pmx_model.face_array))
 
     knee_bones = []
 
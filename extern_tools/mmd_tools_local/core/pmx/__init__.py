@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 import struct
 import os
+import mmap
 import logging
 
+import numpy as np
+
 class InvalidFileError(Exception):
     pass
 class UnsupportedVersionError(Exception):
@@ -116,9 +119,141 @@ class FileReadStream(FileStream):
         v, = struct.unpack('<b', self.__fin.read(1))
         return v
 
+class MappedFileReadStream(FileStream):
+    """ Reads the file through a read-only memory map, which is accessed as a memoryview with a cursor.
+
+    It has the same read methods as FileReadStream. Additionally readArray() decodes
+    fixed-stride data like the vertex and face sections in bulk with numpy.
+    """
+    def __init__(self, path, pmx_header=None):
+        self.__fin = open(path, 'rb')
+        try:
+            self.__map = mmap.mmap(self.__fin.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__view = memoryview(self.__map)
+        except ValueError: # empty files can't be mapped
+            self.__map = None
+            self.__view = memoryview(b'')
+        self.__pos = 0
+        FileStream.__init__(self, path, self.__fin, pmx_header)
+
+    def close(self):
+        try:
+            if self.__view is not None:
+                self.__view.release()
+            if self.__map is not None:
+                self.__map.close()
+        except BufferError: # a numpy view into the file is still alive (e.g. in a traceback), leave it to the gc
+            pass
+        self.__view = None
+        self.__map = None
+        FileStream.close(self)
+
+    def buffer(self):
+        return self.__view
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, pos):
+        self.__pos = pos
+
+    def __unpack(self, fmt, size):
+        v = struct.unpack_from(fmt, self.__view, self.__pos)
+        self.__pos += size
+        return v
+
+    def __readIndex(self, size, typedict):
+        index = None
+        if size in typedict :
+            index, = self.__unpack(typedict[size], size)
+        else:
+            raise ValueError('invalid data size %s'%str(size))
+        return index
+
+    def __readSignedIndex(self, size):
+        return self.__readIndex(size, { 1 :"<b", 2 :"<h", 4 :"<i"})
+
+    def __readUnsignedIndex(self, size):
+        return self.__readIndex(size, { 1 :"<B", 2 :"<H", 4 :"<I"})
+
+
+    # READ methods for indexes
+    def readVertexIndex(self):
+        return self.__readUnsignedIndex(self.header().vertex_index_size)
+
+    def readBoneIndex(self):
+        return self.__readSignedIndex(self.header().bone_index_size)
+
+    def readTextureIndex(self):
+        return self.__readSignedIndex(self.header().texture_index_size)
+
+    def readMorphIndex(self):
+        return self.__readSignedIndex(self.header().morph_index_size)
+
+    def readRigidIndex(self):
+        return self.__readSignedIndex(self.header().rigid_index_size)
+
+    def readMaterialIndex(self):
+        return self.__readSignedIndex(self.header().material_index_size)
+
+    # READ methods for general types
+    def readInt(self):
+        v, = self.__unpack('<i', 4)
+        return v
+
+    def readShort(self):
+        v, = self.__unpack('<h', 2)
+        return v
+
+    def readUnsignedShort(self):
+        v, = self.__unpack('<H', 2)
+        return v
+
+    def readStr(self):
+        length = self.readInt()
+        buf, = self.__unpack('<' + str(length) + 's', length)
+        return str(buf, self.header().encoding.charset, errors='replace')
+
+    def readFloat(self):
+        v, = self.__unpack('<f', 4)
+        return v
+
+    def readVector(self, size):
+        return list(self.__unpack('<' + str(size) + 'f', 4*size))
+
+    def readByte(self):
+        v, = self.__unpack('<B', 1)
+        return v
+
+    def readBytes(self, length):
+        buf = bytes(self.__view[self.__pos:self.__pos+length])
+        self.__pos += len(buf)
+        return buf
+
+    def readSignedByte(self):
+        v, = self.__unpack('<b', 1)
+        return v
+
+    # READ methods for arrays, the returned arrays are copies and stay valid after closing the file
+    def readArray(self, dtype, count):
+        dtype = np.dtype(dtype)
+        if self.__pos + dtype.itemsize * count > len(self.__view):
+            raise struct.error('unpack requires %d bytes, the file is truncated'%(dtype.itemsize * count))
+        a = np.frombuffer(self.__view, dtype, count, self.__pos).copy()
+        self.__pos += dtype.itemsize * count
+        return a
+
+    def readVertexIndexArray(self, count):
+        size = self.header().vertex_index_size
+        if size not in (1, 2, 4):
+            raise ValueError('invalid data size %s'%str(size))
+        return self.readArray('<u%d'%size, count).astype(np.int32)
+
 class FileWriteStream(FileStream):
+    BUFFER_SIZE = 4 * 1024 * 1024
+
     def __init__(self, path, pmx_header=None):
-        self.__fout = open(path, 'wb')
+        self.__fout = open(path, 'wb', buffering=self.BUFFER_SIZE)
         FileStream.__init__(self, path, self.__fout, pmx_header)
 
     def __writeIndex(self, index, size, typedict):
@@ -187,6 +322,41 @@ class FileWriteStream(FileStream):
     def writeSignedByte(self, v):
         self.__fout.write(struct.pack('<b', int(v)))
 
+    # WRITE methods for arrays, every array is written with one call
+    def writeArray(self, v):
+        self.__fout.write(np.ascontiguousarray(v).tobytes())
+
+    def writeVertexIndexArray(self, v):
+        self.writeArray(toIndexArray(v, self.header().vertex_index_size, False))
+
+    def writeVertexOffsetArray(self, indices, offsets):
+        """ Writes (vertex index, float vector) pairs like the offsets of vertex and uv morphs.
+        """
+        if len(indices) == 0:
+            return
+        offsets = np.asarray(offsets, dtype='<f4')
+        size = self.header().vertex_index_size
+        records = np.empty(len(indices), dtype=[('index', '<u%d'%size), ('offset', '<f4', offsets.shape[1:])])
+        records['index'] = toIndexArray(indices, size, False)
+        records['offset'] = offsets
+        self.writeArray(records)
+
+def toIndexArray(indices, size, signed):
+    """ Converts the indices to a little-endian array of the given byte size,
+    raises struct.error like struct.pack if any of them doesn't fit.
+    """
+    if size not in (1, 2, 4):
+        raise ValueError('invalid data size %s'%str(size))
+    indices = np.asarray(indices, dtype=np.int64)
+    bits = size * 8
+    if signed:
+        low, high = -(1 << (bits-1)), (1 << (bits-1)) - 1
+    else:
+        low, high = 0, (1 << bits) - 1
+    if indices.size and (indices.min() < low or indices.max() > high):
+        raise struct.error('index out of range for %d byte(s)'%size)
+    return indices.astype('<%s%d'%('i' if signed else 'u', size))
+
 class Encoding:
     _MAP = [
         (0, 'utf-16-le'),
@@ -241,7 +411,8 @@ class Header:
             self.updateIndexSizes(model)
 
     def updateIndexSizes(self, model):
-        self.vertex_index_size = self.__getIndexSize(len(model.vertices), False)
+        vertex_count = len(model.vertex_arrays) if model.columnar else len(model.vertices)
+        self.vertex_index_size = self.__getIndexSize(vertex_count, False)
         self.texture_index_size = self.__getIndexSize(len(model.textures), True)
         self.material_index_size = self.__getIndexSize(len(model.materials), True)
         self.bone_index_size = self.__getIndexSize(len(model.bones), True)
@@ -355,7 +526,36 @@ class Model:
         self.rigids = []
         self.joints = []
 
-    def load(self, fs):
+        # Columnar copies of the vertices (VertexArrays) and faces (int32 array of shape (n, 3)),
+        # only filled when loading from a MappedFileReadStream. They are not updated when the lists change.
+        # In columnar mode only the arrays are loaded and the vertices and faces lists stay empty.
+        self.vertex_arrays = None
+        self.face_array = None
+        self.columnar = False
+
+    def unpackArrays(self):
+        """ Creates the vertices and faces lists of a model which was loaded in columnar mode.
+        """
+        if not self.columnar:
+            return
+        self.vertices = self.vertex_arrays.toVertices()
+        self.faces = [tuple(f) for f in self.face_array.tolist()]
+        self.vertex_arrays = None
+        self.face_array = None
+        self.columnar = False
+
+    def packArrays(self):
+        """ Moves the vertices and faces lists into columnar arrays, which is what save() writes anyway.
+        """
+        if self.columnar:
+            return
+        self.vertex_arrays = VertexArrays.fromVertices(self.vertices)
+        self.face_array = np.array(self.faces, dtype=np.int32).reshape(-1, 3)
+        self.vertices = []
+        self.faces = []
+        self.columnar = True
+
+    def load(self, fs, columnar=False):
         self.filepath = fs.path()
         self.header = fs.header()
 
@@ -376,11 +576,18 @@ class Model:
         logging.info('------------------------------')
         num_vertices = fs.readInt()
         self.vertices = []
-        for i in range(num_vertices):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
-        logging.info('----- Loaded %d vertices', len(self.vertices))
+        if isinstance(fs, MappedFileReadStream):
+            self.vertex_arrays = VertexArrays(num_vertices, self.header.additional_uvs)
+            self.vertex_arrays.load(fs)
+            self.columnar = columnar
+            if not columnar:
+                self.vertices = self.vertex_arrays.toVertices()
+        else:
+            for i in range(num_vertices):
+                v = Vertex()
+                v.load(fs)
+                self.vertices.append(v)
+        logging.info('----- Loaded %d vertices', num_vertices)
 
         logging.info('')
         logging.info('------------------------------')
@@ -388,12 +595,17 @@ class Model:
         logging.info('------------------------------')
         num_faces = fs.readInt()
         self.faces = []
-        for i in range(int(num_faces/3)):
-            f1 = fs.readVertexIndex()
-            f2 = fs.readVertexIndex()
-            f3 = fs.readVertexIndex()
-            self.faces.append((f3, f2, f1))
-        logging.info(' Load %d faces', len(self.faces))
+        if isinstance(fs, MappedFileReadStream):
+            self.face_array = fs.readVertexIndexArray(int(num_faces/3)*3).reshape(-1, 3)[:, ::-1].copy()
+            if not self.columnar:
+                self.faces = [tuple(f) for f in self.face_array.tolist()]
+        else:
+            for i in range(int(num_faces/3)):
+                f1 = fs.readVertexIndex()
+                f2 = fs.readVertexIndex()
+                f3 = fs.readVertexIndex()
+                self.faces.append((f3, f2, f1))
+        logging.info(' Load %d faces', int(num_faces/3))
 
         logging.info('')
         logging.info('------------------------------')
@@ -591,18 +803,20 @@ comment(english):
 %s
 ''', self.name, self.name_e, self.comment, self.comment_e)
 
-        logging.info('exporting vertices... %d', len(self.vertices))
-        fs.writeInt(len(self.vertices))
-        for i in self.vertices:
-            i.save(fs)
+        if self.columnar:
+            vertex_arrays, face_array = self.vertex_arrays, self.face_array
+        else:
+            vertex_arrays = VertexArrays.fromVertices(self.vertices)
+            face_array = np.array(self.faces, dtype=np.int32).reshape(-1, 3)
+
+        logging.info('exporting vertices... %d', len(vertex_arrays))
+        fs.writeInt(len(vertex_arrays))
+        vertex_arrays.save(fs)
         logging.info('finished exporting vertices.')
 
-        logging.info('exporting faces... %d', len(self.faces))
-        fs.writeInt(len(self.faces)*3)
-        for f3, f2, f1 in self.faces:
-            fs.writeVertexIndex(f1)
-            fs.writeVertexIndex(f2)
-            fs.writeVertexIndex(f3)
+        logging.info('exporting faces... %d', len(face_array))
+        fs.writeInt(len(face_array)*3)
+        fs.writeVertexIndexArray(face_array[:, ::-1])
         logging.info('finished exporting faces.')
 
         logging.info('exporting textures... %d', len(self.textures))
@@ -699,6 +913,278 @@ class Vertex:
         self.weight.save(fs)
         fs.writeFloat(self.edge_scale)
 
+class VertexArrays:
+    """ Columnar vertex data, every attribute is a numpy array with one row per vertex.
+
+    bones and weights always have 4 columns. Unused bones are -1 and the implicit weights
+    are filled in, e.g. BDEF1 stores (1, 0, 0, 0) and BDEF2/SDEF store (w, 1-w, 0, 0).
+    sdef_c, sdef_r0 and sdef_r1 are zero for vertices which are not SDEF.
+    """
+    def __init__(self, count=0, additional_uvs=0):
+        self.co = np.zeros((count, 3), dtype=np.float32)
+        self.normal = np.zeros((count, 3), dtype=np.float32)
+        self.uv = np.zeros((count, 2), dtype=np.float32)
+        self.additional_uvs = np.zeros((count, additional_uvs, 4), dtype=np.float32)
+        self.weight_type = np.zeros(count, dtype=np.uint8)
+        self.bones = np.full((count, 4), -1, dtype=np.int32)
+        self.weights = np.zeros((count, 4), dtype=np.float32)
+        self.sdef_c = np.zeros((count, 3), dtype=np.float32)
+        self.sdef_r0 = np.zeros((count, 3), dtype=np.float32)
+        self.sdef_r1 = np.zeros((count, 3), dtype=np.float32)
+        self.edge_scale = np.ones(count, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.co)
+
+    @classmethod
+    def fromVertices(cls, vertices):
+        """ Creates the arrays from Vertex objects, the inverse of toVertices().
+        """
+        additional_uvs = max([len(v.additional_uvs) for v in vertices] or [0])
+        arrays = cls(len(vertices), additional_uvs)
+        if len(vertices) == 0:
+            return arrays
+
+        add_uvs, types, bones, weights, sdef_data = [], [], [], [], []
+        no_uv, no_sdef = [0.0]*4, ([0.0]*3,)*3
+        for v in vertices:
+            add_uvs.append([list(uv) for uv in v.additional_uvs] + [no_uv]*(additional_uvs-len(v.additional_uvs)))
+            w = v.weight
+            types.append(w.type)
+            bones.append(list(w.bones) + [-1]*(4-len(w.bones)))
+            if w.type == BoneWeight.BDEF1:
+                weights.append((1.0, 0.0, 0.0, 0.0))
+                sdef_data.append(no_sdef)
+            elif w.type == BoneWeight.BDEF2:
+                weights.append((w.weights[0], 1.0-w.weights[0], 0.0, 0.0))
+                sdef_data.append(no_sdef)
+            elif w.type == BoneWeight.BDEF4:
+                weights.append(w.weights)
+                sdef_data.append(no_sdef)
+            elif w.type == BoneWeight.SDEF:
+                if not isinstance(w.weights, BoneWeightSDEF):
+                    raise ValueError
+                weights.append((w.weights.weight, 1.0-w.weights.weight, 0.0, 0.0))
+                sdef_data.append((w.weights.c, w.weights.r0, w.weights.r1))
+            else:
+                raise ValueError('invalid weight type %s'%str(w.type))
+
+        arrays.co[:] = [v.co for v in vertices]
+        arrays.normal[:] = [v.normal for v in vertices]
+        arrays.uv[:] = [v.uv for v in vertices]
+        if additional_uvs:
+            arrays.additional_uvs[:] = add_uvs
+        arrays.weight_type[:] = types
+        arrays.bones[:] = bones
+        arrays.weights[:] = weights
+        arrays.sdef_c[:], arrays.sdef_r0[:], arrays.sdef_r1[:] = np.array(sdef_data, dtype=np.float32).transpose(1, 0, 2)
+        arrays.edge_scale[:] = [v.edge_scale for v in vertices]
+        return arrays
+
+    def take(self, indices):
+        """ Returns the VertexArrays of the given vertices.
+        """
+        arrays = VertexArrays()
+        for name, value in self.__dict__.items():
+            setattr(arrays, name, value[indices])
+        return arrays
+
+    @classmethod
+    def concatenate(cls, arrays_list):
+        """ Joins the arrays one after another, missing additional uvs are filled with zeros.
+        """
+        additional_uvs = max([a.additional_uvs.shape[1] for a in arrays_list] or [0])
+        arrays = cls(sum(len(a) for a in arrays_list), additional_uvs)
+        start = 0
+        for a in arrays_list:
+            end = start + len(a)
+            for name, value in a.__dict__.items():
+                if name == 'additional_uvs':
+                    arrays.additional_uvs[start:end, :value.shape[1]] = value
+                else:
+                    getattr(arrays, name)[start:end] = value
+            start = end
+        return arrays
+
+    def __repr__(self):
+        return '<VertexArrays count %d, additional_uvs %d>'%(len(self), self.additional_uvs.shape[1])
+
+    @staticmethod
+    def __recordDtypes(additional_uvs, bone_index_size):
+        if bone_index_size not in (1, 2, 4):
+            raise ValueError('invalid data size %s'%str(bone_index_size))
+        bone = '<i%d'%bone_index_size
+        head = [('co', '<f4', (3,)), ('normal', '<f4', (3,)), ('uv', '<f4', (2,))]
+        if additional_uvs:
+            head.append(('additional_uvs', '<f4', (additional_uvs, 4)))
+        head.append(('type', 'u1'))
+        weights = {
+            BoneWeight.BDEF1: [('bones', bone, (1,))],
+            BoneWeight.BDEF2: [('bones', bone, (2,)), ('weight', '<f4')],
+            BoneWeight.BDEF4: [('bones', bone, (4,)), ('weights', '<f4', (4,))],
+            BoneWeight.SDEF: [('bones', bone, (2,)), ('weight', '<f4'), ('c', '<f4', (3,)), ('r0', '<f4', (3,)), ('r1', '<f4', (3,))],
+            }
+        return {t:np.dtype(head + w + [('edge_scale', '<f4')]) for t, w in weights.items()}
+
+    @staticmethod
+    def __runs(types):
+        """ Returns the (begin, end) of the runs of vertices with the same weight type, grouped by weight type.
+        """
+        runs = {}
+        if len(types) == 0:
+            return runs
+        bounds = np.concatenate(([0], np.flatnonzero(types[1:] != types[:-1]) + 1, [len(types)])).tolist()
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            runs.setdefault(int(types[begin]), []).append((begin, end))
+        return runs
+
+    def load(self, fs):
+        """ Decodes the vertex section. Only the weight type byte of every vertex is read one by one
+        to find where the vertices start. Each run of vertices with the same weight type is then
+        a plain array of records, which is read from the buffer without copying.
+        """
+        count = len(self)
+        dtypes = self.__recordDtypes(self.additional_uvs.shape[1], fs.header().bone_index_size)
+        sizes = {t:dtype.itemsize for t, dtype in dtypes.items()}
+        type_offset = dtypes[BoneWeight.BDEF1].fields['type'][1]
+        view = fs.buffer()
+        offset = fs.tell()
+
+        starts = []
+        types = []
+        pos = offset
+        try:
+            for i in range(count):
+                weight_type = view[pos + type_offset]
+                starts.append(pos)
+                types.append(weight_type)
+                pos += sizes[weight_type]
+        except IndexError:
+            raise struct.error('unpack requires more bytes, the vertex data is truncated')
+        except KeyError:
+            raise ValueError('invalid weight type %s'%str(weight_type))
+        if pos > len(view):
+            raise struct.error('unpack requires more bytes, the vertex data is truncated')
+
+        data = np.frombuffer(view, dtype=np.uint8)
+        types = np.array(types, dtype=np.uint8)
+        for weight_type, runs in self.__runs(types).items():
+            dtype = dtypes[weight_type]
+            if len(runs) == 1:
+                begin, end = runs[0]
+                self.__assign(slice(begin, end), np.frombuffer(view, dtype, end - begin, starts[begin]), weight_type)
+                continue
+            # the runs are joined as bytes, which is much faster than joining arrays of records
+            records = np.concatenate([data[starts[begin]:starts[begin] + (end - begin) * dtype.itemsize] for begin, end in runs])
+            self.__assign(np.flatnonzero(types == weight_type), records.view(dtype), weight_type)
+        fs.seek(pos)
+
+    def save(self, fs):
+        """ Encodes the vertex section into one buffer and writes it with a single call.
+        """
+        count = len(self)
+        additional_uvs = fs.header().additional_uvs
+        bone_index_size = fs.header().bone_index_size
+        dtypes = self.__recordDtypes(additional_uvs, bone_index_size)
+        if count and self.weight_type.max() not in dtypes:
+            raise ValueError('invalid weight type %s'%str(self.weight_type.max()))
+        bones = toIndexArray(self.bones, bone_index_size, True)
+
+        # additional uvs which are missing are written as zeros like in Vertex.save()
+        add_uvs = np.zeros((count, additional_uvs, 4), dtype=np.float32)
+        n = min(additional_uvs, self.additional_uvs.shape[1])
+        add_uvs[:, :n] = self.additional_uvs[:, :n]
+
+        record_sizes = np.array([dtypes[t].itemsize for t in sorted(dtypes)])[self.weight_type]
+        starts = (np.cumsum(record_sizes) - record_sizes).tolist()
+        data = np.empty(int(record_sizes.sum()), dtype=np.uint8)
+        for weight_type, runs in self.__runs(self.weight_type).items():
+            dtype = dtypes[weight_type]
+            indices = np.flatnonzero(self.weight_type == weight_type)
+            records = np.zeros(len(indices), dtype=dtype)
+            records['co'] = self.co[indices]
+            records['normal'] = self.normal[indices]
+            records['uv'] = self.uv[indices]
+            if additional_uvs:
+                records['additional_uvs'] = add_uvs[indices]
+            records['type'] = weight_type
+            records['bones'] = bones[indices, :records['bones'].shape[1]]
+            if weight_type == BoneWeight.BDEF4:
+                records['weights'] = self.weights[indices]
+            elif weight_type != BoneWeight.BDEF1:
+                records['weight'] = self.weights[indices, 0]
+                if weight_type == BoneWeight.SDEF:
+                    records['c'] = self.sdef_c[indices]
+                    records['r0'] = self.sdef_r0[indices]
+                    records['r1'] = self.sdef_r1[indices]
+            records['edge_scale'] = self.edge_scale[indices]
+
+            if len(indices) == count: # all vertices have the same stride
+                data = records.view(np.uint8)
+                break
+            # the records of each run are copied to the buffer as one block of bytes
+            record_bytes = records.view(np.uint8)
+            pos = 0
+            for begin, end in runs:
+                size = (end - begin) * dtype.itemsize
+                data[starts[begin]:starts[begin] + size] = record_bytes[pos:pos + size]
+                pos += size
+        fs.writeArray(data)
+
+    def __assign(self, s, records, weight_type):
+        self.co[s] = records['co']
+        self.normal[s] = records['normal']
+        self.uv[s] = records['uv']
+        if self.additional_uvs.shape[1]:
+            self.additional_uvs[s] = records['additional_uvs']
+        self.weight_type[s] = weight_type
+        bones = records['bones']
+        self.bones[s, :bones.shape[1]] = bones
+        if weight_type == BoneWeight.BDEF1:
+            self.weights[s, 0] = 1
+        elif weight_type == BoneWeight.BDEF4:
+            self.weights[s] = records['weights']
+        else:
+            self.weights[s, 0] = records['weight']
+            self.weights[s, 1] = 1 - records['weight']
+            if weight_type == BoneWeight.SDEF:
+                self.sdef_c[s] = records['c']
+                self.sdef_r0[s] = records['r0']
+                self.sdef_r1[s] = records['r1']
+        self.edge_scale[s] = records['edge_scale']
+
+    def toVertices(self):
+        """ Creates the Vertex objects, which are the same as the ones Vertex.load() reads.
+        """
+        vertices = []
+        cos, normals, uvs = self.co.tolist(), self.normal.tolist(), self.uv.tolist()
+        additional_uvs = self.additional_uvs.tolist()
+        types, bones, weights = self.weight_type.tolist(), self.bones.tolist(), self.weights.tolist()
+        edge_scales = self.edge_scale.tolist()
+        sdef_c, sdef_r0, sdef_r1 = self.sdef_c.tolist(), self.sdef_r0.tolist(), self.sdef_r1.tolist()
+        for i in range(len(self)):
+            v = Vertex()
+            v.co = cos[i]
+            v.normal = normals[i]
+            v.uv = uvs[i]
+            v.additional_uvs = additional_uvs[i]
+            v.edge_scale = edge_scales[i]
+            w = v.weight = BoneWeight()
+            w.type = types[i]
+            if w.type == BoneWeight.BDEF1:
+                w.bones = bones[i][:1]
+            elif w.type == BoneWeight.BDEF2:
+                w.bones = bones[i][:2]
+                w.weights = weights[i][:1]
+            elif w.type == BoneWeight.BDEF4:
+                w.bones = bones[i]
+                w.weights = weights[i]
+            else:
+                w.bones = bones[i][:2]
+                w.weights = BoneWeightSDEF(weights[i][0], sdef_c[i], sdef_r0[i], sdef_r1[i])
+            vertices.append(v)
+        return vertices
+
 class BoneWeightSDEF:
     def __init__(self, weight=0, c=None, r0=None, r1=None):
         self.weight = weight
@@ -1196,6 +1682,9 @@ class Morph:
         fs.writeSignedByte(self.category)
         fs.writeSignedByte(self.type_index())
         fs.writeInt(len(self.offsets))
+        self.saveOffsets(fs)
+
+    def saveOffsets(self, fs):
         for i in self.offsets:
             i.save(fs)
 
@@ -1206,6 +1695,9 @@ class VertexMorph(Morph):
     def type_index(self):
         return 1
 
+    def saveOffsets(self, fs):
+        fs.writeVertexOffsetArray([i.index for i in self.offsets], [i.offset for i in self.offsets])
+
     def load(self, fs):
         num = fs.readInt()
         for i in range(num):
@@ -1234,6 +1726,9 @@ class UVMorph(Morph):
     def type_index(self):
         return self.uv_index + 3
 
+    def saveOffsets(self, fs):
+        fs.writeVertexOffsetArray([i.index for i in self.offsets], [i.offset for i in self.offsets])
+
     def load(self, fs):
         self.offsets = []
         num = fs.readInt()
@@ -1586,8 +2081,8 @@ class Joint:
 
 
 
-def load(path):
-    with FileReadStream(path) as fs:
+def load(path, columnar=False):
+    with MappedFileReadStream(path) as fs:
         logging.info('****************************************')
         logging.info(' mmd_tools.pmx module')
         logging.info('----------------------------------------')
@@ -1599,7 +2094,7 @@ def load(path):
         fs.setHeader(header)
         model = Model()
         try:
-            model.load(fs)
+            model.load(fs, columnar)
         except struct.error as e:
             logging.error(' * Corrupted file: %s', e)
             #raise
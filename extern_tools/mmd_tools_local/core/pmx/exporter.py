@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import os
-import copy
 import logging
 import shutil
 import time
@@ -8,6 +7,7 @@ import time
 import mathutils
 import bpy
 import bmesh
+import numpy as np
 
 from collections import OrderedDict
 from mmd_tools_local.core import pmx
@@ -18,37 +18,162 @@ from mmd_tools_local.core.sdef import FnSDEF
 from mmd_tools_local.core.vmd.importer import BoneConverter, BoneConverterPoseMode
 from mmd_tools_local import bpyutils
 from mmd_tools_local.utils import saferelpath
-from mmd_tools_local.bpyutils import matmul
+from mmd_tools_local.bpyutils import matmul, foreach_get
 from mmd_tools_local.operators.misc import MoveObject
 
 
-class _Vertex:
-    def __init__(self, co, groups, offsets, edge_scale, vertex_order, uv_offsets):
-        self.co = co
-        self.groups = groups # [(group_number, weight), ...]
-        self.offsets = offsets
-        self.edge_scale = edge_scale
-        self.vertex_order = vertex_order # used for controlling vertex order
-        self.uv_offsets = uv_offsets
-        self.index = None
-        self.uv = None
-        self.normal = None
-        self.sdef_data = None # (C, R0, R1)
-        self.add_uvs = [None]*4 # UV1~UV4
-
-class _Face:
+def _transform_normals(normals, matrix):
+    """ Same as [matmul(matrix, n).normalized() for n in normals], zero vectors stay zero.
+    """
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3).dot(np.array(matrix, dtype=np.float64).T)
+    lengths = np.linalg.norm(normals, axis=1)
+    lengths[lengths == 0] = 1
+    return normals / lengths[:, None]
+
+def _split_vertices(keys, values, tolerances):
+    """ Matches every loop to a vertex like the faceUV-to-vertexUV conversion does.
+
+    A loop reuses the first vertex of its key (the vertex it was split from) which was
+    created with values close enough to its own, otherwise it creates a new vertex.
+    Loops with exactly the same key and values are merged with numpy first, only the keys
+    left with several different candidates are compared one by one.
+
+    @param keys the vertex index of every loop
+    @param values a list of arrays of shape (loop count, n)
+    @param tolerances the max distance of each values array
+    @return (the split vertex index of every loop, the first loop of every split vertex)
+    """
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # adding 0.0 turns -0.0 into 0.0, so equal values have equal bytes
+    rows = np.column_stack([keys.astype(np.float64)] + [v.astype(np.float64) for v in values]) + 0.0
+    # rows are compared as single void items, np.unique(axis=0) needs numpy 1.13
+    rows = np.ascontiguousarray(rows).view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1])))
+    _, first, inverse = np.unique(rows.reshape(-1), return_index=True, return_inverse=True)
+    # renumber the candidates in the order of their first loop
+    order = np.argsort(first, kind='mergesort')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    first = first[order]
+    inverse = rank[inverse.reshape(-1)]
+
+    rep = np.arange(len(first))
+    candidate_keys = keys[first]
+    _, key_inverse, key_counts = np.unique(candidate_keys, return_inverse=True, return_counts=True)
+    shared = np.flatnonzero(key_counts[key_inverse.reshape(-1)] > 1)
+    if len(shared):
+        shared = shared[np.argsort(candidate_keys[shared], kind='mergesort')]
+        shared_values = [v[first[shared]].astype(np.float64) for v in values]
+        tolerances = [float(t) for t in tolerances]
+        shared_keys = candidate_keys[shared].tolist()
+        last_key, reps = None, []
+        for i, (c, key) in enumerate(zip(shared.tolist(), shared_keys)):
+            if key != last_key:
+                last_key, reps = key, []
+            for r in reps:
+                if all(np.linalg.norm(v[i] - v[r]) < t for v, t in zip(shared_values, tolerances)):
+                    rep[c] = rep[shared[r]]
+                    break
+            else:
+                reps.append(i)
+
+    is_rep = rep == np.arange(len(rep))
+    split_index = np.cumsum(is_rep) - 1
+    return split_index[rep][inverse], first[is_rep]
+
+class _VertexGroupTable:
+    """ The vertex group weights of a mesh as flat (vertex index, group index, weight) arrays.
+
+    Blender has no bulk accessor for the groups of the vertices, so this is the only
+    loop over the vertices, everything else is looked up from the arrays.
+    """
     def __init__(self, vertices):
-        ''' Temporary Face Class
-        '''
-        self.vertices = vertices
+        self.vertex_count = len(vertices)
+        table = [(v.index, g.group, g.weight) for v in vertices for g in v.groups]
+        self.indices = np.array([i[0] for i in table], dtype=np.int64)
+        self.groups = np.array([i[1] for i in table], dtype=np.int64)
+        self.weights = np.array([i[2] for i in table], dtype=np.float32)
+
+    def get(self, vertex_group, default_weight):
+        """ Returns the weight of every vertex in vertex_group, or default_weight if not in the group.
+        """
+        weights = np.full(self.vertex_count, default_weight, dtype=np.float32)
+        if vertex_group is not None:
+            sel = self.groups == vertex_group.index
+            weights[self.indices[sel]] = self.weights[sel]
+        return weights
+
+    def bone_weights(self, group_bones):
+        """ Converts the weights of the bone groups into PMX bone weights.
+
+        Vertices without bones use bone 0, vertices of more than 4 bones keep the 4 biggest weights,
+        and the weights of BDEF2 and BDEF4 are normalized.
+
+        @param group_bones the bone index of every vertex group, -1 if it isn't a bone
+        @return (weight_type, bones, weights, bone count) arrays, bones and weights have 4 columns
+        """
+        count = self.vertex_count
+        group_count = int(self.groups.max()) + 1 if len(self.groups) else 0
+        group_bones = np.append(group_bones, np.full(max(0, group_count-len(group_bones)), -1)).astype(np.int64)
+        bone_indices = group_bones[self.groups]
+        sel = (self.weights > 0) & (bone_indices >= 0)
+        indices, bones, weights = self.indices[sel], bone_indices[sel], self.weights[sel].astype(np.float64)
+
+        bone_counts = np.bincount(indices, minlength=count)
+        # the biggest weights go first when there are too many, the others keep their order
+        order = np.lexsort((np.where(bone_counts[indices] > 4, -weights, 0), indices))
+        indices, bones, weights = indices[order], bones[order], weights[order]
+        slots = np.arange(len(indices)) - (np.cumsum(bone_counts) - bone_counts)[indices]
+        sel = slots < 4
+
+        out_bones = np.zeros((count, 4), dtype=np.int32)
+        out_weights = np.zeros((count, 4), dtype=np.float64)
+        out_bones[indices[sel], slots[sel]] = bones[sel]
+        out_weights[indices[sel], slots[sel]] = weights[sel]
+
+        weight_type = np.where(bone_counts > 2, pmx.BoneWeight.BDEF4, np.where(bone_counts == 2, pmx.BoneWeight.BDEF2, pmx.BoneWeight.BDEF1))
+        weight_sum = out_weights.sum(axis=1)
+        weight_sum[weight_sum == 0] = 1
+        out_weights /= weight_sum[:, None]
+        bdef1 = bone_counts < 2
+        out_weights[bdef1] = (1, 0, 0, 0)
+        out_bones[bdef1, 1:] = -1
+        bdef2 = bone_counts == 2
+        out_weights[bdef2, 1] = 1 - out_weights[bdef2, 0]
+        out_bones[bdef2, 2:] = -1
+        return weight_type.astype(np.uint8), out_bones, out_weights, bone_counts
+
+    def uv_offsets(self, uv_morph_groups):
+        """ Sums the weights of the uv morph vertex groups.
+
+        @param uv_morph_groups a dict of vertex group index: (morph name, axis)
+        @return a dict of morph name: (offsets of shape (vertex count, 4), mask of the vertices using the morph)
+        """
+        uv_offsets = {}
+        for group_index, (name, axis) in uv_morph_groups.items():
+            sel = (self.groups == group_index) & (self.weights > 0)
+            if not sel.any():
+                continue
+            if name not in uv_offsets:
+                uv_offsets[name] = (np.zeros((self.vertex_count, 4)), np.zeros(self.vertex_count, dtype=bool))
+            offsets, mask = uv_offsets[name]
+            weights = self.weights[sel].astype(np.float64)
+            offsets[self.indices[sel], 'XYZW'.index(axis[1])] += -weights if axis[0] == '-' else weights
+            mask[self.indices[sel]] = True
+        return uv_offsets
 
 class _Mesh:
-    def __init__(self, mesh_data, material_faces, shape_key_names, vertex_group_names, materials):
+    def __init__(self, mesh_data, material_faces, shape_key_names, materials, vertex_arrays, base_indices):
         self.mesh_data = mesh_data
-        self.material_faces = material_faces # dict of {material_index => [face1, face2, ....]}
+        self.material_faces = material_faces # dict of {material_index => face array of shape (n, 3)}
         self.shape_key_names = shape_key_names
-        self.vertex_group_names = vertex_group_names
         self.materials = materials
+        self.vertex_arrays = vertex_arrays # pmx.VertexArrays of the split vertices
+        self.base_indices = base_indices # the mesh vertex of every split vertex
+        self.offsets = {} # dict of {shape_key_name => (offsets, mask)} of the mesh vertices
+        self.uv_offsets = {} # dict of {uv_morph_name => (offsets, mask)} of the mesh vertices
+        self.vertex_order = None # (mesh_id, order weights of the mesh vertices), used for controlling vertex order
+        self.vertex_indices = np.full(len(base_indices), -1, dtype=np.int64) # the exported index of every split vertex
 
     def __del__(self):
         logging.debug('remove mesh data: %s', str(self.mesh_data))
@@ -81,7 +206,7 @@ class __PmxExporter:
         self.__model = None
         self.__bone_name_table = []
         self.__material_name_table = []
-        self.__exported_vertices = []
+        self.__exported_vertices = [] # [(mesh, split vertex indices), ...] in the exported order
         self.__default_material = None
         self.__vertex_order_map = None # used for controlling vertex order
         self.__disable_specular = False
@@ -89,124 +214,74 @@ class __PmxExporter:
 
     @staticmethod
     def flipUV_V(uv):
-        u, v = uv
-        return u, 1.0-v
+        """ Flips V (and W) of the uv arrays, which have 2 or 4 columns.
+        """
+        uv = np.array(uv, dtype=np.float64)
+        uv[..., 1::2] = 1.0 - uv[..., 1::2]
+        return uv
 
     def __getDefaultMaterial(self):
         if self.__default_material is None:
             self.__default_material = _DefaultMaterial()
         return self.__default_material.material
 
-    def __sortVertices(self):
+    def __sortVertices(self, meshes):
         logging.info(' - Sorting vertices ...')
-        weight_items = self.__vertex_order_map.items()
-        sorted_indices = [i[0] for i in sorted(weight_items, key=lambda x: x[1].vertex_order)]
-        vertices = self.__model.vertices
-        self.__model.vertices = [vertices[i] for i in sorted_indices]
+        keys = ([], [], [], [])
+        for mesh, vertices in self.__exported_vertices:
+            mesh_id, order_weights = mesh.vertex_order
+            base_indices = mesh.base_indices[vertices]
+            keys[0].append(mesh.vertex_indices[vertices])
+            keys[1].append(base_indices)
+            keys[2].append(order_weights[base_indices] if order_weights is not None else np.zeros(len(vertices)))
+            keys[3].append(np.full(len(vertices), mesh_id))
+        # sorted by (mesh_id, order weight, vertex index), split vertices keep their order
+        sorted_indices = np.lexsort([np.concatenate(k) for k in keys])
+        self.__model.vertex_arrays = self.__model.vertex_arrays.take(sorted_indices)
 
         # update indices
-        index_map = {x:i for i, x in enumerate(sorted_indices)}
-        for v in self.__vertex_order_map.values():
-            v.index = index_map[v.index]
-        for f in self.__model.faces:
-            f[:] = [index_map[i] for i in f]
-        logging.debug('   - Done (count:%d)', len(self.__vertex_order_map))
-
-    def __exportMeshes(self, meshes, bone_map):
+        index_map = np.empty(len(sorted_indices), dtype=np.int64)
+        index_map[sorted_indices] = np.arange(len(sorted_indices))
+        for mesh in meshes:
+            exported = mesh.vertex_indices >= 0
+            mesh.vertex_indices[exported] = index_map[mesh.vertex_indices[exported]]
+        self.__model.face_array = index_map[self.__model.face_array].astype(np.int32)
+        logging.debug('   - Done (count:%d)', len(sorted_indices))
+
+    def __exportMeshes(self, meshes):
         mat_map = OrderedDict()
         for mesh in meshes:
             for index, mat_faces in sorted(mesh.material_faces.items(), key=lambda x: x[0]):
                 name = mesh.materials[index].name
                 if name not in mat_map:
                     mat_map[name] = []
-                mat_map[name].append((mat_faces, mesh.vertex_group_names))
+                mat_map[name].append((mesh, mat_faces))
 
-        sort_vertices = self.__vertex_order_map is not None
-        if sort_vertices:
-            self.__vertex_order_map.clear()
-
-        # export vertices
+        # export vertices in the order they are first used by the faces of each material
+        vertex_count = 0
+        vertex_arrays = []
+        face_arrays = []
         for mat_name, mat_meshes in mat_map.items():
             face_count = 0
-            for mat_faces, vertex_group_names in mat_meshes:
-                mesh_vertices = []
-                for face in mat_faces:
-                    mesh_vertices.extend(face.vertices)
-
-                for v in mesh_vertices:
-                    if v.index is not None:
-                        continue
-
-                    v.index = len(self.__model.vertices)
-                    if sort_vertices:
-                        self.__vertex_order_map[v.index] = v
-
-                    pv = pmx.Vertex()
-                    pv.co = list(v.co)
-                    pv.normal = v.normal
-                    pv.uv = self.flipUV_V(v.uv)
-                    pv.edge_scale = v.edge_scale
-                    for _uvzw in v.add_uvs:
-                        if _uvzw:
-                            pv.additional_uvs.append(self.flipUV_V(_uvzw[0])+self.flipUV_V(_uvzw[1]))
-
-                    t = len(v.groups)
-                    if t == 0:
-                        weight = pmx.BoneWeight()
-                        weight.type = pmx.BoneWeight.BDEF1
-                        weight.bones = [0]
-                        pv.weight = weight
-                    elif t == 1:
-                        weight = pmx.BoneWeight()
-                        weight.type = pmx.BoneWeight.BDEF1
-                        weight.bones = [bone_map[vertex_group_names[v.groups[0][0]]]]
-                        pv.weight = weight
-                    elif t == 2:
-                        vg1, vg2 = v.groups
-                        weight = pmx.BoneWeight()
-                        weight.type = pmx.BoneWeight.BDEF2
-                        weight.bones = [
-                            bone_map[vertex_group_names[vg1[0]]],
-                            bone_map[vertex_group_names[vg2[0]]]
-                            ]
-                        w1, w2 = vg1[1], vg2[1]
-                        weight.weights = [w1/(w1+w2)]
-                        if v.sdef_data:
-                            weight.type = pmx.BoneWeight.SDEF
-                            sdef_weights = pmx.BoneWeightSDEF()
-                            sdef_weights.weight = weight.weights[0]
-                            sdef_weights.c, sdef_weights.r0, sdef_weights.r1 = v.sdef_data
-                            if weight.bones[0] > weight.bones[1]:
-                                weight.bones.reverse()
-                                sdef_weights.weight = 1.0 - sdef_weights.weight
-                            weight.weights = sdef_weights
-                        pv.weight = weight
-                    else:
-                        weight = pmx.BoneWeight()
-                        weight.type = pmx.BoneWeight.BDEF4
-                        weight.bones = [0, 0, 0, 0]
-                        weight.weights = [0.0, 0.0, 0.0, 0.0]
-                        w_all = 0.0
-                        if t > 4:
-                            v.groups.sort(key=lambda x: -x[1])
-                        for i in range(min(t, 4)):
-                            gn, w = v.groups[i]
-                            weight.bones[i] = bone_map[vertex_group_names[gn]]
-                            weight.weights[i] = w
-                            w_all += w
-                        for i in range(4):
-                            weight.weights[i] /= w_all
-                        pv.weight = weight
-                    self.__model.vertices.append(pv)
-                    self.__exported_vertices.append(v)
-
-                for face in mat_faces:
-                    self.__model.faces.append([x.index for x in face.vertices])
+            for mesh, mat_faces in mat_meshes:
+                used, first = np.unique(mat_faces.ravel(), return_index=True)
+                sel = mesh.vertex_indices[used] < 0
+                vertices = used[sel][np.argsort(first[sel])]
+                mesh.vertex_indices[vertices] = np.arange(vertex_count, vertex_count+len(vertices))
+                vertex_count += len(vertices)
+                vertex_arrays.append(mesh.vertex_arrays.take(vertices))
+                self.__exported_vertices.append((mesh, vertices))
+
+                face_arrays.append(mesh.vertex_indices[mat_faces])
                 face_count += len(mat_faces)
             self.__exportMaterial(bpy.data.materials[mat_name], face_count)
 
-        if sort_vertices:
-            self.__sortVertices()
+        self.__model.vertex_arrays = pmx.VertexArrays.concatenate(vertex_arrays)
+        self.__model.face_array = np.concatenate(face_arrays + [np.zeros((0, 3), dtype=np.int64)]).astype(np.int32)
+        self.__model.columnar = True
+
+        if self.__vertex_order_map is not None:
+            self.__sortVertices(meshes)
 
     def __exportTexture(self, filepath):
         if filepath.strip() == '':
@@ -595,12 +670,16 @@ class __PmxExporter:
             self.__model.morphs.append(morph)
 
         append_table = dict(zip(shape_key_names, [m.offsets.append for m in self.__model.morphs]))
-        for v in self.__exported_vertices:
-            for i, offset in v.offsets.items():
-                mo = pmx.VertexMorphOffset()
-                mo.index = v.index
-                mo.offset = offset
-                append_table[i](mo)
+        for mesh, vertices in self.__exported_vertices:
+            base_indices = mesh.base_indices[vertices]
+            for name, (offsets, mask) in mesh.offsets.items():
+                sel = mask[base_indices]
+                append = append_table[name]
+                for index, offset in zip(mesh.vertex_indices[vertices[sel]].tolist(), offsets[base_indices[sel]].tolist()):
+                    mo = pmx.VertexMorphOffset()
+                    mo.index = index
+                    mo.offset = offset
+                    append(mo)
 
     def __export_material_morphs(self, root):
         mmd_root = root.mmd_root
@@ -643,34 +722,27 @@ class __PmxExporter:
          モデル中心座標から離れている位置で使用されているマテリアルほどリストの後ろ側にくるように。
          かなりいいかげんな実装
         """
-        center = mathutils.Vector([0, 0, 0])
-        vertices = self.__model.vertices
-        vert_num = len(vertices)
-        for v in self.__model.vertices:
-            center += mathutils.Vector(v.co) / vert_num
+        co = self.__model.vertex_arrays.co.astype(np.float64)
+        center = co.mean(axis=0) if len(co) else np.zeros(3)
+        distances_to_center = np.linalg.norm(co - center, axis=1)
 
-        faces = self.__model.faces
+        faces = self.__model.face_array
         offset = 0
         distances = []
         for mat, bl_mat_name in zip(self.__model.materials, self.__material_name_table):
-            d = 0
             face_num = int(mat.vertex_count / 3)
-            for i in range(offset, offset + face_num):
-                face = faces[i]
-                d += (mathutils.Vector(vertices[face[0]].co) - center).length
-                d += (mathutils.Vector(vertices[face[1]].co) - center).length
-                d += (mathutils.Vector(vertices[face[2]].co) - center).length
+            d = distances_to_center[faces[offset:offset + face_num]].sum()
             distances.append((d/mat.vertex_count, mat, offset, face_num, bl_mat_name))
             offset += face_num
         sorted_faces = []
         sorted_mat = []
         self.__material_name_table.clear()
         for d, mat, offset, vert_count, bl_mat_name in sorted(distances, key=lambda x: x[0]):
-            sorted_faces.extend(faces[offset:offset+vert_count])
+            sorted_faces.append(faces[offset:offset+vert_count])
             sorted_mat.append(mat)
             self.__material_name_table.append(bl_mat_name)
         self.__model.materials = sorted_mat
-        self.__model.faces = sorted_faces
+        self.__model.face_array = np.concatenate(sorted_faces + [np.zeros((0, 3), dtype=np.int32)])
 
     def __export_bone_morphs(self, root):
         mmd_root = root.mmd_root
@@ -726,16 +798,22 @@ class __PmxExporter:
         if append_table_vg:
             incompleted = set()
             uv_morphs = mmd_root.uv_morphs
-            for v in self.__exported_vertices:
-                for name, offset in v.uv_offsets.items():
+            for mesh, vertices in self.__exported_vertices:
+                base_indices = mesh.base_indices[vertices]
+                for name, (offsets, mask) in mesh.uv_offsets.items():
+                    sel = mask[base_indices]
+                    if not sel.any():
+                        continue
                     if name not in append_table_vg:
                         incompleted.add(name)
                         continue
                     scale = uv_morphs[name].vertex_group_scale
-                    morph_data = pmx.UVMorphOffset()
-                    morph_data.index = v.index
-                    morph_data.offset = (offset[0]*scale, -offset[1]*scale, offset[2]*scale, -offset[3]*scale)
-                    append_table_vg[name](morph_data)
+                    append = append_table_vg[name]
+                    for index, offset in zip(mesh.vertex_indices[vertices[sel]].tolist(), (offsets[base_indices[sel]] * (scale, -scale, scale, -scale)).tolist()):
+                        morph_data = pmx.UVMorphOffset()
+                        morph_data.index = index
+                        morph_data.offset = offset
+                        append(morph_data)
 
             if incompleted:
                 logging.warning(' * Incompleted UV morphs %s with vertex groups', incompleted)
@@ -878,39 +956,6 @@ class __PmxExporter:
             self.__model.joints.append(p_joint)
 
 
-    @staticmethod
-    def __convertFaceUVToVertexUV(vert_index, uv, normal, vertices_map):
-        vertices = vertices_map[vert_index]
-        for i in vertices:
-            if i.uv is None:
-                i.uv = uv
-                i.normal = normal
-                return i
-            elif (i.uv - uv).length < 0.001 and (normal - i.normal).length < 0.01:
-                return i
-        n = copy.copy(i) # shallow copy should be fine
-        n.uv = uv
-        n.normal = normal
-        vertices.append(n)
-        return n
-
-    @staticmethod
-    def __convertAddUV(vert, adduv, addzw, uv_index, vertices, rip_vertices):
-        if vert.add_uvs[uv_index] is None:
-            vert.add_uvs[uv_index] = (adduv, addzw)
-            return vert
-        for i in rip_vertices:
-            uvzw = i.add_uvs[uv_index]
-            if (uvzw[0] - adduv).length < 0.001 and (uvzw[1] - addzw).length < 0.001:
-                return i
-        n = copy.copy(vert)
-        add_uvs = n.add_uvs.copy()
-        add_uvs[uv_index] = (adduv, addzw)
-        n.add_uvs = add_uvs
-        vertices.append(n)
-        rip_vertices.append(n)
-        return n
-
     @staticmethod
     def __triangulate(mesh, custom_normals):
         bm = bmesh.new()
@@ -935,11 +980,12 @@ class __PmxExporter:
             quad_method, ngon_method = (1, 1) if bpy.app.version < (2, 80, 0) else ('FIXED', 'EAR_CLIP')
             face_map = bmesh.ops.triangulate(bm, faces=bm.faces, quad_method=quad_method, ngon_method=ngon_method)['face_map']
             logging.debug(' - Remapping custom normals...')
-            loop_normals = []
+            loop_ids = []
             for f in bm.faces:
                 vert_to_loop_id = face_verts_to_loop_id_map[face_map.get(f, f)]
                 for v in f.verts:
-                    loop_normals.append(custom_normals[vert_to_loop_id[v]])
+                    loop_ids.append(vert_to_loop_id[v])
+            loop_normals = custom_normals[np.array(loop_ids, dtype=np.int64)]
             logging.debug('   - Done (faces:%d)', len(bm.faces))
             bm.to_mesh(mesh)
             face_map.clear()
@@ -955,30 +1001,34 @@ class __PmxExporter:
         if hasattr(mesh, 'has_custom_normals'):
             logging.debug(' - Calculating normals split...')
             mesh.calc_normals_split()
-            custom_normals = [matmul(matrix, l.normal).normalized() for l in mesh.loops]
+            custom_normals = _transform_normals(foreach_get(mesh.loops, 'normal', np.float32, 3), matrix)
             mesh.free_normals_split()
         elif mesh.use_auto_smooth:
             logging.debug(' - Calculating normals split (angle:%f)...', mesh.auto_smooth_angle)
             mesh.calc_normals_split(mesh.auto_smooth_angle)
-            custom_normals = [matmul(matrix, l.normal).normalized() for l in mesh.loops]
+            custom_normals = _transform_normals(foreach_get(mesh.loops, 'normal', np.float32, 3), matrix)
             mesh.free_normals_split()
         else:
             logging.debug(' - Calculating normals...')
             mesh.calc_normals()
-            #custom_normals = [matmul(matrix, mesh.vertices[l.vertex_index].normal).normalized() for l in mesh.loops]
-            custom_normals = []
-            for f in mesh.polygons:
-                if f.use_smooth:
-                    for v in f.vertices:
-                        custom_normals.append(matmul(matrix, mesh.vertices[v].normal).normalized())
-                else:
-                    for v in f.vertices:
-                        custom_normals.append(matmul(matrix, f.normal).normalized())
+            # the vertex normals of smooth faces and the face normals of flat faces, in the order of the faces
+            loop_starts = foreach_get(mesh.polygons, 'loop_start', np.int64)
+            loop_totals = foreach_get(mesh.polygons, 'loop_total', np.int64)
+            face_indices = np.repeat(np.arange(len(loop_totals)), loop_totals)
+            loop_indices = np.arange(len(face_indices)) + np.repeat(loop_starts - (np.cumsum(loop_totals) - loop_totals), loop_totals)
+            loop_vertices = foreach_get(mesh.loops, 'vertex_index', np.int64)[loop_indices]
+            use_smooth = foreach_get(mesh.polygons, 'use_smooth', bool)[face_indices]
+            vertex_normals = foreach_get(mesh.vertices, 'normal', np.float32, 3)[loop_vertices]
+            face_normals = foreach_get(mesh.polygons, 'normal', np.float32, 3)[face_indices]
+            custom_normals = _transform_normals(np.where(use_smooth[:, None], vertex_normals, face_normals), matrix)
         logging.debug('   - Done (polygons:%d)', len(mesh.polygons))
         return custom_normals
 
     def __doLoadMeshData(self, meshObj, bone_map):
         vertex_group_names = {i:x.name for i, x in enumerate(meshObj.vertex_groups) if x.name in bone_map}
+        group_bones = np.full(len(meshObj.vertex_groups), -1, dtype=np.int64)
+        for i, name in vertex_group_names.items():
+            group_bones[i] = bone_map[name]
         vg_edge_scale = meshObj.vertex_groups.get('mmd_edge_scale', None)
         vg_vertex_order = meshObj.vertex_groups.get('mmd_vertex_order', None)
 
@@ -1000,49 +1050,22 @@ class __PmxExporter:
         loop_normals = self.__triangulate(base_mesh, self.__get_normals(base_mesh, normal_matrix))
         base_mesh.transform(pmx_matrix)
 
-        def _get_weight(vertex_group, vertex, default_weight):
-            for i in vertex.groups:
-                if i.group == vertex_group.index:
-                    return vertex_group.weight(vertex.index)
-            return default_weight
+        base_co = foreach_get(base_mesh.vertices, 'co', np.float32, 3)
+        vertex_groups = _VertexGroupTable(base_mesh.vertices)
+        weight_type, bones, weights, bone_counts = vertex_groups.bone_weights(group_bones)
+        edge_scale = vertex_groups.get(vg_edge_scale, 1)
 
-        get_edge_scale = None
-        if vg_edge_scale:
-            get_edge_scale = lambda x: _get_weight(vg_edge_scale, x, 1)
-        else:
-            get_edge_scale = lambda x: 1
-
-        get_vertex_order = None
+        vertex_order = None
         if self.__vertex_order_map: # sort vertices
             mesh_id = self.__vertex_order_map.setdefault('mesh_id', 0)
             self.__vertex_order_map['mesh_id'] += 1
             if vg_vertex_order and self.__vertex_order_map['method'] == 'CUSTOM':
-                get_vertex_order = lambda x: (mesh_id, _get_weight(vg_vertex_order, x, 2), x.index)
+                vertex_order = (mesh_id, vertex_groups.get(vg_vertex_order, 2))
             else:
-                get_vertex_order = lambda x: (mesh_id, x.index)
-        else:
-            get_vertex_order = lambda x: None
+                vertex_order = (mesh_id, None)
 
         uv_morph_names = {g.index:(n, x) for g, n, x in FnMorph.get_uv_morph_vertex_groups(meshObj)}
-        def get_uv_offsets(v):
-            uv_offsets = {}
-            for x in v.groups:
-                if x.group in uv_morph_names and x.weight > 0:
-                    name, axis = uv_morph_names[x.group]
-                    d = uv_offsets.setdefault(name, [0, 0, 0, 0])
-                    d['XYZW'.index(axis[1])] += -x.weight if axis[0] == '-' else x.weight
-            return uv_offsets
-
-        base_vertices = {}
-        for v in base_mesh.vertices:
-            base_vertices[v.index] = [_Vertex(
-                v.co,
-                [(x.group, x.weight) for x in v.groups if x.weight > 0 and x.group in vertex_group_names],
-                {},
-                get_edge_scale(v),
-                get_vertex_order(v),
-                get_uv_offsets(v),
-                )]
+        uv_offsets = vertex_groups.uv_offsets(uv_morph_names)
 
         # calculate offsets
         shape_key_list = []
@@ -1058,7 +1081,10 @@ class __PmxExporter:
                     shape_key_list.append((i, kb))
 
         shape_key_names = []
+        offsets = OrderedDict()
         sdef_counts = 0
+        sdef_vertices = None
+        sdef_data = np.zeros((3, len(base_co), 3), dtype=np.float32) # C, R0, R1
         for i, kb in shape_key_list:
             shape_key_name = kb.name
             logging.info(' - processing shape key: %s', shape_key_name)
@@ -1070,65 +1096,40 @@ class __PmxExporter:
             if len(mesh.vertices) != len(base_mesh.vertices):
                 logging.warning('   * Error! vertex count mismatch!')
                 continue
+            co = foreach_get(mesh.vertices, 'co', np.float32, 3)
             if shape_key_name in {'mmd_sdef_c', 'mmd_sdef_r0', 'mmd_sdef_r1'}:
                 if shape_key_name == 'mmd_sdef_c':
-                    for v in mesh.vertices:
-                        base = base_vertices[v.index][0]
-                        if len(base.groups) != 2:
-                            continue
-                        base_co = base.co
-                        c_co = v.co
-                        if (c_co - base_co).length < 0.001:
-                            continue
-                        base.sdef_data = [tuple(c_co), base_co, base_co]
-                        sdef_counts += 1
+                    sdef_vertices = (bone_counts == 2) & (np.linalg.norm(co - base_co, axis=1) >= 0.001)
+                    sdef_data[0, sdef_vertices] = co[sdef_vertices]
+                    sdef_data[1:, sdef_vertices] = base_co[sdef_vertices]
+                    sdef_counts = int(sdef_vertices.sum())
                     logging.info('   - Restored %d SDEF vertices', sdef_counts)
                 elif sdef_counts > 0:
                     ri = 1 if shape_key_name == 'mmd_sdef_r0' else 2
-                    for v in mesh.vertices:
-                        sdef_data = base_vertices[v.index][0].sdef_data
-                        if sdef_data:
-                            sdef_data[ri] = tuple(v.co)
+                    sdef_data[ri, sdef_vertices] = co[sdef_vertices]
                     logging.info('   - Updated SDEF data')
             else:
                 shape_key_names.append(shape_key_name)
-                for v in mesh.vertices:
-                    base = base_vertices[v.index][0]
-                    offset = v.co - base.co
-                    if offset.length < 0.001:
-                        continue
-                    base.offsets[shape_key_name] = offset
+                offset = co - base_co
+                offsets[shape_key_name] = (offset, np.linalg.norm(offset, axis=1) >= 0.001)
             bpy.data.meshes.remove(mesh)
 
         # load face data
-        class _DummyUV:
-            uv1 = uv2 = uv3 = mathutils.Vector((0, 1))
-            def __init__(self, uvs):
-                self.uv1,  self.uv2, self.uv3 = (v.uv for v in uvs)
-
-        _UVWrapper = lambda x: (_DummyUV(x[i:i+3]) for i in range(0, len(x), 3))
+        loop_totals = foreach_get(base_mesh.polygons, 'loop_total', np.int32)
+        if (loop_totals != 3).any():
+            raise Exception
+        loop_vertices = foreach_get(base_mesh.loops, 'vertex_index', np.int64)
+        material_indices = foreach_get(base_mesh.polygons, 'material_index', np.int32)
+        default_uvs = np.tile(np.array((0, 1), dtype=np.float32), (len(loop_vertices), 1))
 
-        materials = {}
         uv_data = base_mesh.uv_layers.active
         if uv_data:
-            uv_data = _UVWrapper(uv_data.data)
+            uvs = foreach_get(uv_data.data, 'uv', np.float32, 2)
         else:
-            uv_data = iter(lambda: _DummyUV, None)
-        face_seq = []
-        for face, uv in zip(base_mesh.polygons, uv_data):
-            if len(face.vertices) != 3:
-                raise Exception
-            idx = face.index * 3
-            n1, n2, n3 = loop_normals[idx:idx+3]
-            v1 = self.__convertFaceUVToVertexUV(face.vertices[0], uv.uv1, n1, base_vertices)
-            v2 = self.__convertFaceUVToVertexUV(face.vertices[1], uv.uv2, n2, base_vertices)
-            v3 = self.__convertFaceUVToVertexUV(face.vertices[2], uv.uv3, n3, base_vertices)
-
-            t = _Face([v1, v2, v3])
-            face_seq.append(t)
-            if face.material_index not in materials:
-                materials[face.material_index] = []
-            materials[face.material_index].append(t)
+            uvs = default_uvs
+        split_indices, uv_loops = _split_vertices(loop_vertices, (uvs, loop_normals), (0.001, 0.01))
+
+        materials = OrderedDict((i, np.flatnonzero(material_indices == i)) for i in np.unique(material_indices).tolist())
 
         # assign default material
         if len(base_mesh.materials) < len(materials):
@@ -1141,35 +1142,56 @@ class __PmxExporter:
         # export add UV
         bl_add_uvs = [i for i in base_mesh.uv_layers[1:] if not i.name.startswith('_')]
         self.__add_uv_count = max(self.__add_uv_count, len(bl_add_uvs))
+        add_uvs = [] # [(uvzw of the loops, the loop of every split vertex), ...]
         for uv_n, uv_tex in enumerate(bl_add_uvs):
             if uv_n > 3:
                 logging.warning(' * extra addUV%d+ are not supported', uv_n+1)
                 break
-            uv_data = _UVWrapper(uv_tex.data)
             zw_data = base_mesh.uv_layers.get('_'+uv_tex.name, None)
             logging.info(' # exporting addUV%d: %s [zw: %s]', uv_n+1, uv_tex.name, zw_data)
-            if zw_data:
-                zw_data = _UVWrapper(zw_data.data)
-            else:
-                zw_data = iter(lambda: _DummyUV, None)
-            rip_vertices_map = {}
-            for f, face, uv, zw in zip(face_seq, base_mesh.polygons, uv_data, zw_data):
-                vertices = [base_vertices[x] for x in face.vertices]
-                rip_vertices = [rip_vertices_map.setdefault(x, [x]) for x in f.vertices]
-                f.vertices[0] = self.__convertAddUV(f.vertices[0], uv.uv1, zw.uv1, uv_n, vertices[0], rip_vertices[0])
-                f.vertices[1] = self.__convertAddUV(f.vertices[1], uv.uv2, zw.uv2, uv_n, vertices[1], rip_vertices[1])
-                f.vertices[2] = self.__convertAddUV(f.vertices[2], uv.uv3, zw.uv3, uv_n, vertices[2], rip_vertices[2])
-
+            uv = foreach_get(uv_tex.data, 'uv', np.float32, 2)
+            zw = foreach_get(zw_data.data, 'uv', np.float32, 2) if zw_data else default_uvs
+            rip_indices, rip_loops = _split_vertices(split_indices, (uv, zw), (0.001, 0.001))
+            parents = split_indices[rip_loops]
+            uv_loops = uv_loops[parents]
+            add_uvs = [(uvzw, loops[parents]) for uvzw, loops in add_uvs]
+            add_uvs.append((np.column_stack((uv, zw)), rip_loops))
+            split_indices = rip_indices
+
+        base_indices = loop_vertices[uv_loops]
+        vertex_arrays = pmx.VertexArrays(len(base_indices), len(add_uvs))
+        vertex_arrays.co[:] = base_co[base_indices]
+        vertex_arrays.normal[:] = loop_normals[uv_loops]
+        vertex_arrays.uv[:] = self.flipUV_V(uvs[uv_loops])
+        for uv_n, (uvzw, loops) in enumerate(add_uvs):
+            vertex_arrays.additional_uvs[:, uv_n] = self.flipUV_V(uvzw[loops])
+        vertex_arrays.weight_type[:] = weight_type[base_indices]
+        vertex_arrays.bones[:] = bones[base_indices]
+        vertex_arrays.weights[:] = weights[base_indices]
+        vertex_arrays.edge_scale[:] = edge_scale[base_indices]
+        if sdef_counts > 0:
+            sdef = sdef_vertices[base_indices]
+            vertex_arrays.weight_type[sdef] = pmx.BoneWeight.SDEF
+            vertex_arrays.sdef_c[sdef], vertex_arrays.sdef_r0[sdef], vertex_arrays.sdef_r1[sdef] = sdef_data[:, base_indices[sdef]]
+            swap = sdef & (vertex_arrays.bones[:, 0] > vertex_arrays.bones[:, 1])
+            vertex_arrays.bones[swap, :2] = vertex_arrays.bones[swap, 1::-1]
+            vertex_arrays.weights[swap, :2] = 1.0 - weights[base_indices[swap], :2]
+
+        faces = split_indices.reshape(-1, 3)
         if not pmx_matrix.is_negative: # pmx.load/pmx.save reverse face vertices by default
-            for f in face_seq:
-                f.vertices.reverse()
+            faces = faces[:, ::-1]
 
-        return _Mesh(
+        mesh = _Mesh(
             base_mesh,
-            materials,
+            OrderedDict((i, faces[face_indices]) for i, face_indices in materials.items()),
             shape_key_names,
-            vertex_group_names,
-            base_mesh.materials)
+            base_mesh.materials,
+            vertex_arrays,
+            base_indices)
+        mesh.offsets = offsets
+        mesh.uv_offsets = uv_offsets
+        mesh.vertex_order = vertex_order
+        return mesh
 
     def __loadMeshData(self, meshObj, bone_map):
         show_only_shape_key = meshObj.show_only_shape_key
@@ -1231,7 +1253,7 @@ class __PmxExporter:
         nameMap = self.__exportBones(meshes)
 
         mesh_data = [self.__loadMeshData(i, nameMap) for i in meshes]
-        self.__exportMeshes(mesh_data, nameMap)
+        self.__exportMeshes(mesh_data)
         if args.get('sort_materials', False):
             self.__sortMaterials()
 
@@ -1252,6 +1274,8 @@ class __PmxExporter:
             base_folder = bpyutils.addon_preferences('base_texture_folder', '')
             self.__copy_textures(output_dir, import_folder or base_folder)
 
+        del mesh_data
+        self.__exported_vertices = []
         pmx.save(filepath, self.__model, add_uv_count=self.__add_uv_count)
 
 def export(filepath, **kwargs):
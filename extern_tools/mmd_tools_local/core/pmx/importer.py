@@ -5,6 +5,7 @@ import logging
 import time
 
 import bpy
+import numpy as np
 from mathutils import Vector, Matrix
 
 import mmd_tools_local.core.model as mmd_model
@@ -57,6 +58,7 @@ class PMXImporter:
         self.__imageTable = {}
 
         self.__sdefVertices = {} # pmx vertices
+        self.__sdefIndices = None # vertex indices of a columnar model
         self.__vertex_map = None
 
         self.__materialFaceCountTable = None
@@ -115,6 +117,10 @@ class PMXImporter:
         self.__importVertexGroup()
 
         pmxModel = self.__model
+        if pmxModel.columnar:
+            self.__importVertexArrays()
+            return
+
         pmx_vertices = pmxModel.vertices
         vertex_count = len(pmx_vertices)
         vertex_map = self.__vertex_map
@@ -129,40 +135,72 @@ class PMXImporter:
         mesh.vertices.add(count=vertex_count)
         mesh.vertices.foreach_set('co', tuple(i for pv in pmx_vertices for i in (Vector(pv.co).xzy * self.__scale)))
 
-        vertex_group_table = self.__vertexGroupTable
         vg_edge_scale = self.__meshObj.vertex_groups.new(name='mmd_edge_scale')
         vg_vertex_order = self.__meshObj.vertex_groups.new(name='mmd_vertex_order')
         for i, pv in enumerate(pmx_vertices):
-            pv_bones, pv_weights, idx = pv.weight.bones, pv.weight.weights, (i,)
-
-            vg_edge_scale.add(index=idx, weight=pv.edge_scale, type='REPLACE')
-            vg_vertex_order.add(index=idx, weight=i/vertex_count, type='REPLACE')
+            vg_vertex_order.add(index=(i,), weight=i/vertex_count, type='REPLACE')
 
+            pv_bones, pv_weights = pv.weight.bones, pv.weight.weights
             if isinstance(pv_weights, pmx.BoneWeightSDEF):
                 if pv_bones[0] > pv_bones[1]:
                     pv_bones.reverse()
                     pv_weights.weight = 1.0 - pv_weights.weight
                     pv_weights.r0, pv_weights.r1 = pv_weights.r1, pv_weights.r0
-                vertex_group_table[pv_bones[0]].add(index=idx, weight=pv_weights.weight, type='ADD')
-                vertex_group_table[pv_bones[1]].add(index=idx, weight=1.0-pv_weights.weight, type='ADD')
                 self.__sdefVertices[i] = pv
-            elif len(pv_bones) == 1:
-                bone_index = pv_bones[0]
-                if bone_index >= 0:
-                    vertex_group_table[bone_index].add(index=idx, weight=1.0, type='ADD')
-            elif len(pv_bones) == 2:
-                vertex_group_table[pv_bones[0]].add(index=idx, weight=pv_weights[0], type='ADD')
-                vertex_group_table[pv_bones[1]].add(index=idx, weight=1.0-pv_weights[0], type='ADD')
-            elif len(pv_bones) == 4:
-                for bone, weight in zip(pv_bones, pv_weights):
-                    vertex_group_table[bone].add(index=idx, weight=weight, type='ADD')
-            else:
-                raise Exception('unkown bone weight type.')
+        edge_scales = np.array([pv.edge_scale for pv in pmx_vertices], dtype=np.float32)
+        for weight, indices in self.__groupByWeight(np.arange(vertex_count), edge_scales).items():
+            vg_edge_scale.add(index=indices, weight=weight, type='REPLACE')
+
+        VertexGroupWeights.fromVertices(pmx_vertices).assign(self.__vertexGroupTable)
+
+        vg_edge_scale.lock_weight = True
+        vg_vertex_order.lock_weight = True
+
+    def __importVertexArrays(self):
+        arrays = self.__model.vertex_arrays
+        vertex_count = len(arrays)
+        if vertex_count < 1:
+            return
+
+        mesh = self.__meshObj.data
+        mesh.vertices.add(count=vertex_count)
+        mesh.vertices.foreach_set('co', (arrays.co[:, (0, 2, 1)] * self.__scale).ravel())
+
+        vertex_group_table = self.__vertexGroupTable
+        vg_edge_scale = self.__meshObj.vertex_groups.new(name='mmd_edge_scale')
+        vg_vertex_order = self.__meshObj.vertex_groups.new(name='mmd_vertex_order')
+        for weight, indices in self.__groupByWeight(np.arange(vertex_count), arrays.edge_scale).items():
+            vg_edge_scale.add(index=indices, weight=weight, type='REPLACE')
+        for i in range(vertex_count):
+            vg_vertex_order.add(index=(i,), weight=i/vertex_count, type='REPLACE')
+
+        sdef = arrays.weight_type == pmx.BoneWeight.SDEF
+        swapped = np.flatnonzero(sdef & (arrays.bones[:, 0] > arrays.bones[:, 1]))
+        arrays.bones[swapped, :2] = arrays.bones[swapped, 1::-1]
+        arrays.weights[swapped, :2] = arrays.weights[swapped, 1::-1]
+        r0 = arrays.sdef_r0[swapped]
+        arrays.sdef_r0[swapped] = arrays.sdef_r1[swapped]
+        arrays.sdef_r1[swapped] = r0
+        self.__sdefIndices = np.flatnonzero(sdef)
+
+        VertexGroupWeights.fromVertexArrays(arrays).assign(vertex_group_table)
 
         vg_edge_scale.lock_weight = True
         vg_vertex_order.lock_weight = True
 
+    @staticmethod
+    def __groupByWeight(indices, weights):
+        groups = collections.defaultdict(list)
+        for i, w in zip(indices.tolist(), weights.tolist()):
+            groups[w].append(i)
+        return groups
+
+
     def __storeVerticesSDEF(self):
+        if self.__model.columnar:
+            self.__storeVertexArraysSDEF()
+            return
+
         if len(self.__sdefVertices) < 1:
             return
 
@@ -177,6 +215,22 @@ class PMXImporter:
             sdefR1.data[i].co = Vector(w.r1).xzy * self.__scale
         logging.info('Stored %d SDEF vertices', len(self.__sdefVertices))
 
+    def __storeVertexArraysSDEF(self):
+        indices = self.__sdefIndices
+        if indices is None or len(indices) < 1:
+            return
+
+        arrays = self.__model.vertex_arrays
+        self.__createBasisShapeKey()
+        for name, values in (('mmd_sdef_c', arrays.sdef_c), ('mmd_sdef_r0', arrays.sdef_r0), ('mmd_sdef_r1', arrays.sdef_r1)):
+            shapeKey = self.__meshObj.shape_key_add(name=name)
+            co = np.empty(len(shapeKey.data)*3, dtype=np.float32)
+            shapeKey.data.foreach_get('co', co)
+            co = co.reshape(-1, 3)
+            co[indices] = values[indices][:, (0, 2, 1)] * self.__scale
+            shapeKey.data.foreach_set('co', co.ravel())
+        logging.info('Stored %d SDEF vertices', len(indices))
+
     def __importTextures(self):
         pmxModel = self.__model
 
@@ -554,6 +608,10 @@ class PMXImporter:
 
     def __importFaces(self):
         pmxModel = self.__model
+        if pmxModel.columnar:
+            self.__importFaceArrays()
+            return
+
         mesh = self.__meshObj.data
         vertex_map = self.__vertex_map
 
@@ -602,6 +660,59 @@ class PMXImporter:
                 add_zw = uv_layers[add_zw.name]
                 add_zw.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in zw_table[i]))
 
+    def __importFaceArrays(self):
+        pmxModel = self.__model
+        mesh = self.__meshObj.data
+        arrays = pmxModel.vertex_arrays
+        face_count = len(pmxModel.face_array)
+
+        loop_indices = pmxModel.face_array.ravel()
+        material_indices = np.repeat(np.arange(len(self.__materialFaceCountTable), dtype=np.int32), self.__materialFaceCountTable)
+
+        mesh.loops.add(face_count*3)
+        mesh.loops.foreach_set('vertex_index', loop_indices)
+
+        mesh.polygons.add(face_count)
+        mesh.polygons.foreach_set('loop_start', np.arange(0, face_count*3, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('loop_total', np.full(face_count, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('use_smooth', (True,)*face_count)
+        mesh.polygons.foreach_set('material_index', material_indices)
+
+        def flip_uv(uv):
+            uv = uv.copy()
+            uv[:, 1] = 1.0 - uv[:, 1]
+            return uv.ravel()
+
+        uv_textures, uv_layers = getattr(mesh, 'uv_textures', mesh.uv_layers), mesh.uv_layers
+        uv_tex = uv_textures.new()
+        uv_layer = uv_layers[uv_tex.name]
+        uv_layer.data.foreach_set('uv', flip_uv(arrays.uv[loop_indices]))
+
+        if hasattr(mesh, 'uv_textures'):
+            for bf, mi in zip(uv_tex.data, material_indices.tolist()):
+                bf.image = self.__imageTable.get(mi, None)
+
+        if pmxModel.header and pmxModel.header.additional_uvs:
+            logging.info('Importing %d additional uvs', pmxModel.header.additional_uvs)
+            zw_data_map = collections.OrderedDict()
+            for i in range(pmxModel.header.additional_uvs):
+                add_uv = uv_layers[uv_textures.new(name='UV'+str(i+1)).name]
+                logging.info(' - %s...(uv channels)', add_uv.name)
+                uvzw = arrays.additional_uvs[loop_indices, i]
+                add_uv.data.foreach_set('uv', flip_uv(uvzw[:, :2]))
+                if not np.any(arrays.additional_uvs[:, i, 2:]):
+                    logging.info('\t- zw are all zeros: %s', add_uv.name)
+                else:
+                    zw_data_map['_'+add_uv.name] = flip_uv(uvzw[:, 2:])
+            for name, zw_data in zw_data_map.items():
+                logging.info(' - %s...(zw channels of %s)', name, name[1:])
+                add_zw = uv_textures.new(name=name)
+                if add_zw is None:
+                    logging.warning('\t* Lost zw channels')
+                    continue
+                add_zw = uv_layers[add_zw.name]
+                add_zw.data.foreach_set('uv', zw_data)
+
     def __importVertexMorphs(self):
         mmd_root = self.__root.mmd_root
         categories = self.CATEGORIES
@@ -731,7 +842,12 @@ class PMXImporter:
             logging.info(' * No support for custom normals!!')
             return
         logging.info('Setting custom normals...')
-        if self.__vertex_map:
+        if self.__model.columnar:
+            normals = self.__model.vertex_arrays.normal[:, (0, 2, 1)]
+            lengths = np.linalg.norm(normals, axis=1)
+            lengths[lengths == 0] = 1
+            mesh.normals_split_custom_set_from_vertices((normals / lengths[:, None]).tolist())
+        elif self.__vertex_map:
             verts, faces = self.__model.vertices, self.__model.faces
             custom_normals = [(Vector(verts[i].normal).xzy).normalized() for f in faces for i in f]
             mesh.normals_split_custom_set(custom_normals)
@@ -762,7 +878,7 @@ class PMXImporter:
         if 'pmx' in args:
             self.__model = args['pmx']
         else:
-            self.__model = pmx.load(args['filepath'])
+            self.__model = pmx.load(args['filepath'], columnar=True)
         self.__fixRepeatedMorphName()
 
         types = args.get('types', set())
@@ -791,6 +907,7 @@ class PMXImporter:
             if clean_model:
                 _PMXCleaner.clean(self.__model, 'MORPHS' not in types)
             if remove_doubles:
+                self.__model.unpackArrays() # removing doubles works on the vertex objects
                 self.__vertex_map = _PMXCleaner.remove_doubles(self.__model, 'MORPHS' not in types)
             self.__createMeshObject()
             self.__importVertices()
@@ -849,10 +966,137 @@ class PMXImporter:
         logging.info('****************************************')
 
 
+class VertexGroupWeights:
+    """ The bone weights of the vertices as flat (vertex index, bone index, weight) arrays.
+
+    assign() buckets them by (bone, weight) and calls add() once per bucket, while
+    assignPerVertex() calls add() for every single weight like the importer used to do.
+    Weights of negative bone indices are skipped.
+    """
+    # the amount of used bones of BDEF1, BDEF2, BDEF4 and SDEF
+    BONE_COUNTS = (1, 2, 4, 2)
+
+    def __init__(self, indices, bones, weights):
+        self.indices = indices
+        self.bones = bones
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.indices)
+
+    @classmethod
+    def fromVertexArrays(cls, arrays):
+        bone_counts = np.array(cls.BONE_COUNTS)[arrays.weight_type]
+        used = (np.arange(4) < bone_counts[:, None]) & (arrays.bones >= 0)
+        vertices, slots = np.nonzero(used)
+        return cls(vertices.astype(np.int32), arrays.bones[vertices, slots], arrays.weights[vertices, slots])
+
+    @classmethod
+    def fromVertices(cls, pmx_vertices):
+        indices, bones, weights = [], [], []
+        for i, pv in enumerate(pmx_vertices):
+            pv_bones, pv_weights = pv.weight.bones, pv.weight.weights
+            if isinstance(pv_weights, pmx.BoneWeightSDEF):
+                pv_weights = (pv_weights.weight, 1.0-pv_weights.weight)
+            elif len(pv_bones) == 1:
+                pv_weights = (1.0,)
+            elif len(pv_bones) == 2:
+                pv_weights = (pv_weights[0], 1.0-pv_weights[0])
+            elif len(pv_bones) != 4:
+                raise Exception('unkown bone weight type.')
+            for bone, weight in zip(pv_bones, pv_weights):
+                if bone >= 0:
+                    indices.append(i)
+                    bones.append(bone)
+                    weights.append(weight)
+        return cls(np.array(indices, dtype=np.int32), np.array(bones, dtype=np.int32), np.array(weights, dtype=np.float32))
+
+    def buckets(self):
+        """ Yields (bone, weight, vertex indices) for every distinct pair of bone and weight.
+        """
+        # lexsort is stable, so the vertex indices stay in order inside each bucket
+        order = np.lexsort((self.weights, self.bones))
+        bones, weights, indices = self.bones[order], self.weights[order], self.indices[order]
+        starts = np.flatnonzero(np.concatenate(([True], (bones[1:] != bones[:-1]) | (weights[1:] != weights[:-1]))))
+        ends = np.append(starts[1:], len(order))
+        for start, end, bone, weight in zip(starts.tolist(), ends.tolist(), bones[starts].tolist(), weights[starts].tolist()):
+            yield bone, weight, indices[start:end].tolist()
+
+    def assign(self, vertex_groups):
+        for bone, weight, indices in self.buckets():
+            vertex_groups[bone].add(index=indices, weight=weight, type='ADD')
+
+    def assignPerVertex(self, vertex_groups):
+        for i, bone, weight in zip(self.indices.tolist(), self.bones.tolist(), self.weights.tolist()):
+            vertex_groups[bone].add(index=(i,), weight=weight, type='ADD')
+
+
+def benchmark_vertex_group_weights(vertex_count=100000, bone_count=200, seed=0):
+    """ Compares assignPerVertex() and assign() of VertexGroupWeights on generated models
+    which only use one weight type each. The BDEF2/SDEF weights are multiples of 0.05 and the
+    BDEF4 weights multiples of 0.01, which is about what the usual MMD models have.
+
+    @return a dict of weight type name: (per vertex seconds, grouped seconds, bucket count)
+    """
+    rng = np.random.RandomState(seed)
+    results = {}
+    for weight_type, type_name in pmx.BoneWeight.TYPES:
+        arrays = pmx.VertexArrays(vertex_count)
+        arrays.weight_type[:] = weight_type
+        bone_count_used = VertexGroupWeights.BONE_COUNTS[weight_type]
+        arrays.bones[:, :bone_count_used] = rng.randint(0, bone_count, (vertex_count, bone_count_used))
+        if weight_type == pmx.BoneWeight.BDEF1:
+            arrays.weights[:, 0] = 1
+        elif weight_type == pmx.BoneWeight.BDEF4:
+            weights = rng.randint(1, 100, (vertex_count, 4)).astype(np.float32)
+            arrays.weights[:] = np.round(weights / weights.sum(axis=1)[:, None], 2)
+        else:
+            arrays.weights[:, 0] = rng.randint(0, 21, vertex_count) / 20.0
+            arrays.weights[:, 1] = 1 - arrays.weights[:, 0]
+        weights = VertexGroupWeights.fromVertexArrays(arrays)
+
+        times = []
+        for assign in (weights.assignPerVertex, weights.assign):
+            mesh = bpy.data.meshes.new(name='mmd_weights_benchmark')
+            mesh.vertices.add(count=vertex_count)
+            obj = bpy.data.objects.new(name='mmd_weights_benchmark', object_data=mesh)
+            vertex_groups = [obj.vertex_groups.new(name=str(i)) for i in range(bone_count)]
+            start_time = time.time()
+            assign(vertex_groups)
+            times.append(time.time() - start_time)
+            bpy.data.objects.remove(obj)
+            bpy.data.meshes.remove(mesh)
+
+        bucket_count = sum(1 for x in weights.buckets())
+        results[type_name] = (times[0], times[1], bucket_count)
+        print('VertexGroupWeights:benchmark: %s %d weights, per vertex %.4f vs grouped %.4f (%d buckets)'%(
+            type_name, len(weights), times[0], times[1], bucket_count))
+    return results
+
+
 class _PMXCleaner:
     @classmethod
     def clean(cls, pmx_model, mesh_only):
         logging.info('Cleaning PMX data...')
+        if pmx_model.columnar:
+            index_map = cls.__clean_pmx_arrays(pmx_model)
+        else:
+            index_map = cls.__clean_pmx_lists(pmx_model)
+
+        if mesh_only:
+            logging.info('   - Done (mesh only)!!')
+            return
+
+        if index_map is not None:
+            # clean vertex/uv morphs
+            def __update_index(x):
+                x.index = index_map.get(x.index, None)
+                return x.index is not None
+            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+        logging.info('   - Done!!')
+
+    @classmethod
+    def __clean_pmx_lists(cls, pmx_model):
         pmx_faces = pmx_model.faces
         pmx_vertices = pmx_model.vertices
 
@@ -877,17 +1121,44 @@ class _PMXCleaner:
             for f in pmx_faces:
                 f[:] = [index_map[v] for v in f]
 
-        if mesh_only:
-            logging.info('   - Done (mesh only)!!')
-            return
+        return None if is_index_clean else index_map
 
-        if not is_index_clean:
-            # clean vertex/uv morphs
-            def __update_index(x):
-                x.index = index_map.get(x.index, None)
-                return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
-        logging.info('   - Done!!')
+    @staticmethod
+    def __clean_pmx_arrays(pmx_model):
+        pmx_faces = pmx_model.face_array
+        pmx_materials = pmx_model.materials
+        vertex_arrays = pmx_model.vertex_arrays
+
+        # clean face/vertex, the same as __clean_pmx_faces with frozenset(f) as the face key
+        material_ids = np.repeat(np.arange(len(pmx_materials)), [int(mat.vertex_count/3) for mat in pmx_materials])[:len(pmx_faces)]
+        sorted_faces = np.sort(pmx_faces[:len(material_ids)], axis=1)
+        valid = np.flatnonzero((sorted_faces[:, 0] != sorted_faces[:, 1]) & (sorted_faces[:, 1] != sorted_faces[:, 2]))
+        # lexsort is stable, so the first face of each group of duplicates comes first
+        order = valid[np.lexsort((sorted_faces[valid, 2], sorted_faces[valid, 1], sorted_faces[valid, 0], material_ids[valid]))]
+        keys = np.column_stack((material_ids[order], sorted_faces[order]))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+        used_faces = np.sort(order[is_first])
+
+        for mat, count in zip(pmx_materials, np.bincount(material_ids[used_faces], minlength=len(pmx_materials)).tolist()):
+            mat.vertex_count = count * 3
+        if len(used_faces) == len(pmx_faces):
+            logging.info('   (faces is clean)')
+        else:
+            logging.warning('   - removed %d faces', len(pmx_faces)-len(used_faces))
+            pmx_faces = pmx_model.face_array = pmx_faces[used_faces]
+
+        used_vertices = np.unique(pmx_faces)
+        if len(used_vertices) == len(vertex_arrays):
+            logging.info('   (vertices is clean)')
+            return None
+
+        logging.warning('   - removed %d vertices', len(vertex_arrays)-len(used_vertices))
+        index_array = np.zeros(len(vertex_arrays), dtype=np.int32)
+        index_array[used_vertices] = np.arange(len(used_vertices), dtype=np.int32)
+        pmx_model.vertex_arrays = vertex_arrays.take(used_vertices)
+        pmx_model.face_array = index_array[pmx_faces]
+        return dict(zip(used_vertices.tolist(), range(len(used_vertices))))
 
     @classmethod
     def remove_doubles(cls, pmx_model, mesh_only):
@@ -19,6 +19,20 @@ def collisionShape(shape_type):
     return ('SPHERE', 'BOX', 'CAPSULE')[shape_type]
 
 
+COLLISION_LAYER_COUNT = 20
+
+def getCollisionLayers(rigid_body):
+    if bpy.app.version < (2, 80, 0):
+        return list(rigid_body.collision_groups)
+    return list(rigid_body.collision_collections)
+
+def setCollisionLayers(rigid_body, layers):
+    if bpy.app.version < (2, 80, 0):
+        rigid_body.collision_groups = layers
+    else:
+        rigid_body.collision_collections = layers
+
+
 def setRigidBodyWorldEnabled(enable):
     rigidbody_world = bpy.context.scene.rigidbody_world
     if rigidbody_world is None:
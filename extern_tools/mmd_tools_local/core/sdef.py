@@ -30,13 +30,31 @@ class FnSDEF():
         return False
 
     @classmethod
-    def __check_bone_update(cls, obj, bone0, bone1):
+    def __updated_bone_pairs(cls, obj):
+        """ Returns the bone pairs of g_verts whose bones moved since they were updated last time.
+
+        Each bone has a version stamp which is increased when its matrix changes, and
+        each bone pair records the versions of its bones when its vertices are updated.
+        """
         check = cls.g_bone_check[hash(obj)]
-        key = (hash(bone0), hash(bone1))
-        if key not in check or (bone0.matrix, bone1.matrix) != check[key]:
-            check[key] = (bone0.matrix.copy(), bone1.matrix.copy())
-            return True
-        return False
+        bone_versions = check.setdefault('bones', {})
+        pair_versions = check.setdefault('pairs', {})
+        stamps = {}
+        updated = []
+        for key, value in cls.g_verts[hash(obj)].items():
+            for bone in value[:2]:
+                bone_key = hash(bone)
+                if bone_key not in stamps:
+                    matrix, version = bone_versions.get(bone_key, (None, 0))
+                    if matrix is None or matrix != bone.matrix:
+                        version += 1
+                        bone_versions[bone_key] = (bone.matrix.copy(), version)
+                    stamps[bone_key] = version
+            versions = (stamps[key[0]], stamps[key[1]])
+            if pair_versions.get(key) != versions:
+                pair_versions[key] = versions
+                updated.append(value)
+        return updated
 
     @classmethod
     def __sdef_muted(cls, obj, shapekey):
@@ -95,8 +113,47 @@ class FnSDEF():
                         vertices[key] = (bone_map[bgs[0].group], bone_map[bgs[1].group], [], [])
                     vertices[key][2].append((i, w0, w1, vd[i].co-c, (c+r0)/2, (c+r1)/2))
                     vertices[key][3].append(i)
+        for key, (bone0, bone1, sdef_data, vids) in vertices.items():
+            vertices[key] = (bone0, bone1, sdef_data, vids, cls.__sdef_arrays(sdef_data))
         return vertices
 
+    @staticmethod
+    def __sdef_arrays(sdef_data):
+        """ Converts sdef_data to the arrays (vids, w0, w1, pos_c, cr0, cr1) used by __sdef_kernel().
+        """
+        vids, w0, w1, pos_c, cr0, cr1 = zip(*sdef_data)
+        vectors = lambda x: np.array([tuple(v) for v in x], dtype=np.float32).reshape(-1, 3)
+        weights = lambda x: np.array(x, dtype=np.float32).reshape(-1, 1)
+        return (np.array(vids, dtype=np.int64), weights(w0), weights(w1), vectors(pos_c), vectors(cr0), vectors(cr1))
+
+    @staticmethod
+    def __sdef_kernel(mat0, mat1, rot0, rot1, arrays, scales=None):
+        """ Computes the SDEF positions of all vertices of a bone pair at once.
+
+        It is the same as the per vertex loop of driver_function():
+        matmul(mat_rot, pos_c) + matmul(mat0, cr0)*w0 + matmul(mat1, cr1)*w1
+        where mat_rot is the rotation matrix of (rot0*w0 + rot1*w1).normalized(),
+        scaled by s0*w0 + s1*w1 if scales is (s0, s1).
+        """
+        vids, w0, w1, pos_c, cr0, cr1 = arrays
+        q = w0 * np.array(rot0, dtype=np.float32) + w1 * np.array(rot1, dtype=np.float32)
+        q /= np.linalg.norm(q, axis=1)[:, None]
+        w, x, y, z = q.T
+        mat_rot = np.stack((
+            1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y),
+            2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x),
+            2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y),
+            ), axis=1).reshape(-1, 3, 3)
+        if scales is not None:
+            s0, s1 = scales
+            mat_rot *= (w0 * np.array(s0, dtype=np.float32) + w1 * np.array(s1, dtype=np.float32))[:, None, :]
+        mat0 = np.array(mat0, dtype=np.float32)
+        mat1 = np.array(mat1, dtype=np.float32)
+        co = np.matmul(mat_rot, pos_c[:, :, None])[:, :, 0]
+        co += w0 * (cr0.dot(mat0[:3, :3].T) + mat0[:3, 3])
+        co += w1 * (cr1.dot(mat1[:3, :3].T) + mat1[:3, 3])
+        return co
+
     @classmethod
     def driver_function_wrap(cls, obj_name, bulk_update, use_skip, use_scale):
         obj = bpy.data.objects[obj_name]
@@ -110,13 +167,16 @@ class FnSDEF():
         if cls.__sdef_muted(obj, shapekey):
             return 0.0
 
+        if use_skip:
+            bone_pairs = cls.__updated_bone_pairs(obj)
+        else:
+            bone_pairs = cls.g_verts[hash(obj)].values()
+
         if not bulk_update:
             shapekey_data = shapekey.data
             if use_scale:
                 # with scale
-                for bone0, bone1, sdef_data, vids in cls.g_verts[hash(obj)].values():
-                    if use_skip and not cls.__check_bone_update(obj, bone0, bone1):
-                        continue
+                for bone0, bone1, sdef_data, vids, arrays in bone_pairs:
                     mat0 = matmul(bone0.matrix, bone0.bone.matrix_local.inverted())
                     mat1 = matmul(bone1.matrix, bone1.bone.matrix_local.inverted())
                     rot0 = mat0.to_quaternion()
@@ -130,9 +190,7 @@ class FnSDEF():
                         shapekey_data[vid].co = matmul(mat_rot, pos_c) + matmul(mat0, cr0)*w0 + matmul(mat1, cr1)*w1
             else:
                 # default
-                for bone0, bone1, sdef_data, vids in cls.g_verts[hash(obj)].values():
-                    if use_skip and not cls.__check_bone_update(obj, bone0, bone1):
-                        continue
+                for bone0, bone1, sdef_data, vids, arrays in bone_pairs:
                     mat0 = matmul(bone0.matrix, bone0.bone.matrix_local.inverted())
                     mat1 = matmul(bone1.matrix, bone1.bone.matrix_local.inverted())
                     rot0 = mat0.to_quaternion()
@@ -144,35 +202,18 @@ class FnSDEF():
                         shapekey_data[vid].co = matmul(mat_rot, pos_c) + matmul(mat0, cr0)*w0 + matmul(mat1, cr1)*w1
         else: # bulk update
             shapekey_data = cls.g_shapekey_data[hash(obj)]
-            if use_scale:
-                # scale & bulk update
-                for bone0, bone1, sdef_data, vids in cls.g_verts[hash(obj)].values():
-                    if use_skip and not cls.__check_bone_update(obj, bone0, bone1):
-                        continue
-                    mat0 = matmul(bone0.matrix, bone0.bone.matrix_local.inverted())
-                    mat1 = matmul(bone1.matrix, bone1.bone.matrix_local.inverted())
-                    rot0 = mat0.to_quaternion()
-                    rot1 = mat1.to_quaternion()
-                    if rot1.dot(rot0) < 0:
-                        rot1 = -rot1
-                    s0, s1 = mat0.to_scale(), mat1.to_scale()
-                    def scale(mat_rot, w0, w1):
-                        s = s0*w0 + s1*w1
-                        return matmul(mat_rot, Matrix([(s[0],0,0), (0,s[1],0), (0,0,s[2])]))
-                    shapekey_data[vids] = [matmul(scale((rot0*w0 + rot1*w1).normalized().to_matrix(), w0, w1), pos_c) + matmul(mat0, cr0)*w0 + matmul(mat1, cr1)*w1 for vid, w0, w1, pos_c, cr0, cr1 in sdef_data]
-            else:
-                # bulk update
-                for bone0, bone1, sdef_data, vids in cls.g_verts[hash(obj)].values():
-                    if use_skip and not cls.__check_bone_update(obj, bone0, bone1):
-                        continue
-                    mat0 = matmul(bone0.matrix, bone0.bone.matrix_local.inverted())
-                    mat1 = matmul(bone1.matrix, bone1.bone.matrix_local.inverted())
-                    rot0 = mat0.to_quaternion()
-                    rot1 = mat1.to_quaternion()
-                    if rot1.dot(rot0) < 0:
-                        rot1 = -rot1
-                    shapekey_data[vids] = [matmul((rot0*w0 + rot1*w1).normalized().to_matrix(), pos_c) + matmul(mat0, cr0)*w0 + matmul(mat1, cr1)*w1 for vid, w0, w1, pos_c, cr0, cr1 in sdef_data]
-            shapekey.data.foreach_set('co', shapekey_data.reshape(3 * len(shapekey.data)))
+            for bone0, bone1, sdef_data, vids, arrays in bone_pairs:
+                mat0 = matmul(bone0.matrix, bone0.bone.matrix_local.inverted())
+                mat1 = matmul(bone1.matrix, bone1.bone.matrix_local.inverted())
+                rot0 = mat0.to_quaternion()
+                rot1 = mat1.to_quaternion()
+                if rot1.dot(rot0) < 0:
+                    rot1 = -rot1
+                scales = (mat0.to_scale(), mat1.to_scale()) if use_scale else None
+                shapekey_data[arrays[0]] = cls.__sdef_kernel(mat0, mat1, rot0, rot1, arrays, scales)
+            if bone_pairs:
+                # the buffer keeps the results of the other bone pairs
+                shapekey.data.foreach_set('co', shapekey_data.reshape(3 * len(shapekey.data)))
 
         return 1.0 # shapkey value
 
@@ -184,22 +225,48 @@ class FnSDEF():
             bpy.app.driver_namespace['mmd_sdef_driver_wrap'] = cls.driver_function_wrap
 
     BENCH_LOOP=10
+    BENCH_MODES = {
+        # mode: (bulk_update, use_skip, use_scale)
+        'NORMAL': (False, False, False),
+        'NORMAL_SCALE': (False, False, True),
+        'BULK': (True, False, False),
+        'BULK_SCALE': (True, False, True),
+        'SKIP': (True, True, False), # the cost of a frame without any bone changes
+        }
+
+    @classmethod
+    def benchmark(cls, obj, modes=None, loop=None):
+        """ Time the driver function of a binded object.
+
+        Returns a dict of {mode: seconds per frame} for the modes of BENCH_MODES.
+        """
+        shapekey = obj.data.shape_keys.key_blocks[cls.SHAPEKEY_NAME]
+        loop = loop or cls.BENCH_LOOP
+        results = {}
+        for mode in (modes or sorted(cls.BENCH_MODES.keys())):
+            bulk_update, use_skip, use_scale = cls.BENCH_MODES[mode]
+            # warmed up
+            cls.driver_function(shapekey, obj.name, bulk_update=bulk_update, use_skip=use_skip, use_scale=use_scale)
+            # benchmark
+            t = time.time()
+            for i in range(loop):
+                cls.driver_function(shapekey, obj.name, bulk_update=bulk_update, use_skip=use_skip, use_scale=use_scale)
+            results[mode] = (time.time() - t) / loop
+        return results
+
+    @staticmethod
+    def select_bulk_update(results, use_scale):
+        """ Returns the bulk_update value of the faster mode in benchmark results """
+        if use_scale:
+            return results['NORMAL_SCALE'] > results['BULK_SCALE']
+        return results['NORMAL'] > results['BULK']
+
     @classmethod
     def __get_benchmark_result(cls, obj, shapkey, use_scale, use_skip):
-        # warmed up
-        cls.driver_function(shapkey, obj.name, bulk_update=True, use_skip=False, use_scale=use_scale)
-        cls.driver_function(shapkey, obj.name, bulk_update=False, use_skip=False, use_scale=use_scale)
-        # benchmark
-        t = time.time()
-        for i in range(cls.BENCH_LOOP):
-            cls.driver_function(shapkey, obj.name, bulk_update=False, use_skip=False, use_scale=use_scale)
-        default_time = time.time() - t
-        t = time.time()
-        for i in range(cls.BENCH_LOOP):
-            cls.driver_function(shapkey, obj.name, bulk_update=True, use_skip=False, use_scale=use_scale)
-        bulk_time = time.time() - t
-        result = default_time > bulk_time
-        print('FnSDEF:benchmark: default %.4f vs bulk_update %.4f => bulk_update=%s' % (default_time, bulk_time, result))
+        modes = ('NORMAL_SCALE', 'BULK_SCALE') if use_scale else ('NORMAL', 'BULK')
+        results = cls.benchmark(obj, modes)
+        result = cls.select_bulk_update(results, use_scale)
+        print('FnSDEF:benchmark: default %.4f vs bulk_update %.4f => bulk_update=%s' % (results[modes[0]], results[modes[1]], result))
         return result
 
     @classmethod
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+""" SDEF benchmark suite
+
+Times the modes of the SDEF driver (FnSDEF.BENCH_MODES) on synthetic meshes of
+increasing vertex counts or on the meshes of MMD models, and stores the faster
+mode on the root object of a model, so binding in "Auto" mode is deterministic.
+
+Command line usage (with the add-on enabled):
+
+    blender -b --python sdef_benchmark.py -- --counts 1000 10000 100000
+    blender -b model.blend --python sdef_benchmark.py -- --models --store
+"""
+
+import sys
+
+import bpy
+import numpy as np
+
+from mmd_tools_local import bpyutils
+from mmd_tools_local.core.model import Model
+from mmd_tools_local.core.sdef import FnSDEF
+
+VERTEX_COUNTS = (1000, 10000, 100000)
+PROPERTY_NAME = 'mmd_sdef_benchmark'
+
+
+def create_synthetic_mesh(vertex_count, bone_count=8, name='mmd_sdef_benchmark'):
+    """ Create a mesh object with SDEF data on a chain of bone_count bones.
+
+    Each vertex is weighted to two adjacent bones, so every vertex is a SDEF vertex.
+    """
+    bone_count = max(2, bone_count)
+    arm_obj = bpyutils.createObject(name=name, object_data=bpy.data.armatures.new(name=name))
+    with bpyutils.edit_object(arm_obj) as data:
+        for i in range(bone_count):
+            bone = data.edit_bones.new(name='bone%d'%i)
+            bone.head = (0, i, 0)
+            bone.tail = (0, i+1, 0)
+
+    t = np.linspace(0, bone_count-1, vertex_count, endpoint=False)
+    bone0 = t.astype(int)
+    w1 = (np.floor((t - bone0) * 8) + 0.5) / 8
+    k = np.arange(vertex_count)
+    co = np.column_stack((np.sin(k)*0.5, t, np.cos(k)*0.5)).astype(np.float32)
+    sdef_c = np.column_stack((np.zeros(vertex_count), bone0 + 0.5, np.zeros(vertex_count))).astype(np.float32)
+
+    mesh = bpy.data.meshes.new(name=name)
+    mesh.vertices.add(vertex_count)
+    mesh.vertices.foreach_set('co', co.ravel())
+    obj = bpyutils.createObject(name=name, object_data=mesh)
+    vertex_groups = [obj.vertex_groups.new(name='bone%d'%i) for i in range(bone_count)]
+    for bones, weights in ((bone0, 1 - w1), (bone0 + 1, w1)):
+        for bone, weight in set(zip(bones.tolist(), weights.tolist())):
+            vertex_groups[bone].add(k[(bones == bone) & (weights == weight)].tolist(), weight, 'REPLACE')
+    mod = obj.modifiers.new(name='mmd_bone_order_override', type='ARMATURE')
+    mod.object = arm_obj
+
+    obj.shape_key_add(name='Basis', from_mix=False)
+    for key, offset in (('mmd_sdef_c', 0), ('mmd_sdef_r0', -0.5), ('mmd_sdef_r1', 0.5)):
+        kb = obj.shape_key_add(name=key, from_mix=False)
+        kb.data.foreach_set('co', (sdef_c + np.array((0, offset, 0), dtype=np.float32)).ravel())
+    return obj
+
+def remove_synthetic_mesh(obj):
+    arm_obj = obj.modifiers['mmd_bone_order_override'].object
+    FnSDEF.unbind(obj)
+    mesh, armature = obj.data, arm_obj.data
+    bpy.data.objects.remove(obj, do_unlink=True)
+    bpy.data.objects.remove(arm_obj, do_unlink=True)
+    bpy.data.meshes.remove(mesh)
+    bpy.data.armatures.remove(armature)
+
+def benchmark_synthetic(vertex_counts=VERTEX_COUNTS, bone_count=8, loop=None):
+    """ Returns a list of (vertex count, {mode: seconds per frame}) """
+    rows = []
+    for count in vertex_counts:
+        obj = create_synthetic_mesh(count, bone_count)
+        try:
+            FnSDEF.bind(obj, bulk_update=False)
+            rows.append((count, FnSDEF.benchmark(obj, loop=loop)))
+        finally:
+            remove_synthetic_mesh(obj)
+    return rows
+
+def benchmark_model(root, loop=None):
+    """ Returns (SDEF vertex count, {mode: seconds per frame}) of all meshes of a model.
+
+    Meshes which are not binded are binded temporarily.
+    """
+    count, total = 0, {}
+    for obj in Model(root).meshes():
+        if not FnSDEF.has_sdef_data(obj):
+            continue
+        binded = FnSDEF.SHAPEKEY_NAME in obj.data.shape_keys.key_blocks
+        if not binded:
+            FnSDEF.bind(obj, bulk_update=False)
+        try:
+            results = FnSDEF.benchmark(obj, loop=loop)
+            count += sum(len(v[3]) for v in FnSDEF.g_verts.get(hash(obj), {}).values())
+        finally:
+            if not binded:
+                FnSDEF.unbind(obj)
+        for mode, cost in results.items():
+            total[mode] = total.get(mode, 0) + cost
+    return count, total
+
+def store_results(root, results):
+    """ Store benchmark results and the faster modes on the root object of a model """
+    root[PROPERTY_NAME] = {
+        'bulk_update': FnSDEF.select_bulk_update(results, use_scale=False),
+        'bulk_update_scale': FnSDEF.select_bulk_update(results, use_scale=True),
+        'frame_cost': results,
+        }
+
+def load_bulk_update(root, use_scale):
+    """ Returns the stored bulk_update value of a model, or None if it was not benchmarked """
+    data = root.get(PROPERTY_NAME) if root else None
+    if data is None:
+        return None
+    return bool(data['bulk_update_scale' if use_scale else 'bulk_update'])
+
+def format_results(rows):
+    """ Format a list of (vertex count, results) as a table of milliseconds per frame """
+    modes = sorted(FnSDEF.BENCH_MODES.keys())
+    lines = ['%10s %s  (ms per frame)'%('vertices', ' '.join('%12s'%m for m in modes))]
+    for count, results in rows:
+        lines.append('%10d %s'%(count, ' '.join('%12.3f'%(results[m]*1000) for m in modes)))
+    return lines
+
+def main(argv=None):
+    import argparse
+    if argv is None:
+        argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(prog='sdef_benchmark', description='Benchmark the modes of the MMD SDEF driver')
+    parser.add_argument('--counts', type=int, nargs='+', default=VERTEX_COUNTS, help='vertex counts of synthetic meshes')
+    parser.add_argument('--bones', type=int, default=8, help='bone count of synthetic meshes')
+    parser.add_argument('--loop', type=int, default=FnSDEF.BENCH_LOOP, help='frames to evaluate for each mode')
+    parser.add_argument('--models', action='store_true', help='benchmark the models of the opened .blend file')
+    parser.add_argument('--store', action='store_true', help='store the results on the models and save the .blend file')
+    args = parser.parse_args(argv)
+
+    if not args.models:
+        for line in format_results(benchmark_synthetic(args.counts, args.bones, args.loop)):
+            print(line)
+        return
+
+    for root in [i for i in bpy.data.objects if i.mmd_type == 'ROOT']:
+        count, results = benchmark_model(root, args.loop)
+        if not results:
+            print('%s: no SDEF data'%root.name)
+            continue
+        print(root.name)
+        for line in format_results([(count, results)]):
+            print(line)
+        if args.store:
+            store_results(root, results)
+    if args.store:
+        bpy.ops.wm.save_mainfile()
+
+if __name__ == '__main__':
+    main()
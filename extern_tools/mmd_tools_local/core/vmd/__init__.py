@@ -2,6 +2,8 @@
 import struct
 import collections
 
+import numpy as np
+
 class InvalidFileError(Exception):
     pass
 
@@ -35,6 +37,9 @@ class Header:
 
 
 class BoneFrameKey:
+    # the record of a keyframe without the bone name, used to load/save all keyframes at once
+    DTYPE = np.dtype([('frame_number', '<u4'), ('location', '<f4', (3,)), ('rotation', '<f4', (4,)), ('interp', 'i1', (64,))])
+
     def __init__(self):
         self.frame_number = 0
         self.location = []
@@ -62,6 +67,9 @@ class BoneFrameKey:
 
 
 class ShapeKeyFrameKey:
+    # the record of a keyframe without the shape key name, used to load/save all keyframes at once
+    DTYPE = np.dtype([('frame_number', '<u4'), ('weight', '<f4')])
+
     def __init__(self):
         self.frame_number = 0
         self.weight = 0.0
@@ -207,10 +215,71 @@ class PropertyFrameKey:
             )
 
 
+class FrameKeyArrays:
+    """ The keyframes of one bone or shape key as a numpy structured array sorted by frame number.
+
+    The fields are the attributes of the frame key class, e.g. records['rotation'] of bone keyframes
+    is an array of shape (n, 4). It can be used like the list of frame keys it replaces, the frame key
+    objects are created when accessed, so changing them doesn't change the arrays.
+    """
+    def __init__(self, frame_class, records):
+        self.frame_class = frame_class
+        self.records = records
+
+    @classmethod
+    def fromFrameKeys(cls, frame_class, frameKeys):
+        """ Creates the sorted arrays of a list of frame key objects.
+        """
+        records = np.zeros(len(frameKeys), dtype=frame_class.DTYPE)
+        if len(frameKeys):
+            for name in records.dtype.names:
+                records[name] = [getattr(k, name) for k in frameKeys]
+        return cls(frame_class, records[np.argsort(records['frame_number'], kind='mergesort')])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FrameKeyArrays(self.frame_class, self.records[index])
+        return self.__frameKey(self.records[index].item())
+
+    def __iter__(self):
+        columns = [self.records[name].tolist() for name in self.records.dtype.names]
+        for values in zip(*columns):
+            yield self.__frameKey(values)
+
+    def __frameKey(self, values):
+        frameKey = self.frame_class()
+        for name, value in zip(self.records.dtype.names, values):
+            setattr(frameKey, name, value.tolist() if isinstance(value, np.ndarray) else value)
+        return frameKey
+
+    def append(self, frameKey):
+        record = np.zeros(1, dtype=self.records.dtype)
+        for name in self.records.dtype.names:
+            record[name] = getattr(frameKey, name)
+        self.records = np.concatenate((self.records, record))
+
+    def sort(self, key=None, reverse=False):
+        if key is None:
+            raise TypeError('frame keys can only be sorted with a key function')
+        keys = [key(k) for k in self]
+        order = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+        self.records = self.records[order]
+
+    def __repr__(self):
+        return '<FrameKeyArrays %s count %d>'%(self.frame_class.__name__, len(self))
+
+
 class _AnimationBase(collections.defaultdict):
     def __init__(self):
         collections.defaultdict.__init__(self, list)
 
+    def __reduce__(self):
+        # defaultdict pickles its default factory as an argument of __init__
+        return (self.__class__, (), None, None, iter(self.items()))
+
     @staticmethod
     def frameClass():
         raise NotImplementedError
@@ -218,22 +287,68 @@ class _AnimationBase(collections.defaultdict):
     def load(self, fin):
         count, = struct.unpack('<L', fin.read(4))
         print('loading %s... %d'%(self.__class__.__name__, count))
+        cls = self.frameClass()
+        if hasattr(cls, 'DTYPE'):
+            self.__loadArrays(fin, count, cls)
+            return
         for i in range(count):
             name = _toShiftJisString(struct.unpack('<15s', fin.read(15))[0])
-            cls = self.frameClass()
             frameKey = cls()
             frameKey.load(fin)
             self[name].append(frameKey)
 
+    def __loadArrays(self, fin, count, cls):
+        """ Reads the whole section at once and groups the keyframes by name into FrameKeyArrays.
+        Every distinct name is decoded only once.
+        """
+        dtype = np.dtype([('name', 'V15')] + [(name, cls.DTYPE.fields[name][0]) for name in cls.DTYPE.names])
+        data = fin.read(count * dtype.itemsize)
+        records = np.frombuffer(data, dtype=dtype, count=len(data)//dtype.itemsize)
+
+        raw_names, first, inverse = np.unique(records['name'], return_index=True, return_inverse=True)
+        names = [_toShiftJisString(i.tobytes()) for i in raw_names]
+        # names which only differ after the terminating null are the same, keep the order of the file
+        name_ids = {}
+        for i in np.argsort(first, kind='mergesort').tolist():
+            name_ids.setdefault(names[i], len(name_ids))
+        raw_name_ids = np.array([name_ids[i] for i in names], dtype=np.int64)
+        name_indices = raw_name_ids[inverse.reshape(-1)] if len(records) else np.zeros(0, dtype=np.int64)
+
+        # lexsort is stable, so the keyframes of the same frame keep their order
+        order = np.lexsort((records['frame_number'], name_indices))
+        frames = np.empty(len(records), dtype=cls.DTYPE)
+        for name in cls.DTYPE.names:
+            frames[name] = records[name][order]
+        ends = np.cumsum(np.bincount(name_indices, minlength=len(name_ids)))
+        start = 0
+        for name, end in zip(name_ids.keys(), ends.tolist()):
+            self[name] = FrameKeyArrays(cls, frames[start:end])
+            start = end
+
+        if len(records) < count:
+            raise struct.error('unpack requires more bytes, the %s data is truncated'%self.__class__.__name__)
+
     def save(self, fin):
         count = sum([len(i) for i in self.values()])
         fin.write(struct.pack('<L', count))
         for name, frameKeys in self.items():
             name_data = struct.pack('<15s', _toShiftJisBytes(name))
+            if isinstance(frameKeys, FrameKeyArrays):
+                self.__saveArrays(fin, name_data, frameKeys)
+                continue
             for frameKey in frameKeys:
                 fin.write(name_data)
                 frameKey.save(fin)
 
+    @staticmethod
+    def __saveArrays(fin, name_data, frameKeys):
+        frame_dtype = frameKeys.records.dtype
+        records = np.empty(len(frameKeys), dtype=[('name', 'S15')] + [(name, frame_dtype.fields[name][0]) for name in frame_dtype.names])
+        records['name'] = name_data
+        for name in frame_dtype.names:
+            records[name] = frameKeys.records[name]
+        fin.write(records.tobytes())
+
 
 class _AnimationListBase(list):
     def __init__(self):
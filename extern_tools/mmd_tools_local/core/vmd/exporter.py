@@ -5,11 +5,42 @@ import re
 
 import bpy
 import math
-import mathutils
+import numpy as np
 
 from mmd_tools_local.core import vmd
 from mmd_tools_local.core.camera import MMDCamera
 from mmd_tools_local.core.lamp import MMDLamp
+from mmd_tools_local.bpyutils import foreach_get, enum_values
+
+
+_DEFAULT_INTERP = ((20, 20), (107, 107))
+
+def _xyzw_from_axis_angles(angles, axes):
+    """ Quaternion(axis, angle) of every axis of shape (n, 3), returns (x, y, z, w) """
+    lengths = np.linalg.norm(axes, axis=1)
+    valid = lengths != 0
+    lengths[~valid] = 1
+    half = np.asarray(angles, dtype=np.float64) * 0.5
+    xyzw = np.empty((len(axes), 4))
+    xyzw[:, :3] = axes * (np.sin(half) / lengths)[:, None]
+    xyzw[:, 3] = np.cos(half)
+    xyzw[~valid] = (0, 0, 0, 1)
+    return xyzw
+
+def _xyzw_from_eulers(eulers, order):
+    """ Euler(euler, order).to_quaternion() of every euler of shape (n, 3), returns (x, y, z, w) """
+    i, j, k = ('XYZ'.index(c) for c in order)
+    parity = order not in {'XYZ', 'YZX', 'ZXY'}
+    ti, tj, th = eulers[:, i] * 0.5, eulers[:, j] * (-0.5 if parity else 0.5), eulers[:, k] * 0.5
+    ci, cj, ch = np.cos(ti), np.cos(tj), np.cos(th)
+    si, sj, sh = np.sin(ti), np.sin(tj), np.sin(th)
+    cc, cs, sc, ss = ci*ch, ci*sh, si*ch, si*sh
+    xyzw = np.empty((len(eulers), 4))
+    xyzw[:, i] = cj*sc - sj*cs
+    xyzw[:, j] = (cj*ss + sj*cc) * (-1 if parity else 1)
+    xyzw[:, k] = cj*cs - sj*sc
+    xyzw[:, 3] = cj*cc + sj*ss
+    return xyzw
 
 
 class _FCurve:
@@ -24,64 +55,74 @@ class _FCurve:
 
     def frameNumbers(self):
         if self.__fcurve is None:
-            return set()
-        return {int(kp.co[0]+0.5) for kp in self.__fcurve.keyframe_points}
+            return np.zeros(0, dtype=np.int64)
+        co = foreach_get(self.__fcurve.keyframe_points, 'co', np.float32, 2)
+        return np.trunc(co[:, 0].astype(np.float64) + 0.5).astype(np.int64)
 
     @staticmethod
-    def getVMDControlPoints(kp0, kp1):
-        if kp0.interpolation == 'LINEAR':
-            return ((20, 20), (107, 107))
-
-        dx, dy = kp1.co - kp0.co
-        if abs(dy) < 1e-6 or abs(dx) < 1.5:
-            return ((20, 20), (107, 107))
-
-        x1, y1 = kp0.handle_right - kp0.co
-        x2, y2 = kp1.handle_left - kp0.co
-        x1 = max(0, min(127, int(0.5 + x1*127.0/dx)))
-        x2 = max(0, min(127, int(0.5 + x2*127.0/dx)))
-        y1 = max(0, min(127, int(0.5 + y1*127.0/dy)))
-        y2 = max(0, min(127, int(0.5 + y2*127.0/dy)))
-        return ((x1, y1), (x2, y2))
-
-    def sampleFrames(self, frame_numbers):
-        # assume set(frame_numbers) & set(self.frameNumbers()) == set(self.frameNumbers())
+    def getVMDControlPoints(co0, co1, handle_right0, handle_left1, linear0):
+        """ The VMD control points ((x1, y1), (x2, y2)) of the curves between pairs of keyframes.
+
+        Every argument is an array of the pairs, returns an int array of shape (n, 2, 2).
+        """
+        dx, dy = (co1 - co0).astype(np.float64).T
+        default = linear0 | (np.abs(dy) < 1e-6) | (np.abs(dx) < 1.5)
+        dx[default] = dy[default] = 1
+        p1 = (handle_right0 - co0).astype(np.float64)
+        p2 = (handle_left1 - co0).astype(np.float64)
+        points = np.stack((p1, p2), axis=1) * (127.0 / np.column_stack((dx, dy)))[:, None, :]
+        points = np.clip(np.trunc(0.5 + points), 0, 127).astype(np.int64)
+        points[default] = _DEFAULT_INTERP
+        return points
+
+    def sampleFrames(self, frame_numbers, selection=None):
+        """ Returns the values and the VMD interpolations (an int array of shape (n, 2, 2)) at frame_numbers.
+
+        frame_numbers is a sorted array containing frameNumbers(). Values between keyframes are
+        evaluated only if the frames are in selection, which is a bool array of frame_numbers.
+        """
+        count = len(frame_numbers)
+        interps = np.empty((count, 2, 2), dtype=np.int64)
+        interps[:] = _DEFAULT_INTERP
         fcurve = self.__fcurve
         if fcurve is None or len(fcurve.keyframe_points) < 1: # no key frames
-            for i in frame_numbers:
-                yield [self.__default_value, ((20, 20), (107, 107))]
-            return
-
+            return np.full(count, self.__default_value, dtype=object), interps
+
+        kps = fcurve.keyframe_points
+        co = foreach_get(kps, 'co', np.float32, 2)
+        order = np.argsort(co[:, 0], kind='mergesort')
+        co = co[order]
+        handle_left = foreach_get(kps, 'handle_left', np.float32, 2)[order]
+        handle_right = foreach_get(kps, 'handle_right', np.float32, 2)[order]
+        linear = foreach_get(kps, 'interpolation', np.int32)[order] == enum_values(bpy.types.Keyframe, 'interpolation')['LINEAR']
+
+        # keyframes on the same frame: the first one gives the value, the last one starts the next curve
+        frames = np.trunc(co[:, 0].astype(np.float64) + 0.5).astype(np.int64)
+        first = np.flatnonzero(np.append(True, frames[1:] != frames[:-1]))
+        last = np.flatnonzero(np.append(frames[1:] != frames[:-1], True))
+        pos = np.searchsorted(frame_numbers, frames[first])
+        assert(np.all(frame_numbers[pos] == frames[first]))
+
+        values = np.empty(count)
+        values[:pos[0]+1] = co[first[0], 1] # starting key frames
+        values[pos[-1]+1:] = co[last[-1], 1] # ending key frames
+
+        direct = np.flatnonzero(pos[1:] - pos[:-1] == 1) + 1
+        kp0, kp1 = last[direct-1], first[direct]
+        values[pos[direct]] = co[kp1, 1]
+        interps[pos[direct]] = self.getVMDControlPoints(co[kp0], co[kp1], handle_right[kp0], handle_left[kp1], linear[kp0])
+
+        #FIXME better evaluated values and interpolations
+        evaluated = np.flatnonzero(pos[1:] - pos[:-1] > 1) + 1
+        marks = np.zeros(count + 1, dtype=np.int64)
+        np.add.at(marks, pos[evaluated-1] + 1, 1)
+        np.add.at(marks, pos[evaluated] + 1, -1)
+        evaluated = np.cumsum(marks[:-1]) > 0
+        if selection is not None:
+            evaluated &= selection
         evaluate = fcurve.evaluate
-        frame_iter = iter(frame_numbers)
-        prev_kp = None
-        prev_i = None
-        for kp in sorted(fcurve.keyframe_points, key=lambda x: x.co[0]):
-            i = int(kp.co[0]+0.5)
-            if i == prev_i:
-                prev_kp = kp
-                continue
-            prev_i = i
-            frames = []
-            while True:
-                frame = next(frame_iter)
-                frames.append(frame)
-                if frame >= i:
-                    break
-            assert(len(frames) >= 1 and frames[-1] == i)
-            if prev_kp is None:
-                for f in frames: # starting key frames
-                    yield [kp.co[1], ((20, 20), (107, 107))]
-            elif len(frames) == 1:
-                yield [kp.co[1], self.getVMDControlPoints(prev_kp, kp)]
-            else:
-                #FIXME better evaluated values and interpolations
-                for f in frames:
-                    yield [evaluate(f), ((20, 20), (107, 107))]
-            prev_kp = kp
-
-        for f in frame_iter: # ending key frames
-            yield [prev_kp.co[1], ((20, 20), (107, 107))]
+        values[evaluated] = [evaluate(f) for f in frame_numbers[evaluated].tolist()]
+        return values, interps
 
 
 class VMDExporter:
@@ -93,93 +134,89 @@ class VMDExporter:
         self.__bone_converter_cls = vmd.importer.BoneConverter
         self.__ik_fcurves = {}
 
-    def __allFrameKeys(self, curves):
-        all_frames = set()
-        for i in curves:
-            all_frames |= i.frameNumbers()
-
+    def __allFrameArrays(self, curves):
+        """ Returns the sorted frame numbers of all keyframes in the frame range, and the
+        (values, interpolations) of each curve at these frames, or None if there is no keyframe.
+        """
+        all_frames = np.unique(np.concatenate([i.frameNumbers() for i in curves]))
         if len(all_frames) < 1:
-            return
+            return None
 
-        frame_start = min(all_frames)
+        frame_start = all_frames[0]
         if frame_start < self.__frame_start:
             frame_start = self.__frame_start
-            all_frames.add(frame_start)
+            all_frames = np.union1d(all_frames, [frame_start])
 
-        frame_end = max(all_frames)
+        frame_end = all_frames[-1]
         if frame_end > self.__frame_end:
             frame_end = self.__frame_end
-            all_frames.add(frame_end)
-
-        all_frames = sorted(all_frames)
-        all_keys = [i.sampleFrames(all_frames) for i in curves]
-        #return zip(all_frames, *all_keys)
-        for data in zip(all_frames, *all_keys):
-            frame_number = data[0]
-            if frame_number < frame_start:
-                continue
-            if frame_number > frame_end:
-                break
+            all_frames = np.union1d(all_frames, [frame_end])
+
+        selection = (all_frames >= frame_start) & (all_frames <= frame_end)
+        all_keys = [i.sampleFrames(all_frames, selection) for i in curves]
+        return all_frames[selection], [(values[selection], interps[selection]) for values, interps in all_keys]
+
+    def __allFrameKeys(self, curves):
+        frame_arrays = self.__allFrameArrays(curves)
+        if frame_arrays is None:
+            return
+        all_frames, all_keys = frame_arrays
+        as_tuples = lambda interps: [((x1, y1), (x2, y2)) for (x1, y1), (x2, y2) in interps.tolist()]
+        all_keys = [zip(values.tolist(), as_tuples(interps)) for values, interps in all_keys]
+        for data in zip(all_frames.tolist(), *all_keys):
             yield data
 
     @staticmethod
-    def __minRotationDiff(prev_q, curr_q):
-        pq, q = prev_q, curr_q
-        nq = q.copy()
-        nq.negate()
-        t1 = (pq.w-q.w)**2+(pq.x-q.x)**2+(pq.y-q.y)**2+(pq.z-q.z)**2
-        t2 = (pq.w-nq.w)**2+(pq.x-nq.x)**2+(pq.y-nq.y)**2+(pq.z-nq.z)**2
-        #t1 = pq.rotation_difference(q).angle
-        #t2 = pq.rotation_difference(nq).angle
-        if t2 < t1:
-            return nq
-        return q
+    def __minRotationDiffs(rotations):
+        """ Negates the rotations (w, x, y, z) which are closer to the previous result when negated.
+        """
+        dots = (rotations[1:] * rotations[:-1]).sum(axis=1)
+        # a rotation is negated when the one before was negated xor their dot product is negative,
+        # and never when the dot product is 0
+        negative_counts = np.append(0, np.cumsum(dots < 0))
+        resets = np.append(True, dots == 0)
+        last_resets = np.maximum.accumulate(np.where(resets, np.arange(len(resets)), 0))
+        signs = np.where((negative_counts - negative_counts[last_resets]) % 2, -1.0, 1.0)
+        return rotations * signs[:, None]
 
     @staticmethod
     def __getVMDBoneInterpolation(x_axis, y_axis, z_axis, rotation):
-        x_x1, x_y1 = x_axis[0]
-        x_x2, x_y2 = x_axis[1]
-        y_x1, y_y1 = y_axis[0]
-        y_x2, y_y2 = y_axis[1]
-        z_x1, z_y1 = z_axis[0]
-        z_x2, z_y2 = z_axis[1]
-        r_x1, r_y1 = rotation[0]
-        r_x2, r_y2 = rotation[1]
-        #return [ # minimum acceptable data
-        #    x_x1, 0, 0, 0, x_y1, 0, 0, 0, x_x2, 0, 0, 0, x_y2, 0, 0, 0,
-        #    y_x1, 0, 0, 0, y_y1, 0, 0, 0, y_x2, 0, 0, 0, y_y2, 0, 0, 0,
-        #    z_x1, 0, 0, 0, z_y1, 0, 0, 0, z_x2, 0, 0, 0, z_y2, 0, 0, 0,
-        #    r_x1, 0, 0, 0, r_y1, 0, 0, 0, r_x2, 0, 0, 0, r_y2, 0, 0, 0,
-        #    ]
-        return [ # full data, indices in [2, 3, 31, 46, 47, 61, 62, 63] are unclear
-            x_x1, y_x1, z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,
-            y_x1, z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,
-            z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,    0,
-            r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,    0,    0,
-            ]
+        """ The 64 bytes of VMD bone interpolations, every argument is an array of shape (n, 2, 2) """
+        axes = np.stack((x_axis, y_axis, z_axis, rotation), axis=1) # (n, axis, point, xy)
+        # x1 of (x, y, z, r), y1 of (x, y, z, r), x2 of (x, y, z, r), y2 of (x, y, z, r)
+        values = axes.transpose(0, 2, 3, 1).reshape(-1, 16)
+        interp = np.zeros((len(values), 4, 16), dtype=np.int8)
+        for i in range(4): # full data, indices in [2, 3, 31, 46, 47, 61, 62, 63] are unclear
+            interp[:, i, :16-i] = values[:, i:]
+        return interp.reshape(-1, 64)
 
     @staticmethod
     def __pickRotationInterpolation(rotation_interps):
         for ir in rotation_interps:
-            if ir != ((20, 20), (107, 107)):
+            if ir != _DEFAULT_INTERP:
                 return ir
-        return ((20, 20), (107, 107))
+        return _DEFAULT_INTERP
+
+    @staticmethod
+    def __pickRotationInterpolations(rotation_interps):
+        """ __pickRotationInterpolation() of arrays of shape (n, 2, 2) """
+        result = np.empty_like(rotation_interps[0])
+        result[:] = _DEFAULT_INTERP
+        for ir in reversed(rotation_interps):
+            picked = np.any(ir != _DEFAULT_INTERP, axis=(1, 2))
+            result[picked] = ir[picked]
+        return result
 
     @staticmethod
     def __xyzw_from_rotation_mode(mode):
+        """ Returns a function converting the arrays of rw, rx, ry, rz to quaternions (x, y, z, w) """
         if mode == 'QUATERNION':
-            return lambda xyzw: xyzw
+            return lambda rw, rx, ry, rz: np.column_stack((rx, ry, rz, rw)).astype(np.float64)
 
         if mode == 'AXIS_ANGLE':
-            def __xyzw_from_axis_angle(xyzw):
-                q = mathutils.Quaternion(xyzw[:3], xyzw[3])
-                return [q.x, q.y, q.z, q.w]
-            return __xyzw_from_axis_angle
+            return lambda rw, rx, ry, rz: _xyzw_from_axis_angles(rw, np.column_stack((rx, ry, rz)).astype(np.float64))
 
-        def __xyzw_from_euler(xyzw):
-            q = mathutils.Euler(xyzw[:3], xyzw[3]).to_quaternion()
-            return [q.x, q.y, q.z, q.w]
-        return __xyzw_from_euler
+        return lambda rw, rx, ry, rz: _xyzw_from_eulers(np.column_stack((rx, ry, rz)).astype(np.float64), mode)
 
 
     def __exportBoneAnimation(self, armObj):
@@ -235,23 +272,20 @@ class VMDExporter:
             key_name = bone.mmd_bone.name_j or bone.name
             assert(key_name not in vmd_bone_anim) # VMD bone name collision
             frame_keys = vmd_bone_anim[key_name]
-
-            get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
-            converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-            prev_rot = None
-            for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves):
-                key = vmd.BoneFrameKey()
-                key.frame_number = frame_number - self.__frame_start
-                key.location = converter.convert_location([x[0], y[0], z[0]])
-                curr_rot = converter.convert_rotation(get_xyzw([rx[0], ry[0], rz[0], rw[0]]))
-                if prev_rot is not None:
-                    curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
-                prev_rot = curr_rot
-                key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
+            frame_arrays = self.__allFrameArrays(bone_curves)
+            if frame_arrays is not None:
+                all_frames, ((x, ix), (y, iy), (z, iz), (rw, irw), (rx, irx), (ry, iry), (rz, irz)) = frame_arrays
+                get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
+                converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
+                records = np.zeros(len(all_frames), dtype=vmd.BoneFrameKey.DTYPE)
+                records['frame_number'] = all_frames - self.__frame_start
+                records['location'] = converter.convert_locations(np.column_stack((x, y, z)).astype(np.float64))
+                rotations = self.__minRotationDiffs(converter.convert_rotations(get_xyzw(rw, rx, ry, rz)))
+                records['rotation'] = rotations[:, (1, 2, 3, 0)] # (w, x, y, z) to (x, y, z, w)
                 #FIXME we can only choose one interpolation from (rw, rx, ry, rz) for bone's rotation
-                ir = self.__pickRotationInterpolation([rw[1], rx[1], ry[1], rz[1]])
-                key.interp = self.__getVMDBoneInterpolation(x[1], z[1], y[1], ir) # x, z, y, q
-                frame_keys.append(key)
+                ir = self.__pickRotationInterpolations([irw, irx, iry, irz])
+                records['interp'] = self.__getVMDBoneInterpolation(ix, iz, iy, ir) # x, z, y, q
+                frame_keys = vmd_bone_anim[key_name] = vmd.FrameKeyArrays(vmd.BoneFrameKey, records)
             logging.info('(bone) frames:%5d  name: %s', len(frame_keys), key_name)
         logging.info('---- bone animations:%5d  source: %s', len(vmd_bone_anim), armObj.name)
         return vmd_bone_anim
@@ -298,11 +332,13 @@ class VMDExporter:
             curve = _FCurve(kb.value)
             curve.setFCurve(fcurve)
 
-            for frame_number, weight in self.__allFrameKeys([curve]):
-                key = vmd.ShapeKeyFrameKey()
-                key.frame_number = frame_number - self.__frame_start
-                key.weight = weight[0]
-                anim.append(key)
+            frame_arrays = self.__allFrameArrays([curve])
+            if frame_arrays is not None:
+                all_frames, ((weights, interps),) = frame_arrays
+                records = np.zeros(len(all_frames), dtype=vmd.ShapeKeyFrameKey.DTYPE)
+                records['frame_number'] = all_frames - self.__frame_start
+                records['weight'] = weights
+                anim = vmd_morph_anim[key_name] = vmd.FrameKeyArrays(vmd.ShapeKeyFrameKey, records)
             logging.info('(mesh) frames:%5d  name: %s', len(anim), key_name)
         logging.info('---- morph animations:%5d  source: %s', len(vmd_morph_anim), meshObj.name)
         return vmd_morph_anim
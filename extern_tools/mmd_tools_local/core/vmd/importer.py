@@ -5,10 +5,11 @@ import os
 
 import bpy
 import math
+import numpy as np
 from mathutils import Vector, Quaternion
 
 from mmd_tools_local import utils
-from mmd_tools_local.bpyutils import matmul
+from mmd_tools_local.bpyutils import matmul, foreach_get, enum_values
 from mmd_tools_local.core import vmd
 from mmd_tools_local.core.camera import MMDCamera
 from mmd_tools_local.core.lamp import MMDLamp
@@ -56,6 +57,81 @@ class RenamedBoneMapper:
         return self.__pose_bones.get(bl_bone_name, default)
 
 
+def _quaternions_from_xyzw(rotations_xyzw):
+    rotations = np.asarray(rotations_xyzw, dtype=np.float64).reshape(-1, 4)
+    return rotations[:, (3, 0, 1, 2)]
+
+def _normalize_quaternions(quaternions):
+    """ Quaternion.normalized() of every quaternion (w, x, y, z), zero quaternions become (0, 1, 0, 0).
+    """
+    lengths = np.linalg.norm(quaternions, axis=1)
+    zero = lengths == 0
+    lengths[zero] = 1
+    quaternions = quaternions / lengths[:, None]
+    quaternions[zero] = (0, 1, 0, 0)
+    return quaternions
+
+def _rotate_quaternion_axes(mat, quaternions):
+    """ Quaternion(matmul(mat, q.axis) * -1, q.angle) of every quaternion (w, x, y, z).
+    """
+    quaternions = _normalize_quaternions(quaternions)
+    w = np.clip(quaternions[:, 0], -1, 1)
+    axes = -quaternions[:, 1:].dot(np.asarray(mat, dtype=np.float64).T)
+    lengths = np.linalg.norm(axes, axis=1)
+    zero = lengths == 0
+    lengths[zero] = 1
+    result = np.empty_like(quaternions)
+    result[:, 0] = w
+    result[:, 1:] = axes * (np.sqrt(1 - w*w) / lengths)[:, None]
+    # the axis of an angle of 0 or 360 degrees doesn't matter, a degenerate mat gives the identity
+    result[zero & quaternions[:, 1:].any(axis=1)] = (1, 0, 0, 0)
+    return result
+
+def _quaternions_to_matrices(quaternions):
+    """ Quaternion.to_matrix() of every quaternion (w, x, y, z).
+    """
+    w, x, y, z = quaternions.T
+    return np.stack((
+        1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y),
+        2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x),
+        2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y),
+        ), axis=1).reshape(-1, 3, 3)
+
+def _matrices_to_quaternions(matrices):
+    """ Matrix.to_quaternion() of every 3x3 matrix, using the same branches as Blender.
+    """
+    lengths = np.linalg.norm(matrices, axis=1)
+    lengths[lengths == 0] = 1
+    m = matrices / lengths[:, None, :] # normalize the columns
+    m00, m11, m22 = m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]
+    q = np.empty((len(m), 4))
+
+    tr = 0.25 * (1 + m00 + m11 + m22)
+    sel = tr > 1e-4
+    s = np.sqrt(tr[sel])
+    q[sel, 0] = s
+    s = 1 / (4 * s)
+    q[sel, 1] = (m[sel, 2, 1] - m[sel, 1, 2]) * s
+    q[sel, 2] = (m[sel, 0, 2] - m[sel, 2, 0]) * s
+    q[sel, 3] = (m[sel, 1, 0] - m[sel, 0, 1]) * s
+
+    rest = ~sel
+    branches = (
+        rest & (m00 > m11) & (m00 > m22),
+        rest & ~((m00 > m11) & (m00 > m22)) & (m11 > m22),
+        rest & ~((m00 > m11) & (m00 > m22)) & ~(m11 > m22),
+        )
+    for i, sel in enumerate(branches):
+        j, k = (i + 1) % 3, (i + 2) % 3
+        s = 2 * np.sqrt(np.maximum(0, 1 + m[sel, i, i] - m[sel, j, j] - m[sel, k, k]))
+        q[sel, 1+i] = 0.25 * s
+        s = 1 / s
+        q[sel, 0] = (m[sel, k, j] - m[sel, j, k]) * s
+        q[sel, 1+j] = (m[sel, j, i] + m[sel, i, j]) * s
+        q[sel, 1+k] = (m[sel, k, i] + m[sel, i, k]) * s
+    return _normalize_quaternions(q)
+
+
 class BoneConverter:
     def __init__(self, pose_bone, scale, invert=False):
         mat = pose_bone.bone.matrix_local.to_3x3()
@@ -73,6 +149,14 @@ class BoneConverter:
         rot.x, rot.y, rot.z, rot.w = rotation_xyzw
         return Quaternion(matmul(self.__mat, rot.axis) * -1, rot.angle).normalized()
 
+    def convert_locations(self, locations):
+        """ convert_location() of an array of shape (n, 3) """
+        return np.asarray(locations, dtype=np.float64).reshape(-1, 3).dot(np.array(self.__mat).T) * self.__scale
+
+    def convert_rotations(self, rotations_xyzw):
+        """ convert_rotation() of an array of shape (n, 4), returns the quaternions (w, x, y, z) """
+        return _normalize_quaternions(_rotate_quaternion_axes(self.__mat, _quaternions_from_xyzw(rotations_xyzw)))
+
 class BoneConverterPoseMode:
     def __init__(self, pose_bone, scale, invert=False):
         mat = pose_bone.matrix.to_3x3()
@@ -84,12 +168,16 @@ class BoneConverterPoseMode:
         self.__offset = pose_bone.location.copy()
         self.convert_location = self._convert_location
         self.convert_rotation = self._convert_rotation
+        self.convert_locations = self._convert_locations
+        self.convert_rotations = self._convert_rotations
         if invert:
             self.__mat.invert()
             self.__mat_rot.invert()
             self.__mat_loc.invert()
             self.convert_location = self._convert_location_inverted
             self.convert_rotation = self._convert_rotation_inverted
+            self.convert_locations = self._convert_locations_inverted
+            self.convert_rotations = self._convert_rotations_inverted
 
     def _convert_location(self, location):
         return self.__offset + matmul(self.__mat_loc, Vector(location)) * self.__scale
@@ -109,12 +197,31 @@ class BoneConverterPoseMode:
         rot = matmul(self.__mat_rot, rot.to_matrix()).to_quaternion()
         return Quaternion(matmul(self.__mat, rot.axis) * -1, rot.angle).normalized()
 
+    def _convert_locations(self, locations):
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+        return np.array(self.__offset) + locations.dot(np.array(self.__mat_loc).T) * self.__scale
+
+    def _convert_rotations(self, rotations_xyzw):
+        rot = _rotate_quaternion_axes(self.__mat, _quaternions_from_xyzw(rotations_xyzw))
+        return _matrices_to_quaternions(np.matmul(np.array(self.__mat_rot), _quaternions_to_matrices(rot)))
+
+    def _convert_locations_inverted(self, locations):
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+        return (locations - np.array(self.__offset)).dot(np.array(self.__mat_loc).T) * self.__scale
+
+    def _convert_rotations_inverted(self, rotations_xyzw):
+        rot = _quaternions_to_matrices(_quaternions_from_xyzw(rotations_xyzw))
+        rot = _matrices_to_quaternions(np.matmul(np.array(self.__mat_rot), rot))
+        return _normalize_quaternions(_rotate_quaternion_axes(self.__mat, rot))
+
 
 class VMDImporter:
     def __init__(self, filepath, scale=1.0, bone_mapper=None, use_pose_mode=False,
-            convert_mmd_camera=True, convert_mmd_lamp=True, frame_margin=5, use_mirror=False):
-        self.__vmdFile = vmd.File()
-        self.__vmdFile.load(filepath=filepath)
+            convert_mmd_camera=True, convert_mmd_lamp=True, frame_margin=5, use_mirror=False, vmd_file=None):
+        if vmd_file is None:
+            vmd_file = vmd.File()
+            vmd_file.load(filepath=filepath)
+        self.__vmdFile = vmd_file
         self.__scale = scale
         self.__convert_mmd_camera = convert_mmd_camera
         self.__convert_mmd_lamp = convert_mmd_lamp
@@ -124,19 +231,6 @@ class VMDImporter:
         self.__mirror = use_mirror
 
 
-    @staticmethod
-    def __minRotationDiff(prev_q, curr_q):
-        pq, q = prev_q, curr_q
-        nq = q.copy()
-        nq.negate()
-        t1 = (pq.w-q.w)**2+(pq.x-q.x)**2+(pq.y-q.y)**2+(pq.z-q.z)**2
-        t2 = (pq.w-nq.w)**2+(pq.x-nq.x)**2+(pq.y-nq.y)**2+(pq.z-nq.z)**2
-        #t1 = pq.rotation_difference(q).angle
-        #t2 = pq.rotation_difference(nq).angle
-        if t2 < t1:
-            return nq
-        return q
-
     @staticmethod
     def __setInterpolation(bezier, kp0, kp1):
         if bezier[0] == bezier[1] and bezier[2] == bezier[3]:
@@ -149,6 +243,72 @@ class VMDImporter:
             kp0.handle_right = kp0.co + Vector((d.x * bezier[0], d.y * bezier[1]))
             kp1.handle_left = kp0.co + Vector((d.x * bezier[2], d.y * bezier[3]))
 
+    @staticmethod
+    def __minRotationDiffs(rotations, prev_rot=None):
+        """ Negates the rotations (w, x, y, z) which are closer to the previous result when negated.
+        """
+        if prev_rot is not None:
+            rotations = np.vstack(([tuple(prev_rot)], rotations))
+        dots = (rotations[1:] * rotations[:-1]).sum(axis=1)
+        # a rotation is negated when the one before was negated xor their dot product is negative,
+        # and never when the dot product is 0
+        negative_counts = np.append(0, np.cumsum(dots < 0))
+        resets = np.append(True, dots == 0)
+        last_resets = np.maximum.accumulate(np.where(resets, np.arange(len(resets)), 0))
+        signs = np.where((negative_counts - negative_counts[last_resets]) % 2, -1.0, 1.0)
+        rotations = rotations * signs[:, None]
+        return rotations if prev_rot is None else rotations[1:]
+
+    @staticmethod
+    def __setKeyframes(fcurve, frames, values, beziers, extra_point=None):
+        """ Adds all keyframes of fcurve with foreach_set, which is the same as assigning kp.co,
+        calling __setInterpolation() for every pair of keyframes and __fixFcurveHandles() at the end.
+
+        @param beziers the bezier control points (x1, y1, x2, y2) of the curve ending at each keyframe
+        @param extra_point (frame, value) of a LINEAR keyframe which goes first
+        """
+        kps = fcurve.keyframe_points
+        start = 0 if extra_point is None else 1
+        count = start + len(frames)
+        kps.add(count)
+
+        co = np.empty((count, 2))
+        if extra_point is not None:
+            co[0] = extra_point
+        co[start:, 0] = frames
+        co[start:, 1] = values
+        handle_left = foreach_get(kps, 'handle_left', np.float32, 2)
+        handle_right = foreach_get(kps, 'handle_right', np.float32, 2)
+        interpolation = foreach_get(kps, 'interpolation', np.int32)
+        handle_left_type = foreach_get(kps, 'handle_left_type', np.int32)
+        handle_right_type = foreach_get(kps, 'handle_right_type', np.int32)
+
+        interpolation_values = enum_values(bpy.types.Keyframe, 'interpolation')
+        if extra_point is not None:
+            interpolation[0] = interpolation_values['LINEAR']
+        if count - start > 1:
+            beziers = np.asarray(beziers, dtype=np.float64)[1:]
+            kp0 = np.arange(start, count-1)
+            linear = (beziers[:, 0] == beziers[:, 1]) & (beziers[:, 2] == beziers[:, 3])
+            interpolation[kp0[linear]] = interpolation_values['LINEAR']
+
+            kp0, beziers = kp0[~linear], beziers[~linear]
+            kp1 = kp0 + 1
+            interpolation[kp0] = interpolation_values['BEZIER']
+            handle_right_type[kp0] = handle_left_type[kp1] = enum_values(bpy.types.Keyframe, 'handle_right_type')['FREE']
+            d = (co[kp1] - co[kp0]) / 127.0
+            handle_right[kp0] = co[kp0] + d * beziers[:, :2]
+            handle_left[kp1] = co[kp0] + d * beziers[:, 2:]
+        handle_left[0] = co[0] + (-1, 0)
+        handle_right[-1] = co[-1] + (1, 0)
+
+        kps.foreach_set('co', co.astype(np.float32).ravel())
+        kps.foreach_set('handle_left', handle_left.ravel())
+        kps.foreach_set('handle_right', handle_right.ravel())
+        kps.foreach_set('interpolation', interpolation)
+        kps.foreach_set('handle_left_type', handle_left_type)
+        kps.foreach_set('handle_right_type', handle_right_type)
+
     @staticmethod
     def __fixFcurveHandles(fcurve):
         kp0 = fcurve.keyframe_points[0]
@@ -173,10 +333,8 @@ class VMDImporter:
         if self.__bone_mapper:
             pose_bones = self.__bone_mapper(armObj)
 
-        _loc = _rot = lambda i: i
         if self.__mirror:
             pose_bones = _MirrorMapper(pose_bones)
-            _loc, _rot = _MirrorMapper.get_location, _MirrorMapper.get_rotation
 
         bone_name_table = {}
         for name, keyFrames in boneAnim.items():
@@ -200,44 +358,26 @@ class VMDImporter:
             for axis_i in range(4):
                 fcurves[3+axis_i] = action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name)
 
-            for i, c in enumerate(fcurves):
-                c.keyframe_points.add(extra_frame+num_frame)
-                kp_iter = iter(c.keyframe_points)
-                if extra_frame:
-                    kp = next(kp_iter)
-                    kp.co = (1, default_values[i])
-                    kp.interpolation = 'LINEAR'
-                fcurves[i] = kp_iter
+            if not isinstance(keyFrames, vmd.FrameKeyArrays):
+                keyFrames = vmd.FrameKeyArrays.fromFrameKeys(vmd.BoneFrameKey, keyFrames)
+            records = keyFrames.records
+            frames = records['frame_number'] + self.__frame_margin
+            locations = records['location'].astype(np.float64)
+            rotations = records['rotation'].astype(np.float64)
+            if self.__mirror:
+                locations[:, 0] *= -1
+                rotations[:, 1:3] *= -1
 
             converter = self.__bone_util_cls(bone, self.__scale)
+            locations = converter.convert_locations(locations)
             prev_rot = bone.rotation_quaternion if extra_frame else None
-            prev_kps, indices = None, (0, 32, 16, 48, 48, 48, 48) # x, z, y, rw, rx, ry, rz
-            keyFrames.sort(key=lambda x:x.frame_number)
-            for k, x, y, z, rw, rx, ry, rz in zip(keyFrames, *fcurves):
-                frame = k.frame_number + self.__frame_margin
-                loc = converter.convert_location(_loc(k.location))
-                curr_rot = converter.convert_rotation(_rot(k.rotation))
-                if prev_rot is not None:
-                    curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
-                prev_rot = curr_rot
-
-                x.co = (frame, loc[0])
-                y.co = (frame, loc[1])
-                z.co = (frame, loc[2])
-                rw.co = (frame, curr_rot[0])
-                rx.co = (frame, curr_rot[1])
-                ry.co = (frame, curr_rot[2])
-                rz.co = (frame, curr_rot[3])
-
-                curr_kps = (x, y, z, rw, rx, ry, rz)
-                if prev_kps is not None:
-                    interp = k.interp
-                    for idx, prev_kp, kp in zip(indices, prev_kps, curr_kps):
-                        self.__setInterpolation(interp[idx:idx+16:4], prev_kp, kp)
-                prev_kps = curr_kps
-
-        for c in action.fcurves:
-            self.__fixFcurveHandles(c)
+            rotations = self.__minRotationDiffs(converter.convert_rotations(rotations), prev_rot)
+
+            indices = (0, 32, 16, 48, 48, 48, 48) # x, z, y, rw, rx, ry, rz
+            values = np.column_stack((locations, rotations))
+            for i, (c, idx) in enumerate(zip(fcurves, indices)):
+                extra_point = (1, default_values[i]) if extra_frame else None
+                self.__setKeyframes(c, frames, values[:, i], records['interp'][:, idx:idx+16:4], extra_point)
 
         # ensure IK's default state
         for b in armObj.pose.bones:
@@ -280,7 +420,8 @@ class VMDImporter:
             shapeKey = shapeKeyDict[name]
             fcurve = action.fcurves.new(data_path='key_blocks["%s"].value'%shapeKey.name)
             fcurve.keyframe_points.add(len(keyFrames))
-            keyFrames.sort(key=lambda x:x.frame_number)
+            if not isinstance(keyFrames, vmd.FrameKeyArrays): # FrameKeyArrays are sorted already
+                keyFrames.sort(key=lambda x:x.frame_number)
             for k, v in zip(keyFrames, fcurve.keyframe_points):
                 v.co = (k.frame_number+self.__frame_margin, k.weight)
                 v.interpolation = 'LINEAR'
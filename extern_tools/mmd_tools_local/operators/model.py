@@ -62,10 +62,16 @@ class BuildRig(Operator):
     bl_description = 'Translate physics of selected object into format usable by Blender'
     bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
 
+    use_collision_layers = bpy.props.BoolProperty(
+        name='Use Collision Layers',
+        description='Separate rigid bodies by collision layers, and create non collision constraints only for the pairs which are not separated. The first layer is left to the scene: rigid bodies of other objects on it (e.g. floors) are added to the layers of the model to keep colliding with it',
+        default=False,
+        )
+
     def execute(self, context):
         root = mmd_model.Model.findRoot(context.active_object)
         rig = mmd_model.Model(root)
-        rig.build()
+        rig.build(use_collision_layers=self.use_collision_layers)
         SceneOp(context).active_object = root
         return {'FINISHED'}
 
@@ -6,6 +6,7 @@ from bpy.types import Operator
 from mmd_tools_local import register_wrap
 from mmd_tools_local.core.model import Model
 from mmd_tools_local.core.sdef import FnSDEF
+from mmd_tools_local.core import sdef_benchmark
 
 def _get_selected_objects(context):
     selected_objects = set(i for i in context.selected_objects if i.type == 'MESH')
@@ -41,7 +42,7 @@ class BindSDEF(Operator):
         items = [
             ('2', 'Bulk', 'Speed up with numpy (may be slower in some cases)', 2),
             ('1', 'Normal', 'Normal mode', 1),
-            ('0', '- Auto -', 'Select best mode by benchmark result', 0),
+            ('0', '- Auto -', 'Select best mode by stored or new benchmark result', 0),
             ],
         default='0',
         )
@@ -62,11 +63,52 @@ class BindSDEF(Operator):
 
     def execute(self, context):
         selected_objects = _get_selected_objects(context)
-        param = ((None, False, True)[int(self.mode)], self.use_skip, self.use_scale)
-        count = sum(FnSDEF.bind(i, *param) for i in selected_objects)
+        bulk_update = (None, False, True)[int(self.mode)]
+        count = 0
+        for i in selected_objects:
+            param = bulk_update
+            if param is None:
+                param = sdef_benchmark.load_bulk_update(Model.findRoot(i), self.use_scale)
+            count += FnSDEF.bind(i, param, self.use_skip, self.use_scale)
         self.report({'INFO'}, 'Binded %d of %d selected mesh(es)'%(count, len(selected_objects)))
         return {'FINISHED'}
 
+@register_wrap
+class BenchmarkSDEF(Operator):
+    bl_idname = 'mmd_tools.sdef_benchmark'
+    bl_label = 'Benchmark SDEF Driver'
+    bl_description = 'Measure the cost per frame of each SDEF driver mode for selected models, and store the results for "Auto" mode'
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    use_synthetic = bpy.props.BoolProperty(
+        name='Synthetic Meshes',
+        description='Benchmark synthetic meshes of increasing vertex counts instead of selected models (results are printed in the console)',
+        default=False,
+        )
+
+    def execute(self, context):
+        if self.use_synthetic:
+            for line in sdef_benchmark.format_results(sdef_benchmark.benchmark_synthetic()):
+                print(line)
+            self.report({'INFO'}, 'SDEF benchmark results are printed in the console')
+            return {'FINISHED'}
+
+        roots = set(Model.findRoot(i) for i in context.selected_objects) - {None}
+        if not roots:
+            self.report({'ERROR'}, 'Please select a MMD model')
+            return {'CANCELLED'}
+        for root in roots:
+            count, results = sdef_benchmark.benchmark_model(root)
+            if not results:
+                self.report({'WARNING'}, '%s: no SDEF data'%root.name)
+                continue
+            sdef_benchmark.store_results(root, results)
+            for line in sdef_benchmark.format_results([(count, results)]):
+                print(line)
+            costs = ', '.join('%s %.2fms'%(m, results[m]*1000) for m in sorted(results.keys()))
+            self.report({'INFO'}, '%s: %s'%(root.name, costs))
+        return {'FINISHED'}
+
 @register_wrap
 class UnbindSDEF(Operator):
     bl_idname = 'mmd_tools.sdef_unbind'
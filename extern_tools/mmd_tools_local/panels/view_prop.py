@@ -69,6 +69,7 @@ class MMDSDEFPanel(_PanelBase, Panel):
         c = self.layout.column(align=True)
         c.operator('mmd_tools.sdef_bind', text='Bind')
         c.operator('mmd_tools.sdef_unbind', text='Unbind')
+        c.operator('mmd_tools.sdef_benchmark', text='Benchmark')
         row = c.row()
         row.label(text='Cache Info: %d data'%(len(FnSDEF.g_verts)), icon='INFO')
         row.operator('mmd_tools.sdef_cache_reset', text='', icon='X')
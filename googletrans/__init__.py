@@ -1,7 +1,7 @@
 """Free Google Translate API for Python. Translates totally free of charge."""
-__all__ = 'Translator',
+__all__ = 'Translator', 'BatchTranslator',
 __version__ = '2.2.0'
 
 
-from .client import Translator
+from .client import Translator, BatchTranslator
 from .constants import LANGCODES, LANGUAGES
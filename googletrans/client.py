@@ -6,8 +6,13 @@ You can translate text using this module.
 """
 import requests
 import random
+import threading
+import time
 import bpy
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
 from . import urls, utils
 from .compat import PY3
 from .gtoken import TokenAcquirer
@@ -53,6 +58,35 @@ class Translator(object):
             return self.service_urls[0]
         return random.choice(self.service_urls)
 
+    def _translate_url(self):
+        host = self._pick_service_url()
+        # Full urls are allowed as well, so that a local server can stand in for Google
+        if host.startswith('http'):
+            return host.rstrip('/') + '/translate_a/single'
+        return urls.TRANSLATE.format(host=host)
+
+    def _check_languages(self, dest, src):
+        dest = dest.lower().split('_', 1)[0]
+        src = src.lower().split('_', 1)[0]
+
+        if src != 'auto' and src not in LANGUAGES:
+            if src in SPECIAL_CASES:
+                src = SPECIAL_CASES[src]
+            elif src in LANGCODES:
+                src = LANGCODES[src]
+            else:
+                raise ValueError('invalid source language')
+
+        if dest not in LANGUAGES:
+            if dest in SPECIAL_CASES:
+                dest = SPECIAL_CASES[dest]
+            elif dest in LANGCODES:
+                dest = LANGCODES[dest]
+            else:
+                raise ValueError('invalid destination language')
+
+        return dest, src
+
     def _translate(self, text, dest, src):
         if not PY3 and isinstance(text, str):  # pragma: nocover
             text = text.decode('utf-8')
@@ -60,8 +94,7 @@ class Translator(object):
         token = self.token_acquirer.do(text)
         params = utils.build_params(query=text, src=src, dest=dest,
                                     token=token)
-        url = urls.TRANSLATE.format(host=self._pick_service_url())
-        r = self.session.get(url, params=params)
+        r = self.session.get(self._translate_url(), params=params)
 
         # print('JSON:', r.text)
 
@@ -107,24 +140,7 @@ class Translator(object):
             jumps over  ->  이상 점프
             the lazy dog  ->  게으른 개
         """
-        dest = dest.lower().split('_', 1)[0]
-        src = src.lower().split('_', 1)[0]
-
-        if src != 'auto' and src not in LANGUAGES:
-            if src in SPECIAL_CASES:
-                src = SPECIAL_CASES[src]
-            elif src in LANGCODES:
-                src = LANGCODES[src]
-            else:
-                raise ValueError('invalid source language')
-
-        if dest not in LANGUAGES:
-            if dest in SPECIAL_CASES:
-                dest = SPECIAL_CASES[dest]
-            elif dest in LANGCODES:
-                dest = LANGCODES[dest]
-            else:
-                raise ValueError('invalid destination language')
+        dest, src = self._check_languages(dest, src)
 
         if isinstance(text, list):
             wm = bpy.context.window_manager
@@ -230,3 +246,192 @@ class Translator(object):
         result = Detected(lang=src, confidence=confidence)
 
         return result
+
+
+class TokenBucket(object):
+    """Thread safe token bucket rate limiter
+
+    :param rate: the amount of tokens that are refilled per second
+    :param capacity: the maximum amount of stored tokens, this is the allowed burst size
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        """Blocks until a token is available and takes it
+        """
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Drains the bucket so that no request is sent by any worker for the given amount of seconds
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class BatchTranslator(Translator):
+    """Translates many texts with only a few requests
+
+    The texts are packed line by line into batches, which are sent by a small pool of workers
+    over the shared session. All workers share one rate limit and back off together
+    when Google answers with 429 or 403.
+
+    :param workers: the amount of requests that are sent at the same time
+    :param max_batch_size: the maximum amount of texts packed into one request
+    :param max_batch_chars: the maximum length of the query of one request
+    :param rate: the amount of requests per second over all workers
+    :param burst: the amount of requests that can be sent at once before the rate limit kicks in
+    :param max_retries: how often a request is retried after getting a 429 or 403
+    :param backoff: the seconds to wait before the first retry, doubled for every further retry
+
+    Basic usage:
+        >>> from googletrans import BatchTranslator
+        >>> translator = BatchTranslator()
+        >>> for translations in translator.translate_batches(['髪', '目', '口']):
+        ...    for translation in translations:
+        ...        print(translation.origin, ' -> ', translation.text)
+        髪  ->  Hair
+        目  ->  Eye
+        口  ->  Mouth
+    """
+
+    RETRY_STATUS_CODES = (429, 403)
+
+    def __init__(self, service_urls=None, user_agent=DEFAULT_USER_AGENT, workers=4, max_batch_size=40,
+                 max_batch_chars=1000, rate=4, burst=4, max_retries=3, backoff=2):
+        super().__init__(service_urls=service_urls, user_agent=user_agent)
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.token_lock = threading.Lock()
+
+        # Keep one pooled connection per worker in the shared session
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _make_batches(self, texts):
+        batches = []
+        batch = []
+        length = 0
+        for text in texts:
+            # Texts with line breaks can't be separated again after the translation
+            if '\n' in text:
+                batches.append([text])
+                continue
+
+            if batch and (len(batch) >= self.max_batch_size or length + len(text) > self.max_batch_chars):
+                batches.append(batch)
+                batch = []
+                length = 0
+
+            batch.append(text)
+            length += len(text) + 1
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _request(self, query, dest, src):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            with self.token_lock:
+                token = self.token_acquirer.do(query)
+            params = utils.build_params(query=query, src=src, dest=dest, token=token)
+            r = self.session.get(self._translate_url(), params=params)
+
+            if r.status_code not in self.RETRY_STATUS_CODES or attempt == self.max_retries:
+                break
+
+            # Google wants us to slow down, so pause all workers before trying again
+            wait = self.backoff * 2 ** attempt
+            retry_after = r.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                wait = max(wait, int(retry_after))
+            print('GOOGLE RATE LIMIT, WAITING', wait, 'SECONDS')
+            self.rate_limiter.pause(wait)
+
+        # The error page of the last attempt raises the same RuntimeError as in the normal translator
+        return utils.format_json(r.text)
+
+    def _translate_batch(self, batch, dest, src):
+        data = self._request('\n'.join(batch), dest, src)
+        translated = ''.join([d[0] if d[0] else '' for d in data[0]])
+
+        try:
+            detected_src = data[2]
+        except Exception:  # pragma: nocover
+            detected_src = src
+
+        if len(batch) == 1:
+            lines = [translated]
+        else:
+            lines = translated.split('\n')
+            if len(lines) != len(batch):
+                # Google merged or split some lines, so translate these texts one by one instead
+                result = []
+                for text in batch:
+                    result += self._translate_batch([text], dest, src)
+                return result
+
+        result = []
+        for text, line in zip(batch, lines):
+            line = line.strip()
+            result.append(Translated(src=detected_src, dest=dest, origin=text, text=line, pronunciation=line))
+        return result
+
+    def translate_batches(self, texts, dest='en', src='auto'):
+        """Translate texts from source language to destination language in batches
+
+        This is a generator which yields a list of :class:`Translated` for every finished batch,
+        so the results can be used while the other batches are still being translated.
+        The batches are yielded in the order they finish, use ``Translated.origin`` to match them.
+
+        :param texts: The source texts to be translated.
+        :type texts: string sequence
+
+        :param dest: The language to translate the source texts into.
+        :param src: The language of the source texts, 'auto' to let Google detect it.
+
+        :rtype: generator of :class:`list` of :class:`Translated`
+        """
+        dest, src = self._check_languages(dest, src)
+
+        batches = self._make_batches(texts)
+        if not batches:
+            return
+
+        # Get the token seed before starting the workers, so that they don't all request it at once
+        self.token_acquirer.do('')
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = [executor.submit(self._translate_batch, batch, dest, src) for batch in batches]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Don't send the remaining requests if an error occurred or the caller stopped early
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
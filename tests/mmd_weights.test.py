@@ -0,0 +1,68 @@
+# MIT License
+
+# Copyright (c) 2017 GiveMeAllYourCats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Code author: GiveMeAllYourCats
+# Repo: https://github.com/michaeldegroot/cats-blender-plugin
+# Edits by: GiveMeAllYourCats
+
+import unittest
+import sys
+import bpy
+import numpy as np
+
+
+class TestAddon(unittest.TestCase):
+    def test_grouped_vertex_weights(self):
+        from mmd_tools_local.core import pmx
+        from mmd_tools_local.core.pmx.importer import VertexGroupWeights
+
+        vertex_count, bone_count = 2000, 20
+        rng = np.random.RandomState(0)
+        arrays = pmx.VertexArrays(vertex_count)
+        arrays.weight_type[:] = rng.randint(0, 4, vertex_count)
+        arrays.bones[:] = rng.randint(-1, bone_count, (vertex_count, 4))
+        arrays.weights[:] = rng.randint(0, 11, (vertex_count, 4)) / 10.0
+        weights = VertexGroupWeights.fromVertexArrays(arrays)
+
+        results = []
+        for assign in (weights.assignPerVertex, weights.assign):
+            mesh = bpy.data.meshes.new(name='weights')
+            mesh.vertices.add(count=vertex_count)
+            obj = bpy.data.objects.new(name='weights', object_data=mesh)
+            assign([obj.vertex_groups.new(name=str(i)) for i in range(bone_count)])
+            results.append([sorted((g.group, round(g.weight, 5)) for g in v.groups) for v in mesh.vertices])
+            bpy.data.objects.remove(obj)
+            bpy.data.meshes.remove(mesh)
+
+        self.assertEqual(results[0], results[1])
+
+    def test_vertex_weights_benchmark(self):
+        from mmd_tools_local.core.pmx.importer import benchmark_vertex_group_weights
+
+        results = benchmark_vertex_group_weights(vertex_count=20000)
+        self.assertEqual(set(results.keys()), {'BDEF1', 'BDEF2', 'BDEF4', 'SDEF'})
+
+
+suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
+runner = unittest.TextTestRunner()
+ret = not runner.run(suite).wasSuccessful()
+sys.exit(ret)
@@ -27,6 +27,49 @@
 import unittest
 import sys
 import bpy
+import json
+import math
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+
+class GoogleStub(BaseHTTPRequestHandler):
+    # Stands in for translate.google.com, the first translation request gets rate limited
+    translate_requests = 0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/translate_a/single':
+            now = math.floor(int(time.time() * 1000) / 3600000.0)
+            self.respond(200, "tkk:'" + str(now) + ".0',")
+            return
+
+        GoogleStub.translate_requests += 1
+        if GoogleStub.translate_requests == 1:
+            self.respond(429, 'Please try your request again later')
+            return
+
+        lines = parse_qs(url.query)['q'][0].split('\n')
+        sentences = [['T ' + line + ('\n' if i < len(lines) - 1 else ''), line, None, None, 1] for i, line in enumerate(lines)]
+        self.respond(200, json.dumps([sentences, None, 'ja']))
+
+    def respond(self, code, text):
+        self.send_response(code)
+        self.end_headers()
+        self.wfile.write(text.encode('utf8'))
+
+    def log_message(self, *args):
+        pass
+
+
+def replace_keys(name, dictionary):
+    # How names were translated before the dictionary matcher: every key in the order of the length sorted dictionary
+    for key, value in dictionary.items():
+        if value and key in name:
+            name = name.replace(key, value)
+    return name
 
 
 class TestAddon(unittest.TestCase):
@@ -34,6 +77,58 @@ class TestAddon(unittest.TestCase):
         result = bpy.ops.cats_translate.shapekeys()
         self.assertTrue(result == {'FINISHED'})
 
+    def test_dictionary_matcher(self):
+        from collections import OrderedDict
+        from cats.tools.translate import DictionaryMatcher, dictionary_file
+
+        with open(dictionary_file, encoding='utf8') as file:
+            entries = json.load(file, object_pairs_hook=OrderedDict)
+        dictionary = OrderedDict((key, entries[key]) for key in sorted(entries, key=lambda k: len(k), reverse=True))
+        matcher = DictionaryMatcher(dictionary)
+
+        # Names made of several keys, where the longest key is not the leftmost one
+        names = [
+            'バニーイヤリング',
+            '赤いりょうひん',
+            'サングラスグリーン',
+            'イエローアンバー',
+            'スライムグリーン',
+            'トランプブラック',
+            'バニーイエロー',
+            'バニーイエローオーカー',
+            'セピアヒル',
+            'バックルビーレッド',
+            '紐ぱんつま',
+            'すじとげ',
+            'とげ右ハ',
+            'はぁとほほ',
+        ]
+        for name in names:
+            self.assertEqual(matcher.translate(name)[0], replace_keys(name, dictionary), name)
+
+        self.assertEqual(matcher.translate('バニーイヤリング'), ('BunnyEarring', 8))
+        self.assertEqual(matcher.translate('赤いりょうひん'), ('RedClothing', 7))
+
+    def test_google_batch_translator(self):
+        from cats.googletrans import BatchTranslator
+
+        server = HTTPServer(('127.0.0.1', 0), GoogleStub)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            translator = BatchTranslator(service_urls=['http://127.0.0.1:' + str(server.server_port)],
+                                         max_batch_size=3, rate=100, burst=10, backoff=0.1)
+            texts = ['名前' + str(i) for i in range(10)]
+            results = {}
+            for translations in translator.translate_batches(texts):
+                for translation in translations:
+                    results[translation.origin] = translation.text
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(results, {text: 'T ' + text for text in texts})
+        self.assertEqual(GoogleStub.translate_requests, 5)  # 4 batches and 1 retry
+
 
 suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestAddon)
 runner = unittest.TextTestRunner()
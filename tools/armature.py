@@ -29,6 +29,7 @@
 import bpy
 import copy
 import math
+import bisect
 from mathutils import Matrix
 
 from . import common as Common
@@ -43,6 +44,54 @@ from mmd_tools_local.operators import morph as Morph
 mmd_tools_installed = True
 
 
+class NameIndex:
+    """Case insensitive lookup of names that returns the same name as a front to back search through the collection would.
+    It has to be kept up to date when names in the collection are added, removed or renamed."""
+    def __init__(self, names):
+        self.entries = {}
+        self.position = 0
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        self.entries.setdefault(name.lower(), []).append((self.position, name))
+        self.position += 1
+
+    def has(self, name):
+        # Exact, case sensitive check
+        return any(entry[1] == name for entry in self.entries.get(name.lower(), []))
+
+    def get(self, name):
+        entries = self.entries.get(name.lower())
+        if entries:
+            return entries[0][1]
+        return None
+
+    def remove(self, name):
+        entries = self.entries.get(name.lower(), [])
+        for i, entry in enumerate(entries):
+            if entry[1] == name:
+                del entries[i]
+                return entry[0]
+        return None
+
+    def rename(self, old_name, new_name):
+        position = self.remove(old_name)
+        if position is not None:
+            # Renaming keeps the position in the collection
+            bisect.insort(self.entries.setdefault(new_name.lower(), []), (position, new_name))
+
+
+def print_double_entries(rules):
+    names = set()
+    for key, value in rules.items():
+        for name in value:
+            if name.lower() not in names:
+                names.add(name.lower())
+            else:
+                print(key + " | " + name)
+
+
 @register_wrap
 class FixArmature(bpy.types.Operator):
     bl_idname = 'cats_armature.fix'
@@ -103,58 +152,20 @@ class FixArmature(bpy.types.Operator):
         # Check if bone matrix == world matrix, important for xps models
         x_cord, y_cord, z_cord, fbx = Common.get_bone_orientations(armature)
 
-        # Add rename bones to reweight bones
-        temp_rename_bones = copy.deepcopy(Bones.bone_rename)
-        temp_reweight_bones = copy.deepcopy(Bones.bone_reweight)
+        # The rename and reweight rules are merged and side expanded once in armature_bones.py
         temp_list_reweight_bones = copy.deepcopy(Bones.bone_list_weight)
         temp_list_reparent_bones = copy.deepcopy(Bones.bone_list_parenting)
 
-        for key, value in Bones.bone_rename_fingers.items():
-            temp_rename_bones[key] = value
-
-        for key, value in temp_rename_bones.items():
-            if key == 'Spine':
-                continue
-            list = temp_reweight_bones.get(key)
-            if not list:
-                temp_reweight_bones[key] = value
-            else:
-                for name in value:
-                    if name not in list:
-                        temp_reweight_bones.get(key).append(name)
-
         # Count objects for loading bar
-        steps = 0
-        for key, value in temp_rename_bones.items():
-            if '\Left' in key or '\L' in key:
-                steps += 2 * len(value)
-            else:
-                steps += len(value)
-        for key, value in temp_reweight_bones.items():
-            if '\Left' in key or '\L' in key:
-                steps += 2 * len(value)
-            else:
-                steps += len(value)
+        steps = len(Bones.bone_rename_compiled) + len(Bones.bone_reweight_compiled)
         steps += len(temp_list_reweight_bones)  # + len(Bones.bone_list_parenting)
 
         # Get Double Entries
         print('DOUBLE ENTRIES:')
         print('RENAME:')
-        list = []
-        for key, value in temp_rename_bones.items():
-            for name in value:
-                if name.lower() not in list:
-                    list.append(name.lower())
-                else:
-                    print(key + " | " + name)
+        print_double_entries(Bones.bone_rename_all)
         print('REWEIGHT:')
-        list = []
-        for key, value in temp_reweight_bones.items():
-            for name in value:
-                if name.lower() not in list:
-                    list.append(name.lower())
-                else:
-                    print(key + " | " + name)
+        print_double_entries(Bones.bone_reweight_all)
         print('DOUBLES END')
 
         # Check if model is mmd model
@@ -323,6 +334,7 @@ class FixArmature(bpy.types.Operator):
             for mesh in Common.get_meshes_objects(mode=2):
                 if mesh.name.endswith('.baked') or mesh.name.endswith('.baked0'):
                     mesh.parent = armature  # TODO
+            Common.invalidate_object_index()
 
         # Fixes bones disappearing, prevents bones from having their tail and head at the exact same position
         Common.fix_zero_length_bones(armature, full_body_tracking, x_cord, y_cord, z_cord)
@@ -641,45 +653,31 @@ class FixArmature(bpy.types.Operator):
         # Rename all the bones
         spines = []
         spine_parts = []
-        for bone_new, bones_old in temp_rename_bones.items():
-            if '\Left' in bone_new or '\L' in bone_new:
-                bones = [[bone_new.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l'), ''],
-                         [bone_new.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r'), '']]
-            else:
-                bones = [[bone_new, '']]
-            for bone_old in bones_old:
-                if '\Left' in bone_new or '\L' in bone_new:
-                    bones[0][1] = bone_old.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l')
-                    bones[1][1] = bone_old.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')
-                else:
-                    bones[0][1] = bone_old
-
-                for bone in bones:  # bone[0] = new name, bone[1] = old name
-                    current_step += 1
-                    wm.progress_update(current_step)
+        bone_index = NameIndex(bone.name for bone in armature.data.edit_bones)
+        for bone_new, new_name, old_name in Bones.bone_rename_compiled:
+            current_step += 1
+            wm.progress_update(current_step)
 
-                    # Seach for bone in armature
-                    bone_final = None
-                    for bone_tmp in armature.data.edit_bones:
-                        if bone_tmp.name.lower() == bone[1].lower():
-                            bone_final = bone_tmp
-                            break
+            # Seach for bone in armature
+            bone_final_name = bone_index.get(old_name)
 
-                    # Cancel if bone was not found
-                    if not bone_final:
-                        continue
+            # Cancel if bone was not found
+            if not bone_final_name:
+                continue
+            bone_final = armature.data.edit_bones.get(bone_final_name)
 
-                    # If spine bone, then don't rename for now, and ignore spines with no children
-                    if bone_new == 'Spine':
-                        if len(bone_final.children) > 0:
-                            spines.append(bone_final.name)
-                        else:
-                            spine_parts.append(bone_final.name)
-                        continue
+            # If spine bone, then don't rename for now, and ignore spines with no children
+            if bone_new == 'Spine':
+                if len(bone_final.children) > 0:
+                    spines.append(bone_final.name)
+                else:
+                    spine_parts.append(bone_final.name)
+                continue
 
-                    # Rename the bone
-                    if bone[0] not in armature.data.edit_bones:
-                        bone_final.name = bone[0]
+            # Rename the bone
+            if new_name not in armature.data.edit_bones:
+                bone_final.name = new_name
+                bone_index.rename(bone_final_name, bone_final.name)
 
         # Check if it is a mixamo model
         mixamo = False
@@ -1006,6 +1004,11 @@ class FixArmature(bpy.types.Operator):
         # Fixes bones disappearing, prevents bones from having their tail and head at the exact same position
         Common.fix_zero_length_bones(armature, full_body_tracking, x_cord, y_cord, z_cord)
 
+        # Bones are looked up case insensitive, the last match wins like in the original search
+        data_bones = {}
+        for bone in armature.data.bones:
+            data_bones[bone.name.lower()] = bone
+
         # Mixing the weights
         for mesh in meshes:
             Common.unselect_all()
@@ -1023,107 +1026,74 @@ class FixArmature(bpy.types.Operator):
                 if mod.type == 'ARMATURE':
                     bpy.ops.object.modifier_remove(modifier=mod.name)
 
-            # Add bones to parent reweight list
-            for name in Bones.bone_reweigth_to_parent:
-                if '\Left' in name or '\L' in name:
-                    bones = [name.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l'),
-                             name.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')]
-                else:
-                    bones = [name]
+            # All weight merges are collected first and then applied together, vg_index keeps track of the resulting vertex groups
+            vg_index = NameIndex(vg.name for vg in mesh.vertex_groups)
+            merges = []
 
-                for bone_name in bones:
-                    bone_child = None
-                    bone_parent = None
-                    for bone in armature.data.bones:
-                        if bone_name.lower() == bone.name.lower():
-                            bone_child = bone
-                            bone_parent = bone.parent
+            # Add bones to parent reweight list
+            for bone_name in Bones.bone_reweigth_to_parent_compiled:
+                bone_child = data_bones.get(bone_name.lower())
+                if not bone_child or not bone_child.parent:
+                    continue
+                bone_parent = bone_child.parent
 
-                    if not bone_child or not bone_parent:
-                        continue
+                # search for next parent that is not in the "reweight to parent" list
+                while bone_parent and bone_parent.name in Bones.bone_reweigth_to_parent_names:
+                    bone_parent = bone_parent.parent
 
-                    # search for next parent that is not in the "reweight to parent" list
-                    parent_in_list = True
-                    while parent_in_list:
-                        parent_in_list = False
-                        for name_tmp in Bones.bone_reweigth_to_parent:
-                            if bone_parent.name == name_tmp.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l') \
-                                    or bone_parent.name == name_tmp.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r'):
-                                bone_parent = bone_parent.parent
-                                parent_in_list = True
-                                break
-
-                    if not bone_parent:
-                        continue
+                if not bone_parent:
+                    continue
 
-                    if bone_child.name not in mesh.vertex_groups:
-                        continue
+                if not vg_index.has(bone_child.name):
+                    continue
 
-                    if bone_parent.name not in mesh.vertex_groups:
-                        mesh.vertex_groups.new(bone_parent.name)
+                if not vg_index.has(bone_parent.name):
+                    vg_index.add(bone_parent.name)
 
-                    bone_tmp = armature.data.bones.get(bone_child.name)
-                    if bone_tmp:
-                        for child in bone_tmp.children:
-                            if not temp_list_reparent_bones.get(child.name):
-                                temp_list_reparent_bones[child.name] = bone_parent.name
+                bone_tmp = armature.data.bones.get(bone_child.name)
+                if bone_tmp:
+                    for child in bone_tmp.children:
+                        if not temp_list_reparent_bones.get(child.name):
+                            temp_list_reparent_bones[child.name] = bone_parent.name
 
-                    # Mix the weights
-                    Common.mix_weights(mesh, bone_child.name, bone_parent.name)
+                # Mix the weights
+                merges.append((bone_child.name, bone_parent.name))
+                vg_index.remove(bone_child.name)
 
             # Mix weights
-            for bone_new, bones_old in temp_reweight_bones.items():
-                if '\Left' in bone_new or '\L' in bone_new:
-                    bones = [[bone_new.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l'), ''],
-                             [bone_new.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r'), '']]
-                else:
-                    bones = [[bone_new, '']]
-                for bone_old in bones_old:
-                    if '\Left' in bone_new or '\L' in bone_new:
-                        bones[0][1] = bone_old.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l')
-                        bones[1][1] = bone_old.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')
+            for bone_new, new_name, old_name in Bones.bone_reweight_compiled:
+                current_step += 1
+                wm.progress_update(current_step)
+
+                # Seach for vertex group
+                vg_name = vg_index.get(old_name)
+
+                # Cancel if vertex group was not found
+                if not vg_name:
+                    continue
+
+                if new_name == vg_name:
+                    print('BUG: ' + new_name + ' tried to mix weights with itself!')
+                    continue
+
+                # print(old_name + " to1 " + new_name)
+
+                # If important vertex group is not there create it
+                if not vg_index.has(new_name):
+                    if new_name in Bones.dont_delete_these_bones and new_name in armature.data.bones:
+                        vg_index.add(new_name)
                     else:
-                        bones[0][1] = bone_old
-
-                    for bone in bones:  # bone[0] = new name, bone[1] = old name
-                        current_step += 1
-                        wm.progress_update(current_step)
-
-                        # Seach for vertex group
-                        vg = None
-                        for vg_tmp in mesh.vertex_groups:
-                            if vg_tmp.name.lower() == bone[1].lower():
-                                vg = vg_tmp
-                                break
-
-                        # Cancel if vertex group was not found
-                        if not vg:
-                            continue
-
-                        if bone[0] == vg.name:
-                            print('BUG: ' + bone[0] + ' tried to mix weights with itself!')
-                            continue
-
-                        # print(bone[1] + " to1 " + bone[0])
-
-                        # If important vertex group is not there create it
-                        if mesh.vertex_groups.get(bone[0]) is None:
-                            if bone[0] in Bones.dont_delete_these_bones and bone[0] in armature.data.bones:
-                                bpy.ops.object.vertex_group_add()
-                                mesh.vertex_groups.active.name = bone[0]
-                                if mesh.vertex_groups.get(bone[0]) is None:
-                                    continue
-                            else:
-                                continue
+                        continue
 
-                        bone_tmp = armature.data.bones.get(vg.name)
-                        if bone_tmp:
-                            for child in bone_tmp.children:
-                                if not temp_list_reparent_bones.get(child.name):
-                                    temp_list_reparent_bones[child.name] = bone[0]
+                bone_tmp = armature.data.bones.get(vg_name)
+                if bone_tmp:
+                    for child in bone_tmp.children:
+                        if not temp_list_reparent_bones.get(child.name):
+                            temp_list_reparent_bones[child.name] = new_name
 
-                        # print(vg.name + " to " + bone[0])
-                        Common.mix_weights(mesh, vg.name, bone[0])
+                # print(vg_name + " to " + new_name)
+                merges.append((vg_name, new_name))
+                vg_index.remove(vg_name)
 
             # Old mixing weights. Still important
             for key, value in temp_list_reweight_bones.items():
@@ -1131,35 +1101,29 @@ class FixArmature(bpy.types.Operator):
                 wm.progress_update(current_step)
 
                 # Search for vertex groups
-                vg_from = None
-                vg_to = None
-                for vg_tmp in mesh.vertex_groups:
-                    if vg_tmp.name.lower() == key.lower():
-                        vg_from = vg_tmp
-                        if vg_to:
-                            break
-                    elif vg_tmp.name.lower() == value.lower():
-                        vg_to = vg_tmp
-                        if vg_from:
-                            break
+                vg_from = vg_index.get(key)
+                vg_to = vg_index.get(value)
 
                 # Cancel if vertex groups was not found
-                if not vg_from or not vg_to:
+                if not vg_from or not vg_to or key.lower() == value.lower():
                     continue
 
-                bone_tmp = armature.data.bones.get(vg_from.name)
+                bone_tmp = armature.data.bones.get(vg_from)
                 if bone_tmp:
                     for child in bone_tmp.children:
                         if not temp_list_reparent_bones.get(child.name):
-                            temp_list_reparent_bones[child.name] = vg_to.name
+                            temp_list_reparent_bones[child.name] = vg_to
 
-                if vg_from.name == vg_to.name:
-                    print('BUG: ' + vg_to.name + ' tried to mix weights with itself!')
+                if vg_from == vg_to:
+                    print('BUG: ' + vg_to + ' tried to mix weights with itself!')
                     continue
 
                 # Mix the weights
-                # print(vg_from.name, 'into', vg_to.name)
-                Common.mix_weights(mesh, vg_from.name, vg_to.name)
+                # print(vg_from, 'into', vg_to)
+                merges.append((vg_from, vg_to))
+                vg_index.remove(vg_from)
+
+            Common.mix_weights_batch(mesh, merges)
 
             # Put back armature modifier
             mod = mesh.modifiers.new("Armature", 'ARMATURE')
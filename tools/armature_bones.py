@@ -2020,3 +2020,66 @@ bone_rename_fingers['LittleFinger3_\L'] = [
     'J_Bip_\L_Little3',
     'Bip_FPinky02_\L',
 ]
+
+
+################################
+# Precompiled rule tables
+# Everything below is built once when Cats is loaded so that Fix Model doesn't have to merge the tables
+# and expand the side patterns again for every model
+################################
+def has_side(name):
+    return '\Left' in name or '\L' in name
+
+
+def replace_side(name, right=False):
+    if right:
+        return name.replace('\Left', 'Right').replace('\left', 'right').replace('\L', 'R').replace('\l', 'r')
+    return name.replace('\Left', 'Left').replace('\left', 'left').replace('\L', 'L').replace('\l', 'l')
+
+
+def compile_rules(rules):
+    # Returns a list of (rule name, new name, old name) in the order Fix Model processes them
+    compiled = []
+    for bone_new, bones_old in rules.items():
+        for bone_old in bones_old:
+            if has_side(bone_new):
+                compiled.append((bone_new, replace_side(bone_new), replace_side(bone_old)))
+                compiled.append((bone_new, replace_side(bone_new, right=True), replace_side(bone_old, right=True)))
+            else:
+                compiled.append((bone_new, bone_new, bone_old))
+    return compiled
+
+
+# Add finger bones to rename bones
+bone_rename_all = OrderedDict()
+for key, value in bone_rename.items():
+    bone_rename_all[key] = value
+for key, value in bone_rename_fingers.items():
+    bone_rename_all[key] = value
+
+# Add rename bones to reweight bones
+bone_reweight_all = OrderedDict()
+for key, value in bone_reweight.items():
+    bone_reweight_all[key] = list(value)
+for key, value in bone_rename_all.items():
+    if key == 'Spine':
+        continue
+    names = bone_reweight_all.get(key)
+    if not names:
+        bone_reweight_all[key] = list(value)
+    else:
+        for name in value:
+            if name not in names:
+                names.append(name)
+
+bone_rename_compiled = compile_rules(bone_rename_all)
+bone_reweight_compiled = compile_rules(bone_reweight_all)
+
+bone_reweigth_to_parent_compiled = []
+for name in bone_reweigth_to_parent:
+    if has_side(name):
+        bone_reweigth_to_parent_compiled.append(replace_side(name))
+        bone_reweigth_to_parent_compiled.append(replace_side(name, right=True))
+    else:
+        bone_reweigth_to_parent_compiled.append(name)
+bone_reweigth_to_parent_names = set(bone_reweigth_to_parent_compiled)
@@ -141,6 +141,7 @@ class AttachMesh(bpy.types.Operator):
         # Reparent mesh to new armature
         mesh.parent = new_armature
         mesh.parent_type = 'OBJECT'
+        Common.invalidate_object_index()
 
         # Rename bone in new armature
         new_armature.data.bones.get('Bone').name = attach_bone_name
@@ -293,6 +294,7 @@ def merge_armatures(base_armature_name, merge_armature_name, mesh_only, mesh_nam
     # Join the armatures
     if bpy.ops.object.join.poll():
         bpy.ops.object.join()
+        Common.invalidate_object_index()
 
     # Set new armature
     bpy.context.scene.armature = base_armature_name
@@ -348,6 +350,7 @@ def merge_armatures(base_armature_name, merge_armature_name, mesh_only, mesh_nam
     Common.set_active(mesh_merged)
     if not mesh_only:
         to_delete = []
+        merges = []
         for bone_name in bones_to_merge:
             bone_base = bone_name
             bone_merge = bone_name + '.merge'
@@ -356,8 +359,9 @@ def merge_armatures(base_armature_name, merge_armature_name, mesh_only, mesh_nam
             vg_merge = mesh_merged.vertex_groups.get(bone_merge)
 
             if vg_base and vg_merge:
-                Common.mix_weights(mesh_merged, bone_merge, bone_base)
+                merges.append((bone_merge, bone_base))
                 to_delete.append(bone_merge)
+        Common.mix_weights_batch(mesh_merged, merges)
 
         Common.set_active(armature)
         Common.switch('EDIT')
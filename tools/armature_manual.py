@@ -664,13 +664,7 @@ def merge_weights(armature, parenting_list):
     # Merge the weights on the meshes
     for mesh in Common.get_meshes_objects(armature_name=armature.name):
         Common.set_active(mesh)
-
-        for bone, parent in parenting_list.items():
-            if not mesh.vertex_groups.get(bone):
-                continue
-            if not mesh.vertex_groups.get(parent):
-                mesh.vertex_groups.new(name=parent)
-            Common.mix_weights(mesh, bone, parent)
+        Common.mix_weights_batch(mesh, list(parenting_list.items()))
 
     # Select armature
     Common.unselect_all()
@@ -1293,7 +1287,7 @@ class DuplicateBonesButton(bpy.types.Operator):
 
             for bone_from, bone_to in duplicate_vertex_groups.items():
                 mesh.vertex_groups.new(name=bone_to)
-                Common.mix_weights(mesh, bone_from, bone_to, delete_old_vg=False)
+            Common.mix_weights_batch(mesh, list(duplicate_vertex_groups.items()), delete_old_vg=False)
 
         saved_data.load()
 
@@ -73,6 +73,11 @@ class BoneMergeButton(bpy.types.Operator):
         wm = bpy.context.window_manager
         wm.progress_begin(did, todo)
 
+        # The merges are only planned while walking the bones and then applied all at once
+        self.merges = []
+        self.removed_bones = set()
+        self.vertex_groups = set(vg.name for vg in mesh.vertex_groups)
+
         # Start the bone check for every parent
         for bone_name in parent_bones:
             print('\nPARENT: ' + bone_name)
@@ -91,6 +96,19 @@ class BoneMergeButton(bpy.types.Operator):
                 did += 1
                 wm.progress_update(did)
 
+        # Mix the weights
+        Common.set_default_stage()
+        Common.set_active(mesh)
+        Common.mix_weights_batch(mesh, self.merges)
+
+        # Remove the merged bones
+        armature = Common.set_default_stage()
+        Common.switch('EDIT')
+        for bone_name in self.removed_bones:
+            bone = armature.data.edit_bones.get(bone_name)
+            if bone:
+                armature.data.edit_bones.remove(bone)
+
         saved_data.load()
 
         wm.progress_end()
@@ -116,8 +134,13 @@ class BoneMergeButton(bpy.types.Operator):
         if i >= 100:
             i -= 100
 
-            if bone.parent is not None:
-                parent_name = bone.parent.name
+            # Bones that are planned to be removed are skipped, their children will end up at the next remaining parent
+            parent = bone.parent
+            while parent is not None and parent.name in self.removed_bones:
+                parent = parent.parent
+
+            if parent is not None:
+                parent_name = parent.name
 
                 print('Merging ' + bone_name + ' into ' + parent_name+ ' with ratio ' + str(i) )
 
@@ -129,21 +152,15 @@ class BoneMergeButton(bpy.types.Operator):
                 # parent = armature.data.edit_bones.get(parent_name)
                 # parent.tail = child.tail
 
-                # Mix the weights
-                Common.set_default_stage()
-                Common.set_active(mesh)
-
-                vg = mesh.vertex_groups.get(bone_name)
-                vg2 = mesh.vertex_groups.get(parent_name)
-                if vg is not None and vg2 is not None:
-                    Common.mix_weights(mesh, bone_name, parent_name)
+                # Plan to mix the weights
+                if bone_name in self.vertex_groups and parent_name in self.vertex_groups:
+                    self.merges.append((bone_name, parent_name))
+                    self.vertex_groups.remove(bone_name)
 
-                Common.set_default_stage()
+                # We are done, remove the bone later
+                self.removed_bones.add(bone_name)
 
-                # We are done, remove the bone
-                Common.remove_bone(bone_name)
-
-        armature = Common.set_default_stage()
+        armature = Common.get_armature()
         for child in children:
             bone = armature.data.bones.get(child)
             if bone is not None:
@@ -27,9 +27,11 @@
 import re
 import bpy
 import time
+import numpy as np
 
 from math import degrees
 from mathutils import Vector
+from bpy.app.handlers import persistent
 from datetime import datetime
 from html.parser import HTMLParser
 from html.entities import name2codepoint
@@ -39,6 +41,7 @@ from . import supporter as Supporter
 from . import decimation as Decimation
 from . import translate as Translate
 from . import armature_bones as Bones
+from . import register as Register
 from .register import register_wrap
 from mmd_tools_local import utils
 
@@ -288,6 +291,7 @@ def remove_empty():
         set_active(armature.parent)
         bpy.ops.object.delete(use_global=False)
         unselect_all()
+        invalidate_object_index()
 
 
 def get_bone_angle(p1, p2):
@@ -299,71 +303,123 @@ def get_bone_angle(p1, p2):
     return ret
 
 
+def get_weight_table(mesh):
+    """Returns all vertex weights of a mesh as three parallel numpy arrays: vertex indices, group indices and weights.
+    Blender has no bulk access to vertex group assignments, so this is the only pass over the vertices that is needed.
+    Everything else can then be answered with array operations."""
+    vert_indices = []
+    group_indices = []
+    weights = []
+
+    for vert in mesh.data.vertices:
+        for group in vert.groups:
+            vert_indices.append(vert.index)
+            group_indices.append(group.group)
+            weights.append(group.weight)
+
+    return np.array(vert_indices, dtype=np.int32), np.array(group_indices, dtype=np.int32), np.array(weights, dtype=np.float32)
+
+
+def get_used_group_indices(mesh, thres=0, weight_table=None):
+    """Returns the set of vertex group indices that have at least one weight above the threshold"""
+    if weight_table is None:
+        weight_table = get_weight_table(mesh)
+    _, group_indices, weights = weight_table
+    return set(np.unique(group_indices[weights > thres]).tolist())
+
+
+def get_vertex_coordinates(mesh):
+    coords = np.empty(len(mesh.data.vertices) * 3, dtype=np.float32)
+    mesh.data.vertices.foreach_get('co', coords)
+    return coords.reshape(-1, 3)
+
+
 def remove_unused_vertex_groups(ignore_main_bones=False):
     unselect_all()
     for ob in get_objects():
         if ob.type == 'MESH':
             ob.update_from_editmode()
 
-            vgroup_used = {i: False for i, k in enumerate(ob.vertex_groups)}
+            used_groups = get_used_group_indices(ob)
 
-            for v in ob.data.vertices:
-                for g in v.groups:
-                    if g.weight > 0.0:
-                        vgroup_used[g.group] = True
-
-            for i, used in sorted(vgroup_used.items(), reverse=True):
-                if not used:
+            for i in reversed(range(len(ob.vertex_groups))):
+                if i not in used_groups:
                     if ignore_main_bones and ob.vertex_groups[i].name in Bones.dont_delete_these_main_bones:
                         continue
                     ob.vertex_groups.remove(ob.vertex_groups[i])
 
 
 def find_center_vector_of_vertex_group(mesh, vertex_group):
-    data = mesh.data
-    verts = data.vertices
-    verts_in_group = []
+    group_index = mesh.vertex_groups[vertex_group].index
+    vert_indices, group_indices, weights = get_weight_table(mesh)
 
-    for vert in verts:
-        i = vert.index
-        try:
-            if mesh.vertex_groups[vertex_group].weight(i) > 0:
-                verts_in_group.append(vert)
-        except RuntimeError:
-            # vertex is not in the group
-            pass
+    verts_in_group = vert_indices[(group_indices == group_index) & (weights > 0)]
 
     # Find the average vector point of the vertex cluster
-    divide_by = len(verts_in_group)
-    total = Vector()
-
-    if divide_by == 0:
+    if verts_in_group.size == 0:
         return False
 
-    for vert in verts_in_group:
-        total += vert.co
-
-    average = total / divide_by
+    coords = get_vertex_coordinates(mesh)
+    average = coords[verts_in_group].mean(axis=0, dtype=np.float64)
 
-    return average
+    return Vector(average)
 
 
 def vertex_group_exists(mesh_name, bone_name):
     mesh = get_objects()[mesh_name]
-    data = mesh.data
-    verts = data.vertices
+    vertex_group = mesh.vertex_groups.get(bone_name)
+    if vertex_group is None:
+        return False
 
-    for vert in verts:
-        i = vert.index
-        try:
-            mesh.vertex_groups[bone_name].weight(i)
-            return True
-        except:
-            pass
+    _, group_indices, _ = get_weight_table(mesh)
+    return bool(np.any(group_indices == vertex_group.index))
+
+
+# Increased on every depsgraph update, used together with the finished Cats operators to detect scene changes
+_scene_version = 0
+
+# Cached EnumProperty items. Blender needs the returned items to stay referenced, which this cache also takes care of
+_enum_cache = {}
+_enum_cache_version = None
+
+
+def get_scene_version():
+    return _scene_version, Register.get_finished_operator_count()
 
-    return False
 
+def get_cached_enum(key, build_items):
+    """Returns the items of an EnumProperty callback and only builds them again after the scene changed.
+    'key' has to contain everything besides the scene content that the items depend on."""
+    global _enum_cache_version
 
+    # Operators rename and create bones and shape keys and read the enums back right away, so never cache during them
+    if Register.is_operator_running():
+        return build_items()
+
+    version = get_scene_version()
+    if version != _enum_cache_version:
+        _enum_cache.clear()
+        _enum_cache_version = version
+
+    items = _enum_cache.get(key)
+    if items is None:
+        items = _enum_cache[key] = build_items()
+    return items
+
+
+def cached_enum(get_key=None):
+    """Decorator for EnumProperty item callbacks, see get_cached_enum"""
+    def decorator(func):
+        def wrapper(self, context):
+            key = (func.__name__,) + (get_key(context) if get_key else ())
+            return get_cached_enum(key, lambda: func(self, context))
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+@cached_enum(lambda context: (bpy.context.scene.armature,))
 def get_meshes(self, context):
     # Modes:
     # 0 = With Armature only
@@ -379,6 +435,7 @@ def get_meshes(self, context):
     return bpy.types.Object.Enum
 
 
+@cached_enum()
 def get_top_meshes(self, context):
     choices = []
 
@@ -389,6 +446,7 @@ def get_top_meshes(self, context):
     return bpy.types.Object.Enum
 
 
+@cached_enum()
 def get_all_meshes(self, context):
     choices = []
 
@@ -399,6 +457,7 @@ def get_all_meshes(self, context):
     return bpy.types.Object.Enum
 
 
+@cached_enum()
 def get_armature_list(self, context):
     choices = []
 
@@ -420,6 +479,7 @@ def get_armature_list(self, context):
     return bpy.types.Object.Enum
 
 
+@cached_enum(lambda context: (context.scene.merge_armature_into,))
 def get_armature_merge_list(self, context):
     choices = []
     current_armature = context.scene.merge_armature_into
@@ -443,18 +503,17 @@ def get_armature_merge_list(self, context):
     return bpy.types.Object.Enum
 
 
+@cached_enum(lambda context: (bpy.context.scene.armature, tuple(Decimation.ignore_meshes)))
 def get_meshes_decimation(self, context):
     choices = []
 
-    for object in bpy.context.scene.objects:
-        if object.type == 'MESH':
-            if object.parent is not None and object.parent.type == 'ARMATURE' and object.parent.name == bpy.context.scene.armature:
-                if object.name in Decimation.ignore_meshes:
-                    continue
-                # 1. Will be returned by context.scene
-                # 2. Will be shown in lists
-                # 3. will be shown in the hover description (below description)
-                choices.append((object.name, object.name, object.name))
+    for mesh in get_meshes_objects(check=False):
+        if mesh.name in Decimation.ignore_meshes:
+            continue
+        # 1. Will be returned by context.scene
+        # 2. Will be shown in lists
+        # 3. will be shown in the hover description (below description)
+        choices.append((mesh.name, mesh.name, mesh.name))
 
     bpy.types.Object.Enum = sorted(choices, key=lambda x: tuple(x[0].lower()))
     return bpy.types.Object.Enum
@@ -483,6 +542,10 @@ def get_bones(names=None, armature_name=None):
     if not armature_name:
         armature_name = bpy.context.scene.armature
 
+    return get_cached_enum(('get_bones', armature_name, tuple(names)), lambda: _get_bones(names, armature_name))
+
+
+def _get_bones(names, armature_name):
     choices = []
     armature = get_armature(armature_name=armature_name)
 
@@ -561,8 +624,15 @@ def get_shapekeys_decimation_list(self, context):
 # names - The first object will be the first one in the list. So the first one has to be the one that exists in the most models
 # no_basis - If this is true the Basis will not be available in the list
 def get_shapekeys(context, names, is_mouth, no_basis, decimation, return_list):
+    key = ('get_shapekeys', tuple(names), is_mouth, no_basis, decimation, return_list, context.scene.armature,
+           context.scene.mesh_name_viseme if is_mouth else context.scene.mesh_name_eye,
+           tuple(Decimation.ignore_shapes) if decimation else ())
+    return get_cached_enum(key, lambda: _get_shapekeys(context, names, is_mouth, no_basis, decimation, return_list))
+
+
+def _get_shapekeys(context, names, is_mouth, no_basis, decimation, return_list):
     choices = []
-    choices_simple = []
+    choices_simple = set()
     meshes_list = get_meshes_objects(check=False)
 
     if decimation:
@@ -593,7 +663,7 @@ def get_shapekeys(context, names, is_mouth, no_basis, decimation, return_list):
             # 2. Will be shown in lists
             # 3. will be shown in the hover description (below description)
             choices.append((name, name, name))
-            choices_simple.append(name)
+            choices_simple.add(name)
 
     choices.sort(key=lambda x: tuple(x[0].lower()))
 
@@ -627,6 +697,7 @@ def fix_armature_names(armature_name=None):
     # Armature should be named correctly (has to be at the end because of multiple armatures)
     armature = get_armature(armature_name=armature_name)
     armature.name = 'Armature'
+    invalidate_object_index()
     if not armature.data.name.startswith('Armature'):
         Translate.update_dictionary(armature.data.name)
         armature.data.name = 'Armature (' + Translate.translate(armature.data.name, add_space=True)[0] + ')'
@@ -660,6 +731,97 @@ def get_texture_sizes(self, context):
     return bpy.types.Object.Enum
 
 
+# Index of the mesh objects in the scene, built on demand and dropped whenever the depsgraph reports an update,
+# an operator finishes or a helper below adds, renames or reparents objects.
+# Stores names only, objects are always looked up again so that undo can never leave stale references behind.
+_object_index = None
+
+# Meshes that already passed the corruption check since the last depsgraph update
+_checked_meshes = set()
+
+
+class _ObjectIndex:
+    def __init__(self):
+        self.version = get_scene_version()
+        self.all_meshes = []
+        self.top_meshes = []
+        self.armature_meshes = {}
+
+        for ob in get_objects():
+            if ob.type != 'MESH':
+                continue
+
+            self.all_meshes.append(ob.name)
+
+            if not ob.parent:
+                self.top_meshes.append(ob.name)
+                continue
+
+            # A mesh belongs to its parent armature and to the armature of its parent
+            if ob.parent.type == 'ARMATURE':
+                self.armature_meshes.setdefault(ob.parent.name, []).append(ob.name)
+            if ob.parent.parent and ob.parent.parent.type == 'ARMATURE' and ob.parent.parent.name != ob.parent.name:
+                self.armature_meshes.setdefault(ob.parent.parent.name, []).append(ob.name)
+
+    def get_meshes(self, mode, armature_name=None):
+        if mode == 0:
+            names = self.armature_meshes.get(armature_name, [])
+        elif mode == 1:
+            names = self.top_meshes
+        else:
+            names = self.all_meshes
+
+        objects = get_objects()
+        meshes = []
+        for name in names:
+            mesh = objects.get(name)
+            if mesh is None or mesh.type != 'MESH':
+                return None
+            meshes.append(mesh)
+        return meshes
+
+
+def get_object_index(rebuild=False):
+    global _object_index
+    if rebuild or _object_index is None or _object_index.version != get_scene_version():
+        _object_index = _ObjectIndex()
+    return _object_index
+
+
+def invalidate_object_index():
+    global _object_index, _scene_version
+    _object_index = None
+    _checked_meshes.clear()
+    _scene_version += 1
+
+
+@persistent
+def object_index_update_handler(*args):
+    # Pre 2.80 this runs after every scene update, so only react to changes of actual data there
+    if version_2_79_or_older() and not (bpy.data.objects.is_updated or bpy.data.meshes.is_updated or bpy.data.shape_keys.is_updated):
+        return
+    invalidate_object_index()
+
+
+def _get_object_index_handler_lists():
+    handlers = bpy.app.handlers
+    update_handlers = handlers.scene_update_post if version_2_79_or_older() else handlers.depsgraph_update_post
+    return [update_handlers, handlers.undo_post, handlers.redo_post, handlers.load_post]
+
+
+def register_object_index_handler():
+    for handler_list in _get_object_index_handler_lists():
+        if object_index_update_handler not in handler_list:
+            handler_list.append(object_index_update_handler)
+
+
+def unregister_object_index_handler():
+    for handler_list in _get_object_index_handler_lists():
+        if object_index_update_handler in handler_list:
+            handler_list.remove(object_index_update_handler)
+    invalidate_object_index()
+
+
 def get_meshes_objects(armature_name=None, mode=0, check=True):
     # Modes:
     # 0 = With armatures only
@@ -667,51 +829,45 @@ def get_meshes_objects(armature_name=None, mode=0, check=True):
     # 2 = All meshes
     # 3 = Selected only
 
-    meshes = []
-    for ob in get_objects():
-        if ob.type == 'MESH':
-            if mode == 0:
-                if not armature_name:
-                    armature_name = bpy.context.scene.armature
-                if ob.parent:
-                    if ob.parent.type == 'ARMATURE' and ob.parent.name == armature_name:
-                        meshes.append(ob)
-                    elif ob.parent.parent and ob.parent.parent.type == 'ARMATURE' and ob.parent.parent.name == armature_name:
-                        meshes.append(ob)
-
-            elif mode == 1:
-                if not ob.parent:
-                    meshes.append(ob)
-
-            elif mode == 2:
-                meshes.append(ob)
-
-            elif mode == 3:
-                if is_selected(ob):
-                    meshes.append(ob)
-
-    # Check for broken meshes and delete them
+    if mode == 3:
+        meshes = [ob for ob in get_objects() if ob.type == 'MESH' and is_selected(ob)]
+    else:
+        if mode == 0 and not armature_name:
+            armature_name = bpy.context.scene.armature
+
+        meshes = get_object_index().get_meshes(mode, armature_name)
+        if meshes is None:
+            # Something got renamed or deleted since the index was built
+            meshes = get_object_index(rebuild=True).get_meshes(mode, armature_name)
+
+    # Check for broken meshes and delete them, but only once per mesh until the scene changes
     if check:
-        current_active = get_active()
-        to_remove = []
-        for mesh in meshes:
-            selected = is_selected(mesh)
-            print(mesh.name, mesh.users)
-            set_active(mesh)
+        to_check = [mesh for mesh in meshes if mesh.name not in _checked_meshes]
+        if to_check:
+            current_active = get_active()
+            to_remove = []
+            for mesh in to_check:
+                selected = is_selected(mesh)
+                set_active(mesh)
+
+                if not get_active():
+                    to_remove.append(mesh)
+                else:
+                    _checked_meshes.add(mesh.name)
 
-            if not get_active():
-                to_remove.append(mesh)
+                if not selected:
+                    select(mesh, False)
 
-            if not selected:
-                select(mesh, False)
+            for mesh in to_remove:
+                print('DELETED CORRUPTED MESH:', mesh.name, mesh.users)
+                meshes.remove(mesh)
+                delete(mesh)
 
-        for mesh in to_remove:
-            print('DELETED CORRUPTED MESH:', mesh.name, mesh.users)
-            meshes.remove(mesh)
-            delete(mesh)
+            if to_remove:
+                invalidate_object_index()
 
-        if current_active:
-            set_active(current_active)
+            if current_active:
+                set_active(current_active)
 
     return meshes
 
@@ -779,6 +935,7 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
     # Join the meshes
     if bpy.ops.object.join.poll():
         bpy.ops.object.join()
+        invalidate_object_index()
     else:
         print('NO MESH COMBINED!')
 
@@ -796,6 +953,7 @@ def join_meshes(armature_name=None, mode=0, apply_transformations=True, repair_s
         # If its the only mesh in the armature left, rename it to Body
         if len(get_meshes_objects(armature_name=armature_name)) == 1:
             mesh.name = 'Body'
+            invalidate_object_index()
         mesh.parent_type = 'OBJECT'
 
         # Remove duplicate armature modifiers
@@ -900,6 +1058,7 @@ def separate_by_loose_parts(context, mesh):
         unselect_all()
         set_active(mesh)
         bpy.ops.mesh.separate(type='LOOSE')
+        invalidate_object_index()
 
         meshes2 = []
         for ob in context.selected_objects:
@@ -937,14 +1096,12 @@ def separate_by_shape_keys(context, mesh):
     bpy.ops.mesh.select_all(action='DESELECT')
 
     switch('OBJECT')
-    for kb in mesh.data.shape_keys.key_blocks:
-        for i, (v0, v1) in enumerate(zip(kb.relative_key.data, kb.data)):
-            if v0.co != v1.co:
-                mesh.data.vertices[i].select = True
+    mesh.data.vertices.foreach_set('select', get_shape_key_deformed_mask(mesh))
     switch('EDIT')
     bpy.ops.mesh.select_all(action='INVERT')
 
     bpy.ops.mesh.separate(type='SELECTED')
+    invalidate_object_index()
 
     for ob in context.selected_objects:
         if ob.type == 'MESH':
@@ -1018,6 +1175,7 @@ def separate_by_verts():
             bpy.ops.object.vertex_group_select()
             bpy.ops.mesh.separate(type='SELECTED')
         bpy.ops.object.mode_set(mode='OBJECT')
+        invalidate_object_index()
 
 
 def reset_context_scenes():
@@ -1129,6 +1287,7 @@ def update_shapekey_orders():
 
 
 def sort_shape_keys(mesh_name, shape_key_order=None):
+    start_time = time.time()
     mesh = get_objects()[mesh_name]
     if not has_shapekeys(mesh):
         return
@@ -1165,57 +1324,53 @@ def sort_shape_keys(mesh_name, shape_key_order=None):
         if shape not in order:
             order.append(shape)
 
-    wm = bpy.context.window_manager
-    current_step = 0
-    wm.progress_begin(current_step, len(order))
-
-    i = 0
-    for name in order:
-        if name == 'Basis' and 'Basis' not in mesh.data.shape_keys.key_blocks:
-            i += 1
-            current_step += 1
-            wm.progress_update(current_step)
-            continue
-
-        for index, shapekey in enumerate(mesh.data.shape_keys.key_blocks):
-            if shapekey.name == name:
-
-                mesh.active_shape_key_index = index
-                new_index = i
-                index_diff = (index - new_index)
-
-                if new_index >= len(mesh.data.shape_keys.key_blocks):
-                    bpy.ops.object.shape_key_move(type='BOTTOM')
-                    break
-
-                position_correct = False
-                if 0 <= index_diff <= (new_index - 1):
-                    while position_correct is False:
-                        if mesh.active_shape_key_index != new_index:
-                            bpy.ops.object.shape_key_move(type='UP')
-                        else:
-                            position_correct = True
-                else:
-                    if mesh.active_shape_key_index > new_index:
-                        bpy.ops.object.shape_key_move(type='TOP')
+    key_blocks = mesh.data.shape_keys.key_blocks
+    current_order = [shapekey.name for shapekey in key_blocks]
+    target_order = get_shape_key_target_order(current_order, order)
 
-                    position_correct = False
-                    while position_correct is False:
-                        if mesh.active_shape_key_index != new_index:
-                            bpy.ops.object.shape_key_move(type='DOWN')
-                        else:
-                            position_correct = True
+    # Shape keys that are already in place at the top of the list don't have to be touched
+    first_unsorted = 0
+    while first_unsorted < len(current_order) and current_order[first_unsorted] == target_order[first_unsorted]:
+        first_unsorted += 1
+    to_move = target_order[first_unsorted:]
 
-                i += 1
-                break
+    wm = bpy.context.window_manager
+    wm.progress_begin(0, len(to_move))
 
-        current_step += 1
-        wm.progress_update(current_step)
+    # Moving every unsorted shape key to the bottom in target order sorts the list with one operator call per key
+    for current_step, name in enumerate(to_move):
+        index = current_order.index(name)
+        if index != len(current_order) - 1:
+            mesh.active_shape_key_index = index
+            bpy.ops.object.shape_key_move(type='BOTTOM')
+            current_order.append(current_order.pop(index))
+        wm.progress_update(current_step + 1)
 
     mesh.active_shape_key_index = 0
 
     wm.progress_end()
 
+    print('SORTED SHAPE KEYS OF', mesh_name, 'IN', round(time.time() - start_time, 3), 'SECONDS, MOVED', len(to_move), 'OF', len(current_order))
+
+
+def get_shape_key_target_order(current_order, order):
+    """Returns all shape key names in the order they should have after sorting.
+    Shape keys in 'order' come first, all others keep their relative order behind them."""
+    existing = set(current_order)
+    target_order = []
+
+    # Without a Basis the first shape key is the reference key and stays where it is
+    if 'Basis' not in existing:
+        target_order.append(current_order[0])
+
+    placed = set(target_order)
+    for name in order + current_order:
+        if name in existing and name not in placed:
+            target_order.append(name)
+            placed.add(name)
+
+    return target_order
+
 
 def isEmptyGroup(group_name):
     mesh = get_objects().get('Body')
@@ -1225,35 +1380,25 @@ def isEmptyGroup(group_name):
     if vgroup is None:
         return True
 
-    for vert in mesh.data.vertices:
-        for group in vert.groups:
-            if group.group == vgroup.index:
-                if group.weight > 0:
-                    return False
-
-    return True
+    return vgroup.index not in get_used_group_indices(mesh)
 
 
 def removeEmptyGroups(obj, thres=0):
-    z = []
-    for v in obj.data.vertices:
-        for g in v.groups:
-            if g.weight > thres:
-                if g not in z:
-                    z.append(obj.vertex_groups[g.group])
-    for r in obj.vertex_groups:
-        if r not in z:
+    used_groups = get_used_group_indices(obj, thres=thres)
+    for r in reversed(obj.vertex_groups[:]):
+        if r.index not in used_groups:
             obj.vertex_groups.remove(r)
 
 
 def removeZeroVerts(obj, thres=0):
-    for v in obj.data.vertices:
-        z = []
-        for g in v.groups:
-            if not g.weight > thres:
-                z.append(g)
-        for r in z:
-            obj.vertex_groups[g.group].remove([v.index])
+    vert_indices, group_indices, weights = get_weight_table(obj)
+
+    zero = weights <= thres
+    vert_indices, group_indices = vert_indices[zero], group_indices[zero]
+
+    # Remove the zero weights group by group instead of vertex by vertex
+    for group_index in np.unique(group_indices).tolist():
+        obj.vertex_groups[group_index].remove(vert_indices[group_indices == group_index].tolist())
 
 
 def delete_hierarchy(parent):
@@ -1281,6 +1426,7 @@ def delete(obj):
 
     objs = bpy.data.objects
     objs.remove(objs[obj.name], do_unlink=True)
+    invalidate_object_index()
 
 
 def days_between(d1, d2, time_format):
@@ -1326,10 +1472,8 @@ def delete_zero_weight(armature_name=None, ignore=''):
             if vertex_group.name not in vertex_group_name_to_objects_having_same_named_vertex_group:
                 vertex_group_name_to_objects_having_same_named_vertex_group[vertex_group.name] = set()
             vertex_group_name_to_objects_having_same_named_vertex_group[vertex_group.name].add(objects)
-        for vertex in objects.data.vertices:
-            for group in vertex.groups:
-                if group.weight > 0:
-                    vertex_group_names_used.add(vertex_group_id_to_vertex_group_name.get(group.group))
+        for group_index in get_used_group_indices(objects):
+            vertex_group_names_used.add(vertex_group_id_to_vertex_group_name.get(group_index))
 
     not_used_bone_names = bone_names_to_work_on - vertex_group_names_used
 
@@ -1537,12 +1681,7 @@ def remove_doubles(mesh, threshold, save_shapes=True):
 
     if save_shapes and has_shapekeys(mesh):
         switch('OBJECT')
-        for kb in mesh.data.shape_keys.key_blocks:
-            i = 0
-            for v0, v1 in zip(kb.relative_key.data, kb.data):
-                if v0.co != v1.co:
-                    mesh.data.vertices[i].select = True
-                i += 1
+        mesh.data.vertices.foreach_set('select', get_shape_key_deformed_mask(mesh))
         switch('EDIT')
         bpy.ops.mesh.select_all(action='INVERT')
     else:
@@ -1555,6 +1694,33 @@ def remove_doubles(mesh, threshold, save_shapes=True):
     return pre_tris - len(mesh.data.polygons)
 
 
+def get_shape_key_deformed_mask(mesh, epsilon=0):
+    """Returns a boolean array that is True for every vertex that is moved by any shape key relative to its reference.
+    Coordinates are read once per key block and reused for all shape keys that are relative to it."""
+    vert_count = len(mesh.data.vertices)
+    mask = np.zeros(vert_count, dtype=bool)
+    if not has_shapekeys(mesh):
+        return mask
+
+    coords_cache = {}
+
+    def get_coords(key_block):
+        coords = coords_cache.get(key_block.name)
+        if coords is None:
+            coords = np.empty(vert_count * 3, dtype=np.float32)
+            key_block.data.foreach_get('co', coords)
+            coords = coords_cache[key_block.name] = coords.reshape(-1, 3)
+        return coords
+
+    for kb in mesh.data.shape_keys.key_blocks:
+        if kb.relative_key == kb:
+            continue
+        diff = np.abs(get_coords(kb) - get_coords(kb.relative_key))
+        mask |= np.any(diff > epsilon, axis=1)
+
+    return mask
+
+
 def get_bone_orientations(armature):
     x_cord = 0
     y_cord = 1
@@ -1590,15 +1756,75 @@ def clean_material_names(mesh):
 
 
 def mix_weights(mesh, vg_from, vg_to, delete_old_vg=True):
-    mesh.active_shape_key_index = 0
-    mod = mesh.modifiers.new("VertexWeightMix", 'VERTEX_WEIGHT_MIX')
-    mod.vertex_group_a = vg_to
-    mod.vertex_group_b = vg_from
-    mod.mix_mode = 'ADD'
-    mod.mix_set = 'B'
-    bpy.ops.object.modifier_apply(modifier=mod.name)
-    if delete_old_vg:
-        mesh.vertex_groups.remove(mesh.vertex_groups.get(vg_from))
+    mix_weights_batch(mesh, [(vg_from, vg_to)], delete_old_vg=delete_old_vg)
+
+
+def mix_weights_batch(mesh, merges, delete_old_vg=True):
+    """Adds the weights of vertex groups to other vertex groups, all in one go.
+    'merges' is a list of (vg_from, vg_to) pairs. They are applied in order, just like calling mix_weights for each of them,
+    so chains like A -> B -> C end up with all weights in C. Missing target groups are created, missing source groups are skipped.
+    The result is only written back to the mesh once at the end."""
+    if not merges:
+        return
+
+    involved = set()
+    for vg_from, vg_to in merges:
+        involved.add(vg_from)
+        involved.add(vg_to)
+
+    # Split the weight table into the involved groups: name -> (vertex indices, weights)
+    vert_indices, group_indices, weights = get_weight_table(mesh)
+    order = np.argsort(group_indices, kind='mergesort')
+    vert_indices, group_indices, weights = vert_indices[order], group_indices[order], weights[order]
+
+    groups = {}
+    for vertex_group in mesh.vertex_groups:
+        if vertex_group.name in involved:
+            start, end = np.searchsorted(group_indices, [vertex_group.index, vertex_group.index + 1])
+            groups[vertex_group.name] = (vert_indices[start:end], weights[start:end])
+
+    changed = set()
+    removed = set()
+    for vg_from, vg_to in merges:
+        if vg_from == vg_to or vg_from not in groups:
+            continue
+
+        # Add the weights of both groups together, like the 'Add' mode of the Vertex Weight Mix modifier does
+        to_verts, to_weights = groups.get(vg_to, (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)))
+        from_verts, from_weights = groups[vg_from]
+        verts, inverse = np.unique(np.concatenate((to_verts, from_verts)), return_inverse=True)
+        summed = np.bincount(inverse, weights=np.concatenate((to_weights, from_weights)))
+        groups[vg_to] = (verts, np.clip(summed, 0, 1).astype(np.float32))
+        changed.add(vg_to)
+
+        if delete_old_vg:
+            del groups[vg_from]
+            changed.discard(vg_from)
+            removed.add(vg_from)
+
+    # Write everything back
+    for name in removed - changed:
+        vertex_group = mesh.vertex_groups.get(name)
+        if vertex_group:
+            mesh.vertex_groups.remove(vertex_group)
+
+    for name in changed:
+        vertex_group = mesh.vertex_groups.get(name)
+        if vertex_group is None:
+            vertex_group = mesh.vertex_groups.new(name=name)
+        elif name in removed:
+            # This group was merged away and got weights again later, so it starts empty
+            vertex_group.remove(list(range(len(mesh.data.vertices))))
+        set_vertex_group_weights(vertex_group, *groups[name])
+
+
+def set_vertex_group_weights(vertex_group, verts, weights):
+    # Vertex groups can only set many vertices at once if they share the same weight
+    order = np.argsort(weights, kind='mergesort')
+    verts, weights = verts[order], weights[order]
+    unique_weights, starts = np.unique(weights, return_index=True)
+    for weight, indices in zip(unique_weights.tolist(), np.split(verts, starts[1:])):
+        vertex_group.add(indices.tolist(), weight, 'REPLACE')
 
 
 def get_user_preferences():
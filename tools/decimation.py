@@ -213,6 +213,7 @@ class AutoDecimateButton(bpy.types.Operator):
                                     pass
 
                     bpy.ops.object.mode_set(mode='OBJECT')
+                    Common.invalidate_object_index()
 
                     Common.unselect_all()
 
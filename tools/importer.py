@@ -25,6 +25,9 @@
 
 import os
 import bpy
+import time
+import logging
+import traceback
 import webbrowser
 import bpy_extras.io_utils
 
@@ -52,7 +55,7 @@ class ImportAnyModel(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
         bl_description = 'Import a model of any supported type.' \
                          '\n' \
                          '\nSupported types:' \
-                         '\n- MMD: .pmx/.pmd' \
+                         '\n- MMD: .pmx/.pmd/.vmd' \
                          '\n- XNALara: .xps/.mesh/.ascii' \
                          '\n- Source: .smd/.qc/.vta' \
                          '\n- VRM: .vrm' \
@@ -61,7 +64,7 @@ class ImportAnyModel(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
         bl_description = 'Import a model of any supported type.' \
                          '\n' \
                          '\nSupported types:' \
-                         '\n- MMD: .pmx/.pmd' \
+                         '\n- MMD: .pmx/.pmd/.vmd' \
                          '\n- XNALara: .xps/.mesh/.ascii' \
                          '\n- Source: .smd/.qc/.vta/.dmx' \
                          '\n- VRM: .vrm' \
@@ -74,12 +77,12 @@ class ImportAnyModel(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
 
     if version_2_79_or_older():
         filter_glob = bpy.props.StringProperty(
-            default="*.pmx;*.pmd;*.xps;*.mesh;*.ascii;*.smd;*.qc;*.vta;*.fbx;*.vrm;",
+            default="*.pmx;*.pmd;*.vmd;*.xps;*.mesh;*.ascii;*.smd;*.qc;*.vta;*.fbx;*.vrm;",
             options={'HIDDEN'}
         )
     else:
         filter_glob = bpy.props.StringProperty(
-            default="*.pmx;*.pmd;*.xps;*.mesh;*.ascii;*.smd;*.qc;*.vta;*.dmx;*.fbx;*.dae;*.vrm",
+            default="*.pmx;*.pmd;*.vmd;*.xps;*.mesh;*.ascii;*.smd;*.qc;*.vta;*.dmx;*.fbx;*.dae;*.vrm",
             options={'HIDDEN'}
         )
     text1 = bpy.props.BoolProperty(
@@ -87,6 +90,19 @@ class ImportAnyModel(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
         description='If you want to modify the import settings, use the button next to the Import button.\n\n',
         default=False
     )
+    batch_import = bpy.props.BoolProperty(
+        name='Batch Import MMD',
+        description='Parse the selected MMD files (.pmx/.pmd/.vmd) at the same time in background processes before importing them.'
+                    '\nMotions (.vmd) are applied to the models imported with them',
+        default=False
+    )
+    batch_processes = bpy.props.IntProperty(
+        name='Processes',
+        description='Number of background processes used to parse the MMD files.'
+                    '\n0 uses one process per CPU core',
+        default=0,
+        min=0
+    )
 
     def execute(self, context):
         # print(self.directory)
@@ -99,12 +115,22 @@ class ImportAnyModel(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
         # Save all current objects to check which armatures got added by the importer
         pre_import_objects = [obj for obj in bpy.data.objects if obj.type == 'ARMATURE']
 
+        # Parse the MMD files in parallel and import them
+        batch_files = []
+        if self.batch_import and mmd_tools_installed:
+            batch_files = [f['name'] for f in self.files if f['name'].split('.')[-1].lower() in ['pmx', 'pmd', 'vmd']]
+            if batch_files:
+                self.import_mmd_batch(context, [os.path.join(self.directory, file_name) for file_name in batch_files])
+
         # Import the file using their corresponding importer
         for f in self.files:
             file_name = f['name']
             file_path = os.path.join(self.directory, file_name)
             file_ending = file_name.split('.')[-1].lower()
 
+            if file_name in batch_files:
+                continue
+
             # MMD
             if file_ending == 'pmx' or file_ending == 'pmd':
                 try:
@@ -119,6 +145,17 @@ class ImportAnyModel(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
                 except (TypeError, ValueError):
                     bpy.ops.mmd_tools.import_model('INVOKE_DEFAULT')
 
+            # MMD motion, applied to the selected model
+            elif file_ending == 'vmd':
+                try:
+                    bpy.ops.mmd_tools.import_vmd('EXEC_DEFAULT',
+                                                 filepath=file_path,
+                                                 scale=0.08)
+                except AttributeError:
+                    bpy.ops.cats_importer.enable_mmd('INVOKE_DEFAULT')
+                except RuntimeError as e:
+                    print(str(e))
+
             # XNALara
             elif file_ending == 'xps' or file_ending == 'mesh' or file_ending == 'ascii':
                 try:
@@ -182,6 +219,110 @@ class ImportAnyModel(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
 
         return {'FINISHED'}
 
+    def import_mmd_batch(self, context, file_paths):
+        import mmd_batch_parser
+        from mmd_tools_local import auto_scene_setup
+        from mmd_tools_local.utils import makePmxBoneMap
+        from mmd_tools_local.core.pmx.importer import PMXImporter
+        from mmd_tools_local.core.pmd.importer import PMDImporter
+        from mmd_tools_local.core.vmd.importer import VMDImporter
+
+        start_time = time.time()
+        file_count = len(file_paths)
+        wm = context.window_manager
+        wm.progress_begin(0, file_count * 2)
+
+        # Parse the files in background processes, in the order they finish
+        parsed = {}
+        results = mmd_batch_parser.parse_files(file_paths,
+                                               processes=self.batch_processes or None,
+                                               executable=getattr(bpy.app, 'binary_path_python', None))
+        for file_path, data, parse_time, error in results:
+            parsed[file_path] = (data, parse_time, error)
+            wm.progress_update(len(parsed))
+            print('Parsed', str(len(parsed)) + '/' + str(file_count), os.path.basename(file_path), '(%.2fs)' % parse_time)
+        parse_duration = time.time() - start_time
+
+        # Import the models first, so the motions can be applied to them
+        models = [file_path for file_path in file_paths if not file_path.lower().endswith('.vmd')]
+        motions = [file_path for file_path in file_paths if file_path.lower().endswith('.vmd')]
+        pre_import_roots = [obj for obj in bpy.data.objects if obj.mmd_type == 'ROOT']
+        motion_targets = None
+
+        timings = []
+        logger = logging.getLogger()
+        log_level = logger.level
+        logger.setLevel('WARNING')
+        try:
+            for file_path in models + motions:
+                data, parse_time, error = parsed[file_path]
+                import_time = 0
+                if not error:
+                    import_start = time.time()
+                    try:
+                        if file_path in motions:
+                            if motion_targets is None:
+                                roots = [obj for obj in bpy.data.objects if obj.mmd_type == 'ROOT' and obj not in pre_import_roots]
+                                motion_targets = self.get_motion_targets(context, roots)
+                            importer = VMDImporter(filepath=file_path,
+                                                   scale=0.08,
+                                                   bone_mapper=makePmxBoneMap,
+                                                   vmd_file=data)
+                            for obj in motion_targets:
+                                importer.assign(obj)
+                        else:
+                            args = dict(filepath=file_path,
+                                        types={'MESH', 'ARMATURE', 'MORPHS'},
+                                        scale=0.08,
+                                        clean_model=True,
+                                        rename_LR_bones=True)
+                            if file_path.lower().endswith('.pmd'):
+                                PMDImporter().execute(pmd=data, **args)
+                            else:
+                                PMXImporter().execute(pmx=data, **args)
+                    except Exception:
+                        error = traceback.format_exc()
+                    import_time = time.time() - import_start
+                timings.append((file_path, parse_time, import_time, error))
+                wm.progress_update(file_count + len(timings))
+        finally:
+            logger.setLevel(log_level)
+            wm.progress_end()
+
+        if motions and motion_targets:
+            auto_scene_setup.setupFrameRanges()
+            auto_scene_setup.setupFps()
+
+        # Timing summary
+        failed = [timing for timing in timings if timing[3]]
+        print('\nBatch import of', file_count, 'MMD files in', '%.2fs' % (time.time() - start_time), '(parsing: %.2fs)' % parse_duration)
+        print('%8s %8s  %s' % ('parse', 'import', 'file'))
+        for file_path, parse_time, import_time, error in timings:
+            print('%7.2fs %7.2fs  %s' % (parse_time, import_time, os.path.basename(file_path)), 'FAILED' if error else '')
+        for file_path, parse_time, import_time, error in failed:
+            print('\nFailed to import', file_path)
+            print(error)
+            self.report({'WARNING'}, 'Failed to import "' + os.path.basename(file_path) + '"')
+        if motions and not motion_targets:
+            self.report({'WARNING'}, 'No model found to apply the motions to. Import or select a model first.')
+
+        self.report({'INFO'}, 'Imported ' + str(file_count - len(failed)) + '/' + str(file_count) + ' MMD files in %.2fs.' % (time.time() - start_time))
+
+    @staticmethod
+    def get_motion_targets(context, roots):
+        from mmd_tools_local.core.model import Model
+
+        # Apply the motions to the imported models, or to the selected objects if there are none
+        targets = set(roots) if roots else set(context.selected_objects)
+        for obj in list(targets):
+            if Model.findRoot(obj) == obj:
+                rig = Model(obj)
+                targets.add(rig.armature())
+                targets.add(rig.morph_slider.placeholder())
+                targets |= set(rig.meshes())
+        targets.discard(None)
+        return list(targets)
+
     def fix_bone_orientations(self, armature):
         Common.set_active(armature)
         Common.switch('EDIT')
@@ -25,19 +25,51 @@
 
 import bpy
 import typing
+import functools
 
 __bl_classes = []
 __bl_ordered_classes = []
 __make_annotations = (not bpy.app.version < (2, 79, 9))
 
+# Count running and finished operators so that caches know when the scene might have been changed by Cats
+__running_operators = 0
+__finished_operators = 0
+
 
 def register_wrap(cls):
     if hasattr(cls, 'bl_rna'):
         __bl_classes.append(cls)
+        if issubclass(cls, bpy.types.Operator) and 'execute' in cls.__dict__:
+            cls.execute = track_execution(cls.execute)
     cls = make_annotations(cls)
     return cls
 
 
+def track_execution(execute):
+    # The wrapper needs the exact (self, context) signature, otherwise Blender refuses to register the operator
+    @functools.wraps(execute)
+    def execute_tracked(self, context):
+        global __running_operators, __finished_operators
+        __running_operators += 1
+        try:
+            return execute(self, context)
+        finally:
+            __running_operators -= 1
+            __finished_operators += 1
+            # The operator might have added, deleted, renamed or reparented objects
+            from .common import invalidate_object_index
+            invalidate_object_index()
+    return execute_tracked
+
+
+def is_operator_running():
+    return __running_operators > 0
+
+
+def get_finished_operator_count():
+    return __finished_operators
+
+
 def make_annotations(cls):
     if __make_annotations:
         bl_props = {k: v for k, v in cls.__dict__.items() if isinstance(v, tuple)}
@@ -26,7 +26,6 @@
 import re
 import os
 import bpy
-import copy
 import json
 import pathlib
 import collections
@@ -38,16 +37,21 @@ from collections import OrderedDict
 from . import common as Common
 from .register import register_wrap
 from .. import globs
-from ..googletrans import Translator
+from ..googletrans import BatchTranslator
 from mmd_tools_local import translations
 
 dictionary = None
 dictionary_google = None
+dictionary_matcher = None
 
 main_dir = pathlib.Path(os.path.dirname(__file__)).parent.resolve()
 resources_dir = os.path.join(str(main_dir), "resources")
 dictionary_file = os.path.join(resources_dir, "dictionary.json")
 dictionary_google_file = os.path.join(resources_dir, "dictionary_google.json")
+dictionary_google_log_file = os.path.join(resources_dir, "dictionary_google.log")
+
+# New Google translations are appended to the log file, which gets merged into the json file once it has this many entries
+dictionary_google_log_limit = 1000
 
 
 @register_wrap
@@ -218,7 +222,7 @@ class TranslateTexturesButton(bpy.types.Operator):
         self.report({'INFO'}, 'Translated all textures')
         return {'FINISHED'}
 
-        translator = Translator()
+        translator = BatchTranslator()
 
         to_translate = []
         for ob in Common.get_objects():
@@ -229,15 +233,17 @@ class TranslateTexturesButton(bpy.types.Operator):
                             print(texslot.name)
                             to_translate.append(texslot.name)
 
-        translated = []
+        # The batches arrive in the order they finish, so match the translations by their origin
+        translated_names = {}
         try:
-            translations = translator.translate(to_translate)
-        except SSLError:
+            for batch in translator.translate_batches(to_translate):
+                for translation in batch:
+                    translated_names[translation.origin] = translation.text
+        except requests.exceptions.ConnectionError:
             self.report({'ERROR'}, 'Could not connect to Google. Please check your internet connection.')
             return {'FINISHED'}
 
-        for translation in translations:
-            translated.append(translation.text)
+        translated = [translated_names[name] for name in to_translate]
 
         i = 0
         for ob in Common.get_objects():
@@ -302,9 +308,94 @@ class TranslateAllButton(bpy.types.Operator):
         return {'FINISHED'}
 
 
-# Loads the dictionaries at the start of blender
+class DictionaryMatcher:
+    """Character trie over the dictionary keys.
+
+    Finds every dictionary key in a name in a single pass over it and replaces the longest keys first,
+    so the result is the same as replacing the keys of the length sorted dictionary one after another.
+    Keys with an empty translation are not added, so shorter keys inside them still match.
+    """
+    _END = ''  # Keys in the trie are single characters, so an empty string can never collide
+
+    def __init__(self, entries=None):
+        self.root = {}
+        self.key_count = 0
+        if entries:
+            self.update(entries)
+
+    def add(self, key, value):
+        if not key or not value:
+            return
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+
+        # Keys keep the rank they were added with, like keys which are updated in an OrderedDict
+        if self._END in node:
+            node[self._END] = (value, node[self._END][1])
+        else:
+            node[self._END] = (value, self.key_count)
+            self.key_count += 1
+
+    def update(self, entries):
+        for key, value in entries.items():
+            self.add(key, value)
+
+    def translate(self, name, addition=''):
+        """Returns the translated name and the amount of characters that were covered by dictionary keys"""
+        length = len(name)
+
+        # Find every key in the name, the trie gives all keys starting at a position in one walk
+        matches = []
+        for start in range(length):
+            node = self.root
+            for end in range(start, length):
+                node = node.get(name[end])
+                if node is None:
+                    break
+                entry = node.get(self._END)
+                if entry is not None:
+                    matches.append((start, end + 1) + entry)
+
+        # Replace the longest keys first, keys with the same length in the order they were added and
+        # then from left to right, skipping keys that overlap already replaced ones.
+        # This gives the same result as replacing the keys of the length sorted dictionary one after another
+        matches.sort(key=lambda match: (match[0] - match[1], match[3], match[0]))
+        covered_chars = [False] * length
+        replacements = []
+        for start, end, value, rank in matches:
+            if any(covered_chars[start:end]):
+                continue
+            covered_chars[start:end] = [True] * (end - start)
+            replacements.append((start, end, value))
+
+        result = []
+        position = 0
+        for start, end, value in sorted(replacements):
+            result.append(name[position:start])
+            result.append(addition + value)
+            position = end
+        result.append(name[position:])
+
+        return ''.join(result), sum(covered_chars)
+
+
+# Prepares the dictionaries at the start of blender. They are only loaded once they are actually needed
 def load_translations():
-    global dictionary
+    global dictionary, dictionary_google, dictionary_matcher
+    dictionary = None
+    dictionary_google = None
+    dictionary_matcher = None
+    return os.path.isfile(dictionary_file)
+
+
+def ensure_translations_loaded():
+    if dictionary_matcher is None:
+        globs.dict_found = load_dictionaries()
+
+
+def load_dictionaries():
+    global dictionary, dictionary_matcher
     dictionary = OrderedDict()
     temp_dict = OrderedDict()
     dict_found = False
@@ -334,6 +425,7 @@ def load_translations():
                     or google_dict_too_old():
                 reset_google_dict()
             else:
+                load_google_log()
                 for name, trans in dictionary_google.get('translations').items():
                     if not name:
                         continue
@@ -358,6 +450,9 @@ def load_translations():
     for key in sorted(temp_dict, key=lambda k: len(k), reverse=True):
         dictionary[key] = temp_dict[key]
 
+    # Compile the dictionary into a matcher so that every name only has to be scanned once
+    dictionary_matcher = DictionaryMatcher(dictionary)
+
     # for key, value in dictionary.items():
     #     print('"' + key + '" - "' + value + '"')
 
@@ -365,7 +460,7 @@ def load_translations():
 
 
 def update_dictionary(to_translate_list, translating_shapes=False, self=None):
-    global dictionary, dictionary_google
+    ensure_translations_loaded()
     regex = u'[\u3000-\u303f\u3040-\u309f\u30a0-\u30ff\uff00-\uff9f\u4e00-\u9faf\u3400-\u4dbf]+'  # Regex to look for japanese chars
 
     use_google_only = False
@@ -391,27 +486,12 @@ def update_dictionary(to_translate_list, translating_shapes=False, self=None):
             if not re.findall(regex, to_translate):
                 continue
 
-            translated = False
-            for key, value in dictionary_google.get('translations_full').items():
-                if to_translate == key and value:
-                    translated = True
-
-            if not translated:
+            if not dictionary_google['translations_full'].get(to_translate):
                 google_input.append(to_translate)
 
         # Translate with internal dictionary
         else:
-            for key, value in dictionary.items():
-                if key in to_translate:
-                    if value:
-                        to_translate = to_translate.replace(key, value)
-                    else:
-                        continue
-
-                    # Check if string is fully translated
-                    translated_count += len(key)
-                    if translated_count >= length:
-                        break
+            to_translate, translated_count = dictionary_matcher.translate(to_translate)
 
             # If not fully translated, translate the rest with Google
             if translated_count < length:
@@ -426,10 +506,17 @@ def update_dictionary(to_translate_list, translating_shapes=False, self=None):
         return
 
     # Translate the list with google translate
+    # The batches are added to the dictionaries as soon as they arrive, so that they are kept even if a later batch fails
     print('GOOGLE DICT UPDATE!')
-    translator = Translator()
+    translator = BatchTranslator()
+    wm = bpy.context.window_manager
+    current_step = 0
+    wm.progress_begin(current_step, len(google_input))
     try:
-        translations = translator.translate(google_input)
+        for batch in translator.translate_batches(google_input):
+            add_google_translations(batch, use_google_only)
+            current_step += len(batch)
+            wm.progress_update(current_step)
     except requests.exceptions.ConnectionError:
         print('CONNECTION TO GOOGLE FAILED!')
         if self:
@@ -471,39 +558,37 @@ def update_dictionary(to_translate_list, translating_shapes=False, self=None):
                         '\nFor updates and dicussions please join our Discord. The link can be found in the Credits panel down below.')
         print('GOOGLE API CHANGED')
         return
+    finally:
+        wm.progress_end()
+
+    print('DICTIONARY UPDATE SUCCEEDED!')
+
 
-    # Update the dictionaries
-    for i, translation in enumerate(translations):
-        name = google_input[i]
+def add_google_translations(translations, use_google_only):
+    new_entries = []
+    for translation in translations:
+        name = translation.origin
 
         if use_google_only:
             dictionary_google['translations_full'][name] = translation.text
+            new_entries.append(['translations_full', name, translation.text])
         else:
             translated_name = translation.text.capitalize()
             dictionary[name] = translated_name
             dictionary_google['translations'][name] = translated_name
+            dictionary_matcher.add(name, translated_name)
+            new_entries.append(['translations', name, translated_name])
 
-        print(google_input[i], translation.text.capitalize())
+        print(name, translation.text.capitalize())
 
-    # Sort dictionary
-    temp_dict = copy.deepcopy(dictionary)
-    dictionary = OrderedDict()
-    for key in sorted(temp_dict, key=lambda k: len(k), reverse=True):
-        dictionary[key] = temp_dict[key]
-
-    # Save the google dict locally
-    save_google_dict()
-
-    print('DICTIONARY UPDATE SUCCEEDED!')
-    return
+    # Save the new google translations locally
+    append_google_dict(new_entries)
 
 
 def translate(to_translate, add_space=False, translating_shapes=False):
-    global dictionary
+    ensure_translations_loaded()
 
     pre_translation = to_translate
-    length = len(to_translate)
-    translated_count = 0
 
     # Figure out whether to use google only or not
     use_google_only = False
@@ -520,24 +605,13 @@ def translate(to_translate, add_space=False, translating_shapes=False):
 
     # Translate shape keys with Google Translator only, if the user chose this
     if use_google_only:
-        for key, value in dictionary_google.get('translations_full').items():
-            if to_translate == key and value:
-                to_translate = value
+        value = dictionary_google['translations_full'].get(to_translate)
+        if value:
+            to_translate = value
 
     # Translate with internal dictionary
     else:
-        for key, value in dictionary.items():
-            if key in to_translate:
-                # If string is empty, don't replace it. This will be done at the end
-                if not value:
-                    continue
-
-                to_translate = to_translate.replace(key, addition + value)
-
-                # Check if string is fully translated
-                translated_count += len(key)
-                if translated_count >= length:
-                    break
+        to_translate = dictionary_matcher.translate(to_translate, addition=addition)[0]
 
     to_translate = to_translate.replace('.L', '_L').replace('.R', '_R').replace('  ', ' ').replace('し', '').replace('っ', '').strip()
 
@@ -589,6 +663,41 @@ def save_google_dict():
     with open(dictionary_google_file, 'w', encoding="utf8") as outfile:
         json.dump(dictionary_google, outfile, ensure_ascii=False, indent=4)
 
+    # Everything from the log is in the json file now
+    if os.path.isfile(dictionary_google_log_file):
+        os.remove(dictionary_google_log_file)
+
+
+def append_google_dict(entries):
+    # Only appends the new translations instead of rewriting the whole google dict
+    if not entries:
+        return
+    with open(dictionary_google_log_file, 'a', encoding="utf8") as outfile:
+        for entry in entries:
+            outfile.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def load_google_log():
+    # Adds the translations from the log to the google dict
+    count = 0
+    try:
+        with open(dictionary_google_log_file, encoding="utf8") as file:
+            for line in file:
+                try:
+                    section, name, translation = json.loads(line)
+                except (json.decoder.JSONDecodeError, ValueError):
+                    # Can happen if Blender was closed while writing, the translation will simply be requested again
+                    continue
+                if section in ['translations', 'translations_full']:
+                    dictionary_google[section][name] = translation
+                    count += 1
+    except FileNotFoundError:
+        return
+
+    # Merge the log into the json file when it gets too long
+    if count >= dictionary_google_log_limit:
+        save_google_dict()
+
 # def cvs_to_json():
 #     temp_dict = OrderedDict()
 #